@@ -0,0 +1,159 @@
+"""
+Local mirror of the chaincode's fabricID -> ethAddress address mappings.
+
+Refund in tokenERC20.js rejects a bridge-back whose `eth_address` does not
+match `getAddressMapping(to)`; the mirror lets the bridge make the same check
+locally before anything is sent to the gateway, and knows which shard
+(channel/contract) the mapping is on, so a refund goes straight there.
+"""
+
+import os
+import time
+
+
+# objectType of the chaincode's address mapping keys (tokenERC20.js)
+ADDRESS_PREFIX = "address"
+# seconds an entry is trusted without a ledger update, when there is a loader
+ADDRESS_MIRROR_TTL = float(os.getenv("ADDRESS_MIRROR_TTL", 300))
+
+
+class AddressMappingMirror:
+    """Hash index of address mappings with per-shard ledger versions.
+
+    Entries come from the bridge's own committed `appendAddressMapping`
+    transactions, from ledger block write sets, and (read-through) from the
+    optional async `loader`, which finds a mapping on the ledger on a miss
+    and returns its (shard, eth_address). A shard is whatever identifies a
+    ledger (a fabric_routing.FabricShard, or None for a single one); each
+    entry carries the block number of its shard's channel it was observed
+    at, so a late or replayed update never overwrites a newer one. Block
+    numbers of different shards are never compared.
+
+    A client mapped on several shards (onboarded before and after the shard
+    list changed) resolves to the first of them in `order(fabric_id)`, the
+    order the ledger is queried in. With a loader, an entry not updated for
+    `ttl` seconds is read from the ledger again, as is one a refund would be
+    rejected on, so a stale entry never rejects a refund.
+    """
+
+    def __init__(self, loader=None, ttl: float = ADDRESS_MIRROR_TTL, order=None):
+        # fabric_id -> shard -> (eth_address, version, updated)
+        self.addresses = {}
+        self.watermarks = {}  # shard -> highest block number applied
+        self.loader = loader
+        self.ttl = ttl
+        self.order = order
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def apply(
+        self, fabric_id: str, eth_address: str, version: int, shard=None
+    ) -> bool:
+        """Apply a mapping seen at `version` of `shard`; stale updates are ignored."""
+        entries = self.addresses.setdefault(fabric_id, {})
+        current = entries.get(shard)
+        if current and current[1] > version:
+            return False
+        entries[shard] = (eth_address, version, time.monotonic())
+        if version > self.watermarks.get(shard, 0):
+            self.watermarks[shard] = version
+        return True
+
+    def record_commit(self, fabric_id: str, eth_address: str, shard=None):
+        """Record a mapping the bridge itself just committed on `shard`."""
+        self.apply(fabric_id, eth_address, self.watermarks.get(shard, 0), shard)
+
+    def apply_block(self, block_number: int, writes: dict, shard=None):
+        """Apply the address keys in a block's (or transaction's) write set."""
+        prefix = "\x00" + ADDRESS_PREFIX + "\x00"
+        for (key, value) in writes.items():
+            if key.startswith(prefix):
+                fabric_id = key[len(prefix) : -1]
+                if value:
+                    self.apply(fabric_id, value, block_number, shard)
+                else:
+                    # deleted on the ledger
+                    self.invalidate(fabric_id, shard)
+        if block_number > self.watermarks.get(shard, 0):
+            self.watermarks[shard] = block_number
+
+    def _entry(self, fabric_id: str):
+        """(shard, eth_address) of the fresh entry to use, or None."""
+        entries = self.addresses.get(fabric_id)
+        if not entries:
+            return None
+        shards = (
+            [s for s in self.order(fabric_id) if s in entries]
+            if self.order
+            else list(entries)
+        )
+        if not shards:
+            return None
+        (eth_address, _, updated) = entries[shards[0]]
+        if self.loader and time.monotonic() - updated >= self.ttl:
+            return None
+        return (shards[0], eth_address)
+
+    def get(self, fabric_id: str):
+        entry = self._entry(fabric_id)
+        return entry[1] if entry else None
+
+    def shard_of(self, fabric_id: str):
+        """Shard of the fresh entry for `fabric_id`, None if there is none."""
+        entry = self._entry(fabric_id)
+        return entry[0] if entry else None
+
+    def invalidate(self, fabric_id: str, shard=...):
+        """Forget `fabric_id`'s entry on `shard` (default: on every shard)."""
+        if shard is ...:
+            self.addresses.pop(fabric_id, None)
+            return
+        entries = self.addresses.get(fabric_id)
+        if entries:
+            entries.pop(shard, None)
+            if not entries:
+                del self.addresses[fabric_id]
+
+    async def locate(self, fabric_id: str):
+        """(shard, eth_address), reading through to the ledger on a miss;
+        (None, None) if the mapping is not found."""
+        entry = self._entry(fabric_id)
+        if entry:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        if not self.loader:
+            return (None, None)
+        (shard, eth_address) = await self.loader(fabric_id)
+        # the ledger's current value, newer than any entry seen so far
+        self.invalidate(fabric_id)
+        if eth_address:
+            self.apply(fabric_id, eth_address, self.watermarks.get(shard, 0), shard)
+        return (shard, eth_address)
+
+    async def lookup(self, fabric_id: str):
+        """Return the mapped address, reading through to the ledger on a miss."""
+        return (await self.locate(fabric_id))[1]
+
+    async def validate_refund(self, to: str, eth_address: str):
+        """Return why Refund(to, value, eth_address) would fail, or None."""
+        cached = self._entry(to) is not None
+        mapped = await self.lookup(to)
+        if mapped != eth_address and self.loader and cached:
+            # don't reject on a cached entry, the mapping may have changed
+            self.invalidate(to)
+            mapped = await self.lookup(to)
+        if mapped is None:
+            if not self.loader:
+                # can't tell locally, leave it to the chaincode
+                return None
+            return f"the account {to} does not exist"
+        if mapped != eth_address:
+            return (
+                "client is not authorized to bridge back tokens "
+                "to another client account"
+            )
+        return None
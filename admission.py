@@ -0,0 +1,146 @@
+"""
+Admission control for the bridge's proof workflows.
+
+New workflows are admitted through a token bucket: a client either gets a
+token now, waits for one (up to `max_wait`), or is rejected. Work already
+admitted competes for a bounded number of in-flight slots through a
+`PrioritySemaphore`, where lower lane numbers (later workflow stages) are
+served first, so a burst of new clients can't starve workflows that are
+nearly done.
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+
+from runners.metrics import ADMISSIONS, IN_FLIGHT, QUEUE_DEPTH
+
+
+class TokenBucket:
+    """Tokens refill at `rate` per second up to `burst`; rate 0 is unlimited."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def reserve(self, max_wait: float):
+        """Take a token, returning how long to wait for it, or None if too long."""
+        if not self.rate:
+            return 0.0
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        wait = (1 - self.tokens) / self.rate if self.tokens < 1 else 0.0
+        if wait > max_wait:
+            return None
+        # tokens may go negative: later callers queue behind this reservation
+        self.tokens -= 1
+        return wait
+
+
+class PrioritySemaphore:
+    """A semaphore whose waiters are served by lane (lowest first), then FIFO."""
+
+    def __init__(self, name: str, capacity: int, lanes: dict):
+        self.name = name
+        self.capacity = capacity
+        self.lanes = lanes  # lane name -> priority
+        self.in_use = 0
+        self._waiters = []  # heap of (priority, seq, lane, future)
+        self._seq = itertools.count()
+        self.waiting = dict.fromkeys(lanes, 0)
+        IN_FLIGHT.set_function(lambda: self.in_use, name)
+        for lane in lanes:
+            QUEUE_DEPTH.set_function(
+                lambda lane=lane: self.waiting[lane], f"{name}:{lane}"
+            )
+
+    async def acquire(self, lane: str):
+        if self.in_use < self.capacity and not self._waiters:
+            self.in_use += 1
+            return
+        future = asyncio.get_event_loop().create_future()
+        heapq.heappush(
+            self._waiters, (self.lanes[lane], next(self._seq), lane, future)
+        )
+        self.waiting[lane] += 1
+        try:
+            # release() hands the slot over directly
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        finally:
+            self.waiting[lane] -= 1
+
+    def release(self):
+        while self._waiters:
+            (_, _, _, future) = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.in_use -= 1
+
+    def slot(self, lane: str):
+        return _Slot(self, lane)
+
+
+class _Slot:
+    __slots__ = ("semaphore", "lane")
+
+    def __init__(self, semaphore: PrioritySemaphore, lane: str):
+        self.semaphore = semaphore
+        self.lane = lane
+
+    async def __aenter__(self):
+        await self.semaphore.acquire(self.lane)
+
+    async def __aexit__(self, *exc):
+        self.semaphore.release()
+
+
+class AdmissionController:
+    """Token-bucket admission of new workflows plus an in-flight cap.
+
+    `verifications` caps concurrent verify-presentation calls, with lanes
+    (by default "bridge" (last proof) ahead of "cbdc" ahead of "identity",
+    new workflows).
+    """
+
+    VERIFICATION_LANES = {"bridge": 0, "cbdc": 1, "identity": 2}
+
+    def __init__(
+        self,
+        rate: float = 0.0,
+        burst: int = 10,
+        max_wait: float = 5.0,
+        max_verifications: int = 8,
+        lanes: dict = None,
+    ):
+        self.bucket = TokenBucket(rate, burst)
+        self.max_wait = max_wait
+        self.verifications = PrioritySemaphore(
+            "verifications", max_verifications, lanes or self.VERIFICATION_LANES
+        )
+        self.queued = 0
+        QUEUE_DEPTH.set_function(lambda: self.queued, "admission")
+
+    async def admit(self) -> bool:
+        """Admit a new workflow, waiting for a token if that is quick enough."""
+        wait = self.bucket.reserve(self.max_wait)
+        if wait is None:
+            ADMISSIONS.inc("rejected")
+            return False
+        if wait:
+            ADMISSIONS.inc("queued")
+            self.queued += 1
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self.queued -= 1
+        ADMISSIONS.inc("admitted")
+        return True
@@ -6,33 +6,59 @@ import os
 import random
 import sys
 import time
-import yaml
 
-from qrcode import QRCode
-
-from aiohttp import ClientError
+from aiohttp import ClientError, web
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from runners.support.agent import (  # noqa:E402
-    DemoAgent,
-    default_genesis_txns,
-    start_mediator_agent,
-    connect_wallet_to_mediator,
-    start_endorser_agent,
-    connect_wallet_to_endorser,
-    CRED_FORMAT_INDY,
-    CRED_FORMAT_JSON_LD,
-    DID_METHOD_KEY,
-    KEY_TYPE_BLS,
+from runners.startup_profile import STARTUP_PROFILE  # noqa:E402
+from runners.metrics import (  # noqa:E402
+    ADMIN_ERRORS,
+    ADMIN_REQUESTS,
+    EXCHANGES,
+    PROOF_VERIFICATION,
+    QUEUE_DEPTH,
+    WEBHOOKS,
+    route_of,
+    start_metrics_server,
+)
+from runners.exchanges import (  # noqa:E402
+    FINAL_STATES,
+    ExchangeWaiter,
+    run_exchanges,
 )
-from runners.support.utils import (  # noqa:E402
-    check_requires,
+from runners.endorsement import TransactionBatcher  # noqa:E402
+from runners.jsoncodec import CODEC, DecodeError, lazy_json  # noqa:E402
+from runners.logbuffer import (  # noqa:E402
+    INFO,
+    LOG,
+    format_msg,
     log_json,
     log_msg,
     log_status,
-    log_timer,
+    parse_levels,
 )
+from runners.records import CredentialRecord, PresentationRecord  # noqa:E402
+from runners.revocation import NON_REVOKED_POLICY, RevocationStateCache  # noqa:E402
+from runners.tracing import CURRENT_SPAN, NOOP_SPAN, TRACER  # noqa:E402
+
+with STARTUP_PROFILE.phase("import runners.support"):
+    from runners.support.agent import (  # noqa:E402
+        DemoAgent,
+        default_genesis_txns,
+        start_mediator_agent,
+        connect_wallet_to_mediator,
+        start_endorser_agent,
+        connect_wallet_to_endorser,
+        CRED_FORMAT_INDY,
+        CRED_FORMAT_JSON_LD,
+        DID_METHOD_KEY,
+        KEY_TYPE_BLS,
+    )
+    from runners.support.utils import (  # noqa:E402
+        check_requires,
+        log_timer,
+    )
 
 
 CRED_PREVIEW_TYPE = "https://didcomm.org/issue-credential/2.0/credential-preview"
@@ -40,6 +66,16 @@ SELF_ATTESTED = os.getenv("SELF_ATTESTED")
 TAILS_FILE_COUNT = int(os.getenv("TAILS_FILE_COUNT", 100))
 
 logging.basicConfig(level=logging.WARNING)
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", 30.0))
+# states after which no more webhooks arrive for an exchange or connection
+CLOSED_STATES = FINAL_STATES + (
+    "credential_acked",
+    "presentation_acked",
+    "verified",
+    "declined",
+    "error",
+)
+
 LOGGER = logging.getLogger(__name__)
 
 
@@ -79,10 +115,39 @@ class AriesAgent(DemoAgent):
         )
         self.connection_id = None
         self._connection_ready = None
+        # invitation pool: pool key -> invitation record, and the state of
+        # every connection accepted through one of the pooled invitations
+        self.pool_invitations = {}
+        self.pooled_connections = {}
+        # async callable(connection_id), run once per completed pooled connection
+        self.connection_workflow = None
+        self._workflow_tasks = set()
+        # callable(topic, payload), called for every webhook before dispatch
+        self.webhook_listeners = []
+        # in-flight work waited for by drain(): webhook handler tasks, and
+        # credential/presentation exchanges not yet in a final state
+        self.draining = False
+        self._handler_tasks = set()
+        self.open_exchanges = {}  # exchange id -> connection id
+        self._activity = asyncio.Event()
+        QUEUE_DEPTH.set_function(
+            lambda: len(self._workflow_tasks), "connection_workflows"
+        )
+        # batched endorsement of our ledger writes, when we are an author
+        self.transactions = (
+            TransactionBatcher(self) if endorser_role == "author" else None
+        )
+        # holder: timestamps non-revocation was proven at, by registry and window
+        self.revocation_states = RevocationStateCache()
         self.cred_state = {}
         # define a dict to hold credential attributes
         self.last_credential_received = None
         self.last_proof_received = None
+        # outcomes by exchange id: credentials stored (holder), presentations
+        # verified (verifier), and the final webhook of any exchange
+        self.credentials = ExchangeWaiter()
+        self.presentations = ExchangeWaiter()
+        self.exchanges = ExchangeWaiter()
 
     async def detect_connection(self):
         await self._connection_ready
@@ -92,6 +157,187 @@ class AriesAgent(DemoAgent):
     def connection_ready(self):
         return self._connection_ready.done() and self._connection_ready.result()
 
+    def log(self, *msg, **kwargs):
+        LOG.emit(
+            "agent",
+            INFO,
+            format_msg,
+            *msg,
+            color=self.color or "fg:ansiblue",
+            prefix=f"{self.prefix:10s} |",
+            **kwargs,
+        )
+
+    async def admin_request(
+        self, method, path, data=None, text=False, params=None, headers=None
+    ):
+        """Admin API call with bodies encoded and decoded by the JSON codec."""
+        route = route_of(path)
+        start = time.perf_counter()
+        try:
+            with TRACER.span(f"admin {method} {route}"):
+                params = {k: v for (k, v) in (params or {}).items() if v is not None}
+                if data is not None:
+                    headers = {**(headers or {}), "Content-Type": "application/json"}
+                    data = CODEC.dumpb(data)
+                async with self.client_session.request(
+                    method,
+                    self.admin_url + path,
+                    data=data,
+                    params=params,
+                    headers=headers,
+                ) as resp:
+                    resp_body = await resp.read()
+                    try:
+                        resp.raise_for_status()
+                    except Exception as e:
+                        # try to retrieve and print text on error
+                        raise Exception(f"Error: {resp_body.decode()}") from e
+                    if not resp_body and not text:
+                        return None
+                    if text:
+                        return resp_body.decode()
+                    try:
+                        return CODEC.loads(resp_body)
+                    except DecodeError as e:
+                        raise Exception(
+                            f"Error decoding JSON: {resp_body.decode()}"
+                        ) from e
+        except Exception:
+            ADMIN_ERRORS.inc(method, route)
+            raise
+        finally:
+            ADMIN_REQUESTS.observe(time.perf_counter() - start, method, route)
+
+    async def _receive_webhook(self, request):
+        topic = request.match_info["topic"].replace("-", "_")
+        payload = CODEC.loads(await request.read())
+        await self.handle_webhook(topic, payload, request.headers)
+        return web.Response(status=200)
+
+    async def handle_webhook(self, topic: str, payload, headers: dict):
+        WEBHOOKS.inc(topic)
+        for listener in self.webhook_listeners:
+            listener(topic, payload)
+        exchange_id = payload.get("cred_ex_id") or payload.get("pres_ex_id")
+        if exchange_id:
+            if payload.get("state") in FINAL_STATES:
+                self.open_exchanges.pop(exchange_id, None)
+                # "deleted" follows "done" when records are auto-removed
+                if payload["state"] != "deleted":
+                    self.exchanges.resolve(exchange_id, payload)
+            elif payload.get("state") in CLOSED_STATES:
+                self.open_exchanges.pop(exchange_id, None)
+            else:
+                self.open_exchanges[exchange_id] = payload.get("connection_id")
+        elif topic == "connections" and payload.get("state") in CLOSED_STATES:
+            # nothing more will arrive for the connection's exchanges
+            conn_id = payload.get("connection_id")
+            for (ex_id, ex_conn_id) in list(self.open_exchanges.items()):
+                if ex_conn_id == conn_id:
+                    del self.open_exchanges[ex_id]
+        if topic == "webhook":  # would recurse
+            return
+        method = getattr(self, f"handle_{topic}", None)
+        if not method:
+            log_msg(
+                f"Error: agent {self.ident} has no method handle_{topic} "
+                f"to handle webhook on topic {topic}"
+            )
+            return
+        # the handler task inherits the exchange's trace
+        token = CURRENT_SPAN.set(self.trace_webhook(topic, payload))
+        try:
+            task = asyncio.get_event_loop().create_task(method(payload))
+        finally:
+            CURRENT_SPAN.reset(token)
+        self._handler_tasks.add(task)
+        task.add_done_callback(self._handler_done)
+
+    def _handler_done(self, task):
+        self._handler_tasks.discard(task)
+        self._activity.set()
+
+    async def drain(self, timeout: float) -> bool:
+        """Stop starting new workflows and wait for in-flight webhook handlers.
+
+        Webhooks are still handled while draining. Workflows and exchanges
+        waiting on another agent are not waited for, as that agent may never
+        answer; they are only reported. Returns False if handlers were left
+        when `timeout` expired.
+        """
+        self.draining = True
+        deadline = time.monotonic() + timeout
+        while self._handler_tasks:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.log(
+                    f"Drain timed out with {len(self._handler_tasks)} handlers"
+                    " in flight"
+                )
+                return False
+            self._activity.clear()
+            activity = asyncio.ensure_future(self._activity.wait())
+            await asyncio.wait(
+                {activity, *self._handler_tasks},
+                timeout=remaining,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            activity.cancel()
+        if self._workflow_tasks or self.open_exchanges:
+            self.log(
+                f"Drained with {len(self._workflow_tasks)} workflows and "
+                f"{len(self.open_exchanges)} exchanges waiting on other agents"
+            )
+        return True
+
+    def trace_webhook(self, topic: str, payload: dict):
+        """Return the trace of the webhook's connection, updating stage spans.
+
+        A trace starts when a connection request is exchanged; each credential
+        or presentation exchange on that connection is a span running from its
+        first webhook to its final state.
+        """
+        conn_id = payload.get("connection_id")
+        if not conn_id:
+            return NOOP_SPAN
+        if topic == "connections":
+            state = payload.get("rfc23_state")
+            if state in ("invitation-sent", "invitation-received"):
+                return NOOP_SPAN
+            if state == "abandoned" or payload.get("state") == "deleted":
+                TRACER.close_span(f"connection:{conn_id}", state=state)
+                TRACER.end_trace(conn_id, state=state)
+                return NOOP_SPAN
+            root = TRACER.start_trace(
+                conn_id, "exchange", agent=self.ident, connection_id=conn_id
+            )
+            if state == "completed":
+                TRACER.close_span(f"connection:{conn_id}")
+            elif root is not NOOP_SPAN and not TRACER.open_spans.get(
+                f"connection:{conn_id}"
+            ):
+                TRACER.open_span(f"connection:{conn_id}", "connection", root)
+            return root
+
+        root = TRACER.trace_for(conn_id)
+        exchange_id = payload.get("cred_ex_id") or payload.get("pres_ex_id")
+        if root is NOOP_SPAN or not exchange_id:
+            return root
+        state = payload.get("state")
+        if state in ("done", "abandoned", "deleted"):
+            TRACER.close_span(exchange_id, state=state)
+        elif exchange_id not in TRACER.open_spans:
+            request = payload.get("by_format", {}).get("pres_request", {})
+            TRACER.open_span(
+                exchange_id,
+                topic,
+                root,
+                exchange_id=exchange_id,
+                request=request.get("indy", {}).get("name"),
+            )
+        return root
+
     async def handle_oob_invitation(self, message):
         print("handle_oob_invitation()")
         pass
@@ -115,6 +361,8 @@ class AriesAgent(DemoAgent):
             self._connection_ready.set_result(True)
 
     async def handle_connections(self, message):
+        if self.track_pooled_connection(message):
+            return
         # a bit of a hack, but for the mediator connection self._connection_ready
         # will be None
         if not self._connection_ready:
@@ -261,12 +509,19 @@ class AriesAgent(DemoAgent):
                 )
 
         elif state == "done":
-            pass
+            EXCHANGES.inc("issue-credential-2.0", state)
             # Logic moved to detail record specific handler
 
         elif state == "abandoned":
+            EXCHANGES.inc("issue-credential-2.0", state)
             log_status("Credential exchange abandoned")
             self.log("Problem report message:", message.get("error_msg"))
+            self.credentials.resolve(
+                cred_ex_id,
+                error=Exception(
+                    f"Credential exchange abandoned: {message.get('error_msg')}"
+                ),
+            )
 
     async def handle_issue_credential_v2_0_indy(self, message):
         rev_reg_id = message.get("rev_reg_id")
@@ -282,7 +537,10 @@ class AriesAgent(DemoAgent):
             self.log("cred_def_id", cred["cred_def_id"])
             self.log("schema_id", cred["schema_id"])
             # track last successfully received credential
-            self.last_credential_received = cred
+            self.last_credential_received = CredentialRecord.from_admin(cred)
+            self.credentials.resolve(
+                message.get("cred_ex_id"), self.last_credential_received
+            )
 
         if rev_reg_id and cred_rev_id:
             self.log(f"Revocation registry ID: {rev_reg_id}")
@@ -453,6 +711,12 @@ class AriesAgent(DemoAgent):
                                 ],
                                 "revealed": True,
                             }
+                            self.set_revocation_timestamp(
+                                revealed[referent],
+                                creds_by_reft[referent]["cred_info"],
+                                pres_request_indy["requested_attributes"][referent],
+                                pres_request_indy,
+                            )
                     else:
                         self_attested[referent] = "my self-attested value"
 
@@ -464,6 +728,12 @@ class AriesAgent(DemoAgent):
                                     "referent"
                                 ]
                             }
+                            self.set_revocation_timestamp(
+                                predicates[referent],
+                                creds_by_reft[referent]["cred_info"],
+                                pres_request_indy["requested_predicates"][referent],
+                                pres_request_indy,
+                            )
 
                     log_status("#25 Generate the proof")
                     request = {
@@ -533,7 +803,7 @@ class AriesAgent(DemoAgent):
             else:
                 raise Exception("Invalid presentation request received")
 
-            log_status("#26 Send the proof to X: " + json.dumps(request))
+            log_status("#26 Send the proof to X:", lazy_json(request))
             await self.admin_POST(
                 f"/present-proof-2.0/records/{pres_ex_id}/send-presentation",
                 request,
@@ -543,21 +813,45 @@ class AriesAgent(DemoAgent):
             # verifier role
             log_status("#27 Process the proof provided by X")
             log_status("#28 Check if proof is valid")
-            proof = await self.admin_POST(
-                f"/present-proof-2.0/records/{pres_ex_id}/verify-presentation"
-            )
+            with PROOF_VERIFICATION.time("indy"):
+                proof = await self.admin_POST(
+                    f"/present-proof-2.0/records/{pres_ex_id}/verify-presentation"
+                )
+            EXCHANGES.inc("present-proof-2.0", "verified")
             self.log("Proof =", proof["verified"])
-            self.last_proof_received = proof
+            self.last_proof_received = PresentationRecord.from_exchange(proof)
+            self.presentations.resolve(pres_ex_id, self.last_proof_received)
 
         elif state == "abandoned":
+            EXCHANGES.inc("present-proof-2.0", state)
             log_status("Presentation exchange abandoned")
             self.log("Problem report message:", message.get("error_msg"))
+            self.presentations.resolve(
+                pres_ex_id,
+                error=Exception(
+                    f"Presentation exchange abandoned: {message.get('error_msg')}"
+                ),
+            )
+
+    def set_revocation_timestamp(self, requested, cred_info, spec, pres_request):
+        """Prove non-revocation at a timestamp shared with recent presentations."""
+        interval = spec.get("non_revoked") or pres_request.get("non_revoked")
+        if interval and cred_info.get("rev_reg_id"):
+            requested["timestamp"] = self.revocation_states.timestamp(
+                cred_info["rev_reg_id"], interval
+            )
 
     async def handle_basicmessages(self, message):
         self.log("Received message:", message["content"])
 
     async def handle_endorse_transaction(self, message):
         self.log("Received transaction message:", message.get("state"))
+        if self.transactions:
+            self.transactions.on_webhook(message)
+
+    async def handle_revocation_registry(self, message):
+        if self.transactions:
+            self.transactions.on_registry_webhook(message)
 
     async def handle_revocation_notification(self, message):
         self.log("Received revocation notification message:", message)
@@ -583,6 +877,9 @@ class AriesAgent(DemoAgent):
             )
 
         if display_qr:
+            # only needed for interactive runs, so don't pay for it at startup
+            from qrcode import QRCode
+
             qr = QRCode(border=1)
             qr.add_data(invi_rec["invitation_url"])
             log_msg(
@@ -600,6 +897,109 @@ class AriesAgent(DemoAgent):
 
         return invi_rec
 
+    async def generate_invitation_pool(
+        self,
+        use_did_exchange: bool,
+        count: int = 1,
+        multi_use: bool = False,
+        auto_accept: bool = True,
+        display_qr: bool = False,
+        reuse_connections: bool = False,
+    ):
+        """Publish a batch of invitations that any number of invitees can accept.
+
+        Connections made through the pool are tracked independently in
+        `pooled_connections`, and each completed one is handed to
+        `connection_workflow` without waiting for the others.
+        """
+        invi_params = {
+            "auto_accept": json.dumps(auto_accept),
+            "multi_use": json.dumps(multi_use),
+        }
+        invitations = []
+        with log_timer("Generate invitation pool duration:"):
+            log_status(
+                f"#7 Create {count} {'multi-use ' if multi_use else ''}invitation(s)"
+            )
+            for _ in range(count):
+                if use_did_exchange:
+                    payload = {
+                        "handshake_protocols": ["rfc23"],
+                        "use_public_did": reuse_connections,
+                    }
+                    if self.mediation:
+                        payload["mediation_id"] = self.mediator_request_id
+                    invi_rec = await self.admin_POST(
+                        "/out-of-band/create-invitation", payload, params=invi_params
+                    )
+                    pool_key = invi_rec["invi_msg_id"]
+                else:
+                    payload = (
+                        {"mediation_id": self.mediator_request_id}
+                        if self.mediation
+                        else None
+                    )
+                    invi_rec = await self.admin_POST(
+                        "/connections/create-invitation", payload, params=invi_params
+                    )
+                    pool_key = invi_rec["invitation"]["recipientKeys"][0]
+                self.pool_invitations[pool_key] = invi_rec
+                invitations.append(invi_rec)
+
+        if display_qr:
+            from qrcode import QRCode
+
+            for invi_rec in invitations:
+                qr = QRCode(border=1)
+                qr.add_data(invi_rec["invitation_url"])
+                log_msg(
+                    json.dumps(invi_rec["invitation"]),
+                    label="Invitation Data:",
+                    color=None,
+                )
+                qr.print_ascii(invert=True)
+
+        return invitations
+
+    def track_pooled_connection(self, message) -> bool:
+        """Track a connection made through the invitation pool, if it is one."""
+        if not self.pool_invitations:
+            return False
+        conn_id = message["connection_id"]
+        if conn_id not in self.pooled_connections:
+            pool_key = message.get("invitation_msg_id") or message.get(
+                "invitation_key"
+            )
+            if pool_key not in self.pool_invitations:
+                return False
+            # the inviter's own multi-use template record is not an invitee
+            if message.get("rfc23_state") == "invitation-sent":
+                return False
+
+        prev_state = self.pooled_connections.get(conn_id)
+        state = message["rfc23_state"]
+        self.pooled_connections[conn_id] = state
+        if state in ["completed", "response-sent"] and prev_state not in [
+            "completed",
+            "response-sent",
+        ]:
+            self.log(f"Connected: {conn_id} ({len(self.pooled_connections)} pooled)")
+            # most recent connection is the target for interactive commands
+            self.connection_id = conn_id
+            if self.connection_workflow and not self.draining:
+                task = asyncio.ensure_future(self._run_connection_workflow(conn_id))
+                self._workflow_tasks.add(task)
+                task.add_done_callback(self._workflow_tasks.discard)
+        elif state == "abandoned":
+            self.log(f"Connection abandoned: {conn_id}")
+        return True
+
+    async def _run_connection_workflow(self, conn_id: str):
+        try:
+            await self.connection_workflow(conn_id)
+        except Exception:
+            LOGGER.exception(f"Error in workflow for connection {conn_id}:")
+
     async def input_invitation(self, invite_details: dict, wait: bool = False):
         self._connection_ready = asyncio.Future()
         with log_timer("Connect duration:"):
@@ -613,17 +1013,16 @@ class AriesAgent(DemoAgent):
     async def create_schema_and_cred_def(
         self, schema_name, schema_attrs, revocation, version=None
     ):
+        if self.transactions:
+            return (
+                await self.create_schemas_and_cred_defs(
+                    [(schema_name, schema_attrs)], revocation, version=version
+                )
+            )[0]
         with log_timer("Publish schema/cred def duration:"):
             log_status("#3/4 Create a new schema/cred def on the ledger")
             if not version:
-                version = format(
-                    "%d.%d.%d"
-                    % (
-                        random.randint(1, 101),
-                        random.randint(1, 101),
-                        random.randint(1, 101),
-                    )
-                )
+                version = random_version()
             (_, cred_def_id,) = await self.register_schema_and_creddef(  # schema id
                 schema_name,
                 version,
@@ -633,6 +1032,66 @@ class AriesAgent(DemoAgent):
             )
             return cred_def_id
 
+    async def create_schemas_and_cred_defs(self, schemas, revocation, version=None):
+        """Publish (schema_name, schema_attrs) pairs, returning their cred def ids.
+
+        As an author, all schemas are endorsed and written in one batch, then
+        all cred defs in a second one, and with revocation this returns once
+        every cred def's revocation registry is active; otherwise they are
+        published in turn.
+        """
+        if not self.transactions:
+            return [
+                await self.create_schema_and_cred_def(
+                    schema_name, schema_attrs, revocation, version=version
+                )
+                for (schema_name, schema_attrs) in schemas
+            ]
+        with log_timer("Publish schema/cred def duration:"):
+            log_status(
+                f"#3/4 Create {len(schemas)} schema(s)/cred def(s) on the ledger"
+            )
+            written = await self.transactions.write(
+                "/schemas",
+                [
+                    {
+                        "schema_name": schema_name,
+                        "schema_version": version or random_version(),
+                        "attributes": schema_attrs,
+                    }
+                    for (schema_name, schema_attrs) in schemas
+                ],
+            )
+            written = await self.transactions.write(
+                "/credential-definitions",
+                [
+                    {
+                        "schema_id": context["schema_id"],
+                        "tag": "default",
+                        "support_revocation": revocation,
+                        "revocation_registry_size": TAILS_FILE_COUNT,
+                    }
+                    for context in written
+                ],
+            )
+            cred_def_ids = [context["cred_def_id"] for context in written]
+            if revocation:
+                await asyncio.gather(
+                    *(self.transactions.registry_active(c) for c in cred_def_ids)
+                )
+            return cred_def_ids
+
+
+def random_version() -> str:
+    return format(
+        "%d.%d.%d"
+        % (
+            random.randint(1, 101),
+            random.randint(1, 101),
+            random.randint(1, 101),
+        )
+    )
+
 
 class AgentContainer:
     def __init__(
@@ -658,6 +1117,10 @@ class AgentContainer:
         endorser_role: str = None,
         reuse_connections: bool = False,
         taa_accept: bool = False,
+        profile_startup: bool = False,
+        invitation_pool: int = 0,
+        multi_use_invitations: bool = False,
+        metrics_port: int = None,
     ):
         # configuration parameters
         self.genesis_txns = genesis_txns
@@ -680,6 +1143,8 @@ class AgentContainer:
         self.arg_file = arg_file
         self.endorser_agent = None
         self.endorser_role = endorser_role
+        self.cred_def_id = None
+        self.cred_def_ids = []
         if endorser_role:
             # endorsers and authors need public DIDs (assume cred_type is Indy)
             if endorser_role == "author" or endorser_role == "endorser":
@@ -687,12 +1152,17 @@ class AgentContainer:
                 self.cred_type = CRED_FORMAT_INDY
 
         self.reuse_connections = reuse_connections
+        self.invitation_pool = invitation_pool
+        self.multi_use_invitations = multi_use_invitations
+        self.metrics_port = metrics_port
+        self.metrics_runner = None
         self.exchange_tracing = False
 
         # local agent(s)
         self.agent = None
         self.mediator_agent = None
         self.taa_accept = taa_accept
+        self.profile_startup = profile_startup
 
     async def initialize(
         self,
@@ -700,8 +1170,13 @@ class AgentContainer:
         schema_name: str = None,
         schema_attrs: list = None,
         create_endorser_agent: bool = False,
+        schemas: list = None,
     ):
-        """Startup agent(s), register DID, schema, cred def as appropriate."""
+        """Startup agent(s), register DID, schema, cred def as appropriate.
+
+        `schemas` is a list of (schema_name, schema_attrs) to publish together,
+        whose cred def ids are put in `cred_def_ids`.
+        """
 
         if not the_agent:
             log_status(
@@ -730,23 +1205,26 @@ class AgentContainer:
         else:
             self.agent = the_agent
 
-        await self.agent.listen_webhooks(self.start_port + 2)
+        with STARTUP_PROFILE.phase("listen webhooks"):
+            await self.agent.listen_webhooks(self.start_port + 2)
 
         # create public DID ... UNLESS we are an author ...
         if (not self.endorser_role) or (self.endorser_role == "endorser"):
             if self.public_did and self.cred_type != CRED_FORMAT_JSON_LD:
-                await self.agent.register_did(cred_type=CRED_FORMAT_INDY)
+                with STARTUP_PROFILE.phase("register public DID"):
+                    await self.agent.register_did(cred_type=CRED_FORMAT_INDY)
                 log_msg("Created public DID")
 
         # if we are endorsing, create the endorser agent first, then we can use the
         # multi-use invitation to auto-connect the agent on startup
         if create_endorser_agent:
-            self.endorser_agent = await start_endorser_agent(
-                self.start_port + 7,
-                self.genesis_txns,
-                self.genesis_txn_list,
-                use_did_exchange=self.use_did_exchange,
-            )
+            with STARTUP_PROFILE.phase("start endorser agent"):
+                self.endorser_agent = await start_endorser_agent(
+                    self.start_port + 7,
+                    self.genesis_txns,
+                    self.genesis_txn_list,
+                    use_did_exchange=self.use_did_exchange,
+                )
             if not self.endorser_agent:
                 raise Exception("Endorser agent returns None :-(")
 
@@ -758,16 +1236,21 @@ class AgentContainer:
         else:
             self.endorser_agent = None
 
-        with log_timer("Startup duration:"):
+        with log_timer("Startup duration:"), STARTUP_PROFILE.phase("start agent"):
             await self.agent.start_process()
 
         log_msg("Admin URL is at:", self.agent.admin_url)
         log_msg("Endpoint URL is at:", self.agent.endpoint)
 
+        if self.metrics_port:
+            self.metrics_runner = await start_metrics_server(self.metrics_port)
+            log_msg("Metrics are at:", f"http://0.0.0.0:{self.metrics_port}/metrics")
+
         if self.mediation:
-            self.mediator_agent = await start_mediator_agent(
-                self.start_port + 4, self.genesis_txns, self.genesis_txn_list
-            )
+            with STARTUP_PROFILE.phase("start mediator agent"):
+                self.mediator_agent = await start_mediator_agent(
+                    self.start_port + 4, self.genesis_txns, self.genesis_txn_list
+                )
             if not self.mediator_agent:
                 raise Exception("Mediator agent returns None :-(")
         else:
@@ -815,8 +1298,14 @@ class AgentContainer:
                     did=new_did["result"]["did"],
                     verkey=new_did["result"]["verkey"],
                 )
-                await self.agent.admin_POST("/wallet/did/public?did=" + self.agent.did)
-                await asyncio.sleep(3.0)
+                result = await self.agent.admin_POST(
+                    "/wallet/did/public?did=" + self.agent.did
+                )
+                # the DID's endpoint is written through the endorser
+                if result and "txn" in result:
+                    await self.agent.transactions.wait(
+                        result["txn"]["transaction_id"]
+                    )
                 log_msg("Created public DID")
 
         if self.public_did and self.cred_type == CRED_FORMAT_JSON_LD:
@@ -828,9 +1317,19 @@ class AgentContainer:
 
         if schema_name and schema_attrs:
             # Create a schema/cred def
-            self.cred_def_id = await self.create_schema_and_cred_def(
-                schema_name, schema_attrs
-            )
+            with STARTUP_PROFILE.phase("publish schema/cred def"):
+                self.cred_def_id = await self.create_schema_and_cred_def(
+                    schema_name, schema_attrs
+                )
+        if schemas:
+            with STARTUP_PROFILE.phase("publish schemas/cred defs"):
+                self.cred_def_ids = await self.create_schemas_and_cred_defs(schemas)
+            self.cred_def_id = self.cred_def_id or self.cred_def_ids[0]
+
+        STARTUP_PROFILE.mark_ready()
+        if self.profile_startup:
+            for line in STARTUP_PROFILE.format_report():
+                log_msg(line)
 
     async def create_schema_and_cred_def(
         self,
@@ -853,10 +1352,23 @@ class AgentContainer:
         else:
             raise Exception("Invalid credential type:" + self.cred_type)
 
+    async def create_schemas_and_cred_defs(self, schemas: list, version: str = None):
+        if not self.public_did:
+            raise Exception("Can't create a schema/cred def without a public DID :-(")
+        if self.cred_type == CRED_FORMAT_INDY:
+            return await self.agent.create_schemas_and_cred_defs(
+                schemas, self.revocation, version=version
+            )
+        elif self.cred_type == CRED_FORMAT_JSON_LD:
+            return [None for _ in schemas]
+        else:
+            raise Exception("Invalid credential type:" + self.cred_type)
+
     async def issue_credential(
         self,
         cred_def_id: str,
         cred_attrs: list,
+        connection_id: str = None,
     ):
         log_status("#13 Issue credential offer to X")
 
@@ -866,7 +1378,7 @@ class AgentContainer:
                 "attributes": cred_attrs,
             }
             offer_request = {
-                "connection_id": self.agent.connection_id,
+                "connection_id": connection_id or self.agent.connection_id,
                 "comment": f"Offer on cred def id {cred_def_id}",
                 "auto_remove": False,
                 "credential_preview": cred_preview,
@@ -887,26 +1399,53 @@ class AgentContainer:
         else:
             raise Exception("Invalid credential type:" + self.cred_type)
 
+    def issue_credentials(
+        self,
+        cred_def_id: str,
+        offers,
+        concurrency: int = 10,
+        timeout: float = 60.0,
+    ):
+        """Offer credentials on many connections at once.
+
+        `offers` is an iterable of (connection_id, cred_attrs); returns an async
+        iterator of ExchangeResults, in the order the exchanges finish.
+        """
+        return run_exchanges(
+            offers,
+            lambda offer: self.issue_credential(
+                cred_def_id, offer[1], connection_id=offer[0]
+            ),
+            self.agent.exchanges.wait,
+            concurrency,
+            timeout,
+        )
+
     async def receive_credential(
         self,
         cred_def_id: str,
         cred_attrs: list,
+        cred_ex_id: str = None,
+        timeout: float = 30.0,
     ):
-        await asyncio.sleep(1.0)
-
-        # check if the requested credential matches out last received
-        if not self.agent.last_credential_received:
+        """Wait for the credential of `cred_ex_id` (or the next one) and check it."""
+        try:
+            credential = await self.agent.credentials.wait(cred_ex_id, timeout)
+        except asyncio.TimeoutError:
             # no credential received
             print("No credential received")
             return False
+        except Exception as e:
+            print(e)
+            return False
 
-        if cred_def_id != self.agent.last_credential_received["cred_def_id"]:
+        if cred_def_id != credential.cred_def_id:
             # wrong credential definition
             print("Wrong credential definition id")
             return False
 
         # check if attribute values match those of issued credential
-        wallet_attrs = self.agent.last_credential_received["attrs"]
+        wallet_attrs = credential.attrs
         matched = True
         for cred_attr in cred_attrs:
             if cred_attr["name"] in wallet_attrs:
@@ -917,7 +1456,7 @@ class AgentContainer:
 
         return matched
 
-    async def request_proof(self, proof_request):
+    async def request_proof(self, proof_request, connection_id: str = None):
         log_status("#20 Request proof of degree from alice")
 
         if self.cred_type == CRED_FORMAT_INDY:
@@ -935,7 +1474,7 @@ class AgentContainer:
             if self.revocation:
                 non_revoked_supplied = False
                 # plug in revocation where requested in the supplied proof request
-                non_revoked = {"to": int(time.time())}
+                non_revoked = NON_REVOKED_POLICY.interval()
                 if "non_revoked" in proof_request:
                     indy_proof_request["non_revoked"] = non_revoked
                     non_revoked_supplied = True
@@ -970,7 +1509,7 @@ class AgentContainer:
             log_status(f"  >>> asking for proof for request: {indy_proof_request}")
 
             proof_request_web_request = {
-                "connection_id": self.agent.connection_id,
+                "connection_id": connection_id or self.agent.connection_id,
                 "presentation_request": {
                     "indy": indy_proof_request,
                 },
@@ -990,45 +1529,77 @@ class AgentContainer:
         else:
             raise Exception("Invalid credential type:" + self.cred_type)
 
-    async def verify_proof(self, proof_request):
-        await asyncio.sleep(1.0)
+    def request_proofs(self, requests, concurrency: int = 10, timeout: float = 60.0):
+        """Request proofs on many connections at once.
 
-        # check if the requested credential matches out last received
-        if not self.agent.last_proof_received:
+        `requests` is an iterable of (connection_id, proof_request); returns an
+        async iterator of ExchangeResults, in the order the exchanges finish.
+        The final webhook of a verified presentation has `verified` "true".
+        """
+        return run_exchanges(
+            requests,
+            lambda request: self.request_proof(request[1], connection_id=request[0]),
+            self.agent.exchanges.wait,
+            concurrency,
+            timeout,
+        )
+
+    async def verify_proof(
+        self, proof_request, pres_ex_id: str = None, timeout: float = 30.0
+    ):
+        """Wait for the presentation of `pres_ex_id` (or the next one) to be verified."""
+        try:
+            proof = await self.agent.presentations.wait(pres_ex_id, timeout)
+        except asyncio.TimeoutError:
             # no proof received
             print("No proof received")
             return None
+        except Exception as e:
+            print(e)
+            return None
 
         if self.cred_type == CRED_FORMAT_INDY:
             # return verified status
-            return self.agent.last_proof_received["verified"]
+            return proof.verified
 
         elif self.cred_type == CRED_FORMAT_JSON_LD:
             # return verified status
-            return self.agent.last_proof_received["verified"]
+            return proof.verified
 
         else:
             raise Exception("Invalid credential type:" + self.cred_type)
 
-    async def terminate(self):
-        """Shut down any running agents."""
+    async def terminate(self, drain_timeout: float = None):
+        """Drain in-flight work, then shut down any running agents."""
 
         terminated = True
         try:
-            if self.endorser_agent:
-                log_msg("Shutting down endorser agent ...")
-                await self.endorser_agent.terminate()
-            if self.mediator_agent:
-                log_msg("Shutting down mediator agent ...")
-                await self.mediator_agent.terminate()
             if self.agent:
-                log_msg("Shutting down agent ...")
-                await self.agent.terminate()
+                log_msg("Draining agent ...")
+                await self.agent.drain(
+                    DRAIN_TIMEOUT if drain_timeout is None else drain_timeout
+                )
+            TRACER.close()
+            LOG.flush()
+            agents = [
+                agent
+                for agent in (self.endorser_agent, self.mediator_agent, self.agent)
+                if agent
+            ]
+            log_msg("Shutting down agents ...")
+            results = await asyncio.gather(
+                *(agent.terminate() for agent in agents), return_exceptions=True
+            )
+            for (agent, result) in zip(agents, results):
+                if isinstance(result, Exception):
+                    LOGGER.error(f"Error terminating {agent.ident}: {result!r}")
+                    terminated = False
+            if self.metrics_runner:
+                await self.metrics_runner.cleanup()
         except Exception:
             LOGGER.exception("Error terminating agent:")
             terminated = False
-
-        await asyncio.sleep(3.0)
+        LOG.flush()
 
         return terminated
 
@@ -1047,6 +1618,23 @@ class AgentContainer:
             wait=wait,
         )
 
+    async def generate_invitation_pool(
+        self,
+        connection_workflow=None,
+        auto_accept: bool = True,
+        display_qr: bool = False,
+    ):
+        if connection_workflow:
+            self.agent.connection_workflow = connection_workflow
+        return await self.agent.generate_invitation_pool(
+            self.use_did_exchange,
+            count=self.invitation_pool or 1,
+            multi_use=self.multi_use_invitations,
+            auto_accept=auto_accept,
+            display_qr=display_qr,
+            reuse_connections=self.reuse_connections,
+        )
+
     async def input_invitation(self, invite_details: dict, wait: bool = False):
         return await self.agent.input_invitation(invite_details, wait)
 
@@ -1240,6 +1828,22 @@ def arg_parser(ident: str = None, port: int = 8020):
                 "Only applicable for AIP 2.0 (OOB) connections."
             ),
         )
+    if (not ident) or (ident != "alice"):
+        parser.add_argument(
+            "--invitation-pool",
+            type=int,
+            default=0,
+            metavar="<count>",
+            help=(
+                "Publish <count> invitations up front and accept any number of "
+                "concurrent invitees, each handled by its own workflow"
+            ),
+        )
+        parser.add_argument(
+            "--multi-use-invitations",
+            action="store_true",
+            help="Make the pooled invitations multi-use",
+        )
     parser.add_argument(
         "--arg-file",
         type=str,
@@ -1251,6 +1855,49 @@ def arg_parser(ident: str = None, port: int = 8020):
         action="store_true",
         help="Accept the ledger's TAA, if required",
     )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        metavar="<port>",
+        help=(
+            "Serve Prometheus-style metrics on this port "
+            "(default: no metrics server)"
+        ),
+    )
+    parser.add_argument(
+        "--trace-sample-rate",
+        type=float,
+        metavar="<rate>",
+        default=float(os.getenv("TRACE_SAMPLE_RATE", 0) or 0),
+        help=(
+            "Record exchange-level trace spans for this fraction (0-1) of "
+            "connections (default: 0, no tracing)"
+        ),
+    )
+    parser.add_argument(
+        "--trace-file",
+        type=str,
+        metavar="<path>",
+        help="JSON-lines file for trace spans (default: <ident>-traces.jsonl)",
+    )
+    parser.add_argument(
+        "--log-levels",
+        type=str,
+        metavar="<levels>",
+        default=os.getenv("LOG_LEVELS"),
+        help=(
+            "Per-subsystem terminal log levels (debug/info/warning/off) for "
+            "status, msg, json and agent, e.g. 'status=off,*=info'"
+        ),
+    )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help=(
+            "Report import and initialization time from process start to ready "
+            "(set STARTUP_BUDGET=<seconds> to flag slow starts)"
+        ),
+    )
     return parser
 
 
@@ -1279,6 +1926,8 @@ async def create_agent_with_args(args, ident: str = None):
     arg_file = args.arg_file or os.getenv("ACAPY_ARG_FILE")
     arg_file_dict = {}
     if arg_file:
+        import yaml
+
         with open(arg_file) as f:
             arg_file_dict = yaml.safe_load(f)
 
@@ -1297,12 +1946,18 @@ async def create_agent_with_args(args, ident: str = None):
     multi_ledger_config_path = None
     if "multi_ledger" in args and args.multi_ledger:
         multi_ledger_config_path = "./demo/multi_ledger_config.yml"
-    genesis = await default_genesis_txns()
+    with STARTUP_PROFILE.phase("fetch genesis transactions"):
+        genesis = await default_genesis_txns()
     if not genesis and not multi_ledger_config_path:
         print("Error retrieving ledger genesis transactions")
         sys.exit(1)
 
     agent_ident = ident if ident else (args.ident if "ident" in args else "Aries")
+    LOG.set_levels(parse_levels(args.log_levels))
+    TRACER.configure(
+        sample_rate=args.trace_sample_rate,
+        path=args.trace_file or os.getenv("TRACE_FILE") or f"{agent_ident}-traces.jsonl",
+    )
 
     if "aip" in args:
         aip = int(args.aip)
@@ -1352,6 +2007,12 @@ async def create_agent_with_args(args, ident: str = None):
         endorser_role=args.endorser_role,
         reuse_connections=reuse_connections,
         taa_accept=args.taa_accept,
+        profile_startup=args.profile_startup,
+        invitation_pool=args.invitation_pool if "invitation_pool" in args else 0,
+        multi_use_invitations=(
+            "multi_use_invitations" in args and args.multi_use_invitations
+        ),
+        metrics_port=args.metrics_port,
     )
 
     return agent
@@ -1369,104 +2030,202 @@ async def test_main(
     wallet_type: str = None,
     cred_type: str = None,
     aip: str = 20,
+    scenarios: list = ("connection", "issuance", "proof", "bridge"),
+    iterations: int = 10,
+    concurrency: int = 1,
+    results_path: str = None,
+    baseline_path: str = None,
+    tolerance: float = 0.2,
+    update_baseline: bool = False,
 ):
-    """Test to startup a couple of agents."""
+    """Benchmark connection, issuance, proof and bridge scenarios.
+
+    Faber issues to and verifies Alice; the bridge scenario runs against the
+    local Fabric and EVM stand-ins. Returns the regressions against the
+    baseline (see benchmark.py).
+    """
+    from runners.benchmark import bridge_scenario, report, run_scenario
 
     faber_container = None
     alice_container = None
+    results = []
     try:
-        # initialize the containers
-        faber_container = AgentContainer(
-            genesis_txns=genesis,
-            ident="Faber.agent",
-            start_port=start_port,
-            no_auto=no_auto,
-            revocation=revocation,
-            tails_server_base_url=tails_server_base_url,
-            show_timing=show_timing,
-            multitenant=multitenant,
-            mediation=mediation,
-            use_did_exchange=use_did_exchange,
-            wallet_type=wallet_type,
-            public_did=True,
-            seed="random",
-            cred_type=cred_type,
-            aip=aip,
-        )
-        alice_container = AgentContainer(
-            genesis_txns=genesis,
-            ident="Alice.agent",
-            start_port=start_port + 10,
-            no_auto=no_auto,
-            revocation=False,
-            show_timing=show_timing,
-            multitenant=multitenant,
-            mediation=mediation,
-            use_did_exchange=use_did_exchange,
-            wallet_type=wallet_type,
-            public_did=False,
-            seed=None,
-            aip=aip,
-        )
+        agent_scenarios = [s for s in scenarios if s != "bridge"]
+        if agent_scenarios:
+            genesis = await default_genesis_txns()
+
+            # initialize the containers
+            faber_container = AgentContainer(
+                genesis_txns=genesis,
+                ident="Faber.agent",
+                start_port=start_port,
+                no_auto=no_auto,
+                revocation=revocation,
+                tails_server_base_url=tails_server_base_url,
+                show_timing=show_timing,
+                multitenant=multitenant,
+                mediation=mediation,
+                use_did_exchange=use_did_exchange,
+                wallet_type=wallet_type,
+                public_did=True,
+                seed="random",
+                cred_type=cred_type,
+                aip=aip,
+                metrics_port=0,
+            )
+            alice_container = AgentContainer(
+                genesis_txns=genesis,
+                ident="Alice.agent",
+                start_port=start_port + 10,
+                no_auto=no_auto,
+                revocation=False,
+                show_timing=show_timing,
+                multitenant=multitenant,
+                mediation=mediation,
+                use_did_exchange=use_did_exchange,
+                wallet_type=wallet_type,
+                public_did=False,
+                seed=None,
+                aip=aip,
+                metrics_port=0,
+            )
 
-        # start the agents - faber gets a public DID and schema/cred def
-        await faber_container.initialize(
-            schema_name="degree schema",
-            schema_attrs=[
-                "name",
-                "date",
-                "degree",
-                "grade",
-            ],
-        )
-        await alice_container.initialize()
+            # start the agents - faber gets a public DID and schema/cred def
+            await faber_container.initialize(
+                schema_name="degree schema",
+                schema_attrs=[
+                    "name",
+                    "date",
+                    "degree",
+                    "grade",
+                ],
+            )
+            await alice_container.initialize()
+
+            async def connect(i):
+                # faber create invitation, alice accept invitation
+                invite = await faber_container.generate_invitation()
+                await alice_container.input_invitation(invite["invitation"])
+                # wait for both ends of the connection to activate
+                await faber_container.detect_connection()
+                await alice_container.detect_connection()
+
+            # every scenario after this one runs on the last connection made
+            results.append(
+                await run_scenario(
+                    "connection",
+                    connect,
+                    iterations if "connection" in scenarios else 1,
+                    # an agent container tracks one connection at a time
+                    concurrency=1,
+                )
+            )
 
-        # faber create invitation
-        invite = await faber_container.generate_invitation()
+            cred_attrs = [
+                {"name": "name", "value": "Alice Smith"},
+                {"name": "date", "value": "2018-05-28"},
+                {"name": "degree", "value": "Maths"},
+                {"name": "grade", "value": "87"},
+            ]
 
-        # alice accept invitation
-        invite_details = invite["invitation"]
-        connection = await alice_container.input_invitation(invite_details)
+            async def issue(i):
+                cred_exchange = await faber_container.issue_credential(
+                    faber_container.cred_def_id, cred_attrs
+                )
+                final = await faber_container.agent.exchanges.wait(
+                    cred_exchange["cred_ex_id"]
+                )
+                if final["state"] != "done":
+                    raise Exception(f"Credential exchange {final['state']}")
+
+            if "issuance" in scenarios or "proof" in scenarios:
+                results.append(
+                    await run_scenario(
+                        "issuance",
+                        issue,
+                        iterations if "issuance" in scenarios else 1,
+                        concurrency,
+                    )
+                )
+
+            proof_request = {
+                "name": "Proof of Education",
+                "version": "1.0",
+                "requested_attributes": {
+                    f"0_{name}_uuid": {
+                        "name": name,
+                        "restrictions": [{"schema_name": "degree schema"}],
+                    }
+                    for name in ("name", "degree")
+                },
+                "requested_predicates": {},
+            }
 
-        # wait for faber connection to activate
-        await faber_container.detect_connection()
-        await alice_container.detect_connection()
+            async def prove(i):
+                proof_exchange = await faber_container.request_proof(proof_request)
+                final = await faber_container.agent.exchanges.wait(
+                    proof_exchange["pres_ex_id"]
+                )
+                if final.get("verified") != "true":
+                    raise Exception(f"Presentation {final['state']}, not verified")
 
-        # TODO faber issue credential to alice
-        # TODO alice check for received credential
+            if "proof" in scenarios:
+                results.append(
+                    await run_scenario("proof", prove, iterations, concurrency)
+                )
 
-        log_msg("Sleeping ...")
-        await asyncio.sleep(3.0)
+        if "bridge" in scenarios:
+            results.append(await bridge_scenario(iterations, concurrency))
 
     except Exception as e:
-        LOGGER.exception("Error initializing agent:", e)
+        LOGGER.exception("Error running benchmark:", e)
         raise (e)
 
     finally:
-        terminated = True
-        try:
-            # shut down containers at the end of the test
-            if alice_container:
-                log_msg("Shutting down alice agent ...")
-                await alice_container.terminate()
-            if faber_container:
-                log_msg("Shutting down faber agent ...")
-                await faber_container.terminate()
-        except Exception as e:
-            LOGGER.exception("Error terminating agent:", e)
-            terminated = False
+        # shut down containers at the end of the test
+        containers = [c for c in (alice_container, faber_container) if c]
+        terminated = all(
+            await asyncio.gather(*(c.terminate() for c in containers))
+        )
 
-    await asyncio.sleep(0.1)
+    regressions = report(
+        results, results_path, baseline_path, tolerance, update_baseline
+    )
+    LOG.flush()
 
     if not terminated:
         os._exit(1)
 
-    await asyncio.sleep(2.0)
-    os._exit(1)
+    return regressions
 
 
 if __name__ == "__main__":
     parser = arg_parser()
+    parser.add_argument(
+        "--scenarios",
+        type=str,
+        default="connection,issuance,proof,bridge",
+        help="Comma-separated benchmark scenarios to run",
+    )
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument(
+        "--results", type=str, metavar="<path>", help="Write JSON results here"
+    )
+    parser.add_argument(
+        "--baseline", type=str, metavar="<path>", help="Baseline to compare against"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Allowed throughput/latency regression as a fraction (default 0.2)",
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="Store these results as the new baseline",
+    )
     args = parser.parse_args()
 
     if args.did_exchange and args.mediation:
@@ -1512,7 +2271,7 @@ if __name__ == "__main__":
         )
 
     try:
-        asyncio.get_event_loop().run_until_complete(
+        regressions = asyncio.get_event_loop().run_until_complete(
             test_main(
                 args.port,
                 args.no_auto,
@@ -1525,7 +2284,16 @@ if __name__ == "__main__":
                 args.wallet_type,
                 args.cred_type,
                 args.aip,
+                scenarios=[s.strip() for s in args.scenarios.split(",") if s.strip()],
+                iterations=args.iterations,
+                concurrency=args.concurrency,
+                results_path=args.results,
+                baseline_path=args.baseline,
+                tolerance=args.tolerance,
+                update_baseline=args.update_baseline,
             )
         )
     except KeyboardInterrupt:
         os._exit(1)
+    # agent output readers may still be running, don't wait for them
+    os._exit(1 if regressions else 0)
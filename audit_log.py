@@ -0,0 +1,481 @@
+"""
+Append-only audit log of verified presentations.
+
+Three files share a path prefix:
+
+  <prefix>.log   framed records: (length, timestamp, verified) + JSON body
+                 with pres_ex_id, connection_id, proof name, revealed attrs
+  <prefix>.idx   one fixed-size (timestamp, offset) entry per record, in
+                 append order; timestamps never decrease, so a time range is
+                 a binary search over the memory-mapped file
+  <prefix>.hidx  holder (connection_id) postings as sorted runs of
+                 (holder hash, record number), one run per flushed batch,
+                 with the run boundaries in <prefix>.hblk
+
+Records are buffered and handed to a writer thread in large sequential
+batches, at the latest `max_delay` seconds after the first buffered record
+(by an event-loop timer when one is running), so appending never waits on
+the disk. The writer fsyncs the log and index. The holder files are not
+synced: `_recover` rebuilds any postings they lack from the log. At most
+`max_queued` batches wait for the writer; beyond that, flush() blocks.
+
+A holder lookup binary-searches every run. After each batch the writer
+merges the trailing runs while the run before them is no larger than they
+are together and the merge stays within `max_merge` postings, which keeps
+the number of runs logarithmic up to that size however small the batches.
+`compact()` merges all runs into one. Queries wait for the writer first.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import heapq
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+RECORD_HEADER = struct.Struct("<IdB")  # body length, timestamp, verified
+INDEX_ENTRY = struct.Struct("<dQ")  # timestamp, record offset
+POSTING = struct.Struct("<QQ")  # holder hash, record number
+BLOCK = struct.Struct("<QQ")  # first posting, posting count
+
+LOGGER = logging.getLogger(__name__)
+
+
+def holder_hash(connection_id: str) -> int:
+    return int.from_bytes(
+        hashlib.blake2b(connection_id.encode(), digest_size=8).digest(), "little"
+    )
+
+
+class _MappedFile:
+    """Read-only mmap of a growing file, remapped after it is appended to."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.map = None
+        self.size = 0
+
+    def view(self):
+        size = os.path.getsize(self.path)
+        if size != self.size:
+            if self.map:
+                self.map.close()
+            self.map = None
+            if size:
+                with open(self.path, "rb") as f:
+                    self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.size = size
+        return self.map
+
+    def close(self):
+        if self.map:
+            self.map.close()
+            self.map = None
+            self.size = 0
+
+
+class AuditLog:
+    def __init__(
+        self,
+        prefix: str,
+        batch_size: int = 10_000,
+        max_delay: float = 1.0,
+        max_queued: int = 8,
+        max_merge: int = 1 << 22,
+    ):
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.max_queued = max_queued
+        self.max_merge = max_merge
+        for ext in ("log", "idx", "hidx", "hblk"):
+            open(f"{prefix}.{ext}", "ab").close()
+        self._recover()
+
+        self._log = open(f"{prefix}.log", "ab")
+        self._idx = open(f"{prefix}.idx", "ab")
+        self._hidx = open(f"{prefix}.hidx", "ab")
+        self._hblk = open(f"{prefix}.hblk", "ab")
+        self._index = _MappedFile(f"{prefix}.idx")
+        self._postings = _MappedFile(f"{prefix}.hidx")
+        self._data = _MappedFile(f"{prefix}.log")
+
+        self.count = os.path.getsize(f"{prefix}.idx") // INDEX_ENTRY.size
+        self.offset = os.path.getsize(f"{prefix}.log")
+        self.blocks = self._read_blocks()
+        self.last_timestamp = self._timestamp(self.count - 1) if self.count else 0.0
+        self._pending = []  # (timestamp, holder hash, framed record)
+        self._pending_since = None
+        self._timer = None
+        self._writer = ThreadPoolExecutor(1, thread_name_prefix="audit-log")
+        self._writes = deque()  # batches handed to the writer, oldest first
+
+    # -------------------------------------------------------------- recovery
+
+    def _recover(self):
+        """Drop a partly written tail left by a crash mid-flush."""
+        idx_size = os.path.getsize(f"{self.prefix}.idx")
+        count = idx_size // INDEX_ENTRY.size
+        log_size = os.path.getsize(f"{self.prefix}.log")
+        end = 0
+        with open(f"{self.prefix}.idx", "r+b") as idx, open(
+            f"{self.prefix}.log", "rb"
+        ) as log:
+            # the log is written first; keep only entries whose record is whole
+            while count:
+                idx.seek((count - 1) * INDEX_ENTRY.size)
+                (_, offset) = INDEX_ENTRY.unpack(idx.read(INDEX_ENTRY.size))
+                log.seek(offset)
+                header = log.read(RECORD_HEADER.size)
+                if len(header) == RECORD_HEADER.size:
+                    end = offset + RECORD_HEADER.size + RECORD_HEADER.unpack(header)[0]
+                    if end <= log_size:
+                        break
+                end = 0
+                count -= 1
+            idx.truncate(count * INDEX_ENTRY.size)
+        with open(f"{self.prefix}.log", "r+b") as log:
+            log.truncate(end)
+
+        # holder runs: drop a torn run, then index records no run covers yet
+        blocks = []
+        with open(f"{self.prefix}.hblk", "r+b") as hblk:
+            data = hblk.read()
+            for i in range(len(data) // BLOCK.size):
+                (first, n) = BLOCK.unpack_from(data, i * BLOCK.size)
+                blocks.append((first, n))
+            hblk.truncate(len(blocks) * BLOCK.size)
+        postings = sum(n for (_, n) in blocks)
+        with open(f"{self.prefix}.hidx", "r+b") as hidx:
+            hidx.truncate(postings * POSTING.size)
+        if postings < count:
+            missing = []
+            with open(f"{self.prefix}.idx", "rb") as idx, open(
+                f"{self.prefix}.log", "rb"
+            ) as log:
+                for seq in range(postings, count):
+                    idx.seek(seq * INDEX_ENTRY.size)
+                    (_, offset) = INDEX_ENTRY.unpack(idx.read(INDEX_ENTRY.size))
+                    log.seek(offset)
+                    (length, _, _) = RECORD_HEADER.unpack(log.read(RECORD_HEADER.size))
+                    body = json.loads(log.read(length))
+                    missing.append((holder_hash(body["connection_id"] or ""), seq))
+            self._write_run(missing, postings)
+
+    def _write_run(self, postings: list, first: int):
+        postings.sort()
+        with open(f"{self.prefix}.hidx", "ab") as hidx:
+            hidx.write(b"".join(POSTING.pack(h, seq) for (h, seq) in postings))
+        with open(f"{self.prefix}.hblk", "ab") as hblk:
+            hblk.write(BLOCK.pack(first, len(postings)))
+
+    def _read_blocks(self) -> list:
+        with open(f"{self.prefix}.hblk", "rb") as f:
+            data = f.read()
+        return [BLOCK.unpack_from(data, i) for i in range(0, len(data), BLOCK.size)]
+
+    # ---------------------------------------------------------------- writes
+
+    def __len__(self):
+        return self.count + len(self._pending)
+
+    def append(
+        self,
+        pres_ex_id: str,
+        connection_id: str,
+        name: str,
+        verified: bool,
+        revealed: dict,
+        timestamp: float = None,
+    ):
+        timestamp = time.time() if timestamp is None else timestamp
+        # the index stays sorted by time even if the clock steps back
+        timestamp = max(timestamp, self.last_timestamp)
+        self.last_timestamp = timestamp
+        body = json.dumps(
+            {
+                "pres_ex_id": pres_ex_id,
+                "connection_id": connection_id,
+                "name": name,
+                "revealed": revealed,
+            },
+            separators=(",", ":"),
+        ).encode()
+        self._pending.append(
+            (
+                timestamp,
+                holder_hash(connection_id or ""),
+                RECORD_HEADER.pack(len(body), timestamp, bool(verified)) + body,
+            )
+        )
+        if self._pending_since is None:
+            self._pending_since = time.monotonic()
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None
+            if loop:
+                self._timer = loop.call_later(self.max_delay, self.flush)
+        if (
+            len(self._pending) >= self.batch_size
+            or time.monotonic() - self._pending_since >= self.max_delay
+        ):
+            self.flush()
+
+    def append_record(self, record, audited=(), timestamp: float = None):
+        """Append a verified `records.PresentationRecord`.
+
+        Only the revealed attributes named in `audited` are kept.
+        """
+        self.append(
+            record.pres_ex_id,
+            record.connection_id,
+            record.name,
+            record.verified in (True, "true"),
+            {
+                name: value
+                for (name, value) in (record.revealed or {}).items()
+                if name in audited
+            },
+            timestamp,
+        )
+
+    def flush(self):
+        """Hand buffered records to the writer thread."""
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch = self._pending
+        first = self.count
+        offset = self.offset
+        self.count += len(batch)
+        self.offset += sum(len(framed) for (_, _, framed) in batch)
+        self._pending = []
+        self._pending_since = None
+        while self._writes and self._writes[0].done():
+            self._writes.popleft()
+        if len(self._writes) >= self.max_queued:
+            # the disk is behind: wait for the oldest batch
+            self._writes.popleft().result()
+        write = self._writer.submit(self._write_batch, batch, first, offset)
+        write.add_done_callback(self._write_done)
+        self._writes.append(write)
+
+    def _write_done(self, write):
+        if not write.cancelled() and write.exception():
+            LOGGER.error("Audit log write failed", exc_info=write.exception())
+
+    def sync(self):
+        """Flush, and wait until everything appended so far is on disk."""
+        self.flush()
+        while self._writes:
+            self._writes.popleft().result()
+
+    def _write_batch(self, batch: list, first_seq: int, offset: int):
+        """Writer thread: log first, then the index, then the holder run."""
+        index = []
+        for (timestamp, _, framed) in batch:
+            index.append(INDEX_ENTRY.pack(timestamp, offset))
+            offset += len(framed)
+        self._log.write(b"".join(framed for (_, _, framed) in batch))
+        self._log.flush()
+        os.fsync(self._log.fileno())
+        self._idx.write(b"".join(index))
+        self._idx.flush()
+        os.fsync(self._idx.fileno())
+
+        run = sorted((h, first_seq + i) for (i, (_, h, _)) in enumerate(batch))
+        first = sum(n for (_, n) in self.blocks)
+        self._hidx.write(b"".join(POSTING.pack(h, seq) for (h, seq) in run))
+        self._hidx.flush()
+        self._hblk.write(BLOCK.pack(first, len(run)))
+        self._hblk.flush()
+        self.blocks.append((first, len(run)))
+
+        k = len(self.blocks) - 1
+        size = self.blocks[k][1]
+        while (
+            k
+            and self.blocks[k - 1][1] <= size
+            and size + self.blocks[k - 1][1] <= self.max_merge
+        ):
+            k -= 1
+            size += self.blocks[k][1]
+        self._merge_runs(k)
+
+    def compact(self):
+        """Merge all holder runs into one sorted run."""
+        self.sync()
+        self._writer.submit(self._merge_runs, 0).result()
+
+    def _merge_runs(self, k: int):
+        """Writer thread: merge runs k.. (the tail of the holder files) into one."""
+        if len(self.blocks) - k < 2:
+            return
+        postings = self._postings.view()
+
+        def run(first, n):
+            for i in range(first, first + n):
+                yield POSTING.unpack_from(postings, i * POSTING.size)
+
+        tmp = f"{self.prefix}.hidx.tmp"
+        with open(tmp, "wb") as out:
+            chunk = []
+            for posting in heapq.merge(*(run(f, n) for (f, n) in self.blocks[k:])):
+                chunk.append(POSTING.pack(*posting))
+                if len(chunk) >= 65536:
+                    out.write(b"".join(chunk))
+                    chunk = []
+            out.write(b"".join(chunk))
+        first = self.blocks[k][0]
+        total = sum(n for (_, n) in self.blocks[k:])
+        self._postings.close()
+        # drop the runs' blocks first: until the merged run's block is
+        # written, _recover rebuilds their postings from the log
+        self._hblk.truncate(k * BLOCK.size)
+        self._hblk.flush()
+        self._hidx.truncate(first * POSTING.size)
+        with open(tmp, "rb") as f:
+            while True:
+                data = f.read(1 << 20)
+                if not data:
+                    break
+                self._hidx.write(data)
+        self._hidx.flush()
+        os.remove(tmp)
+        self._hblk.write(BLOCK.pack(first, total))
+        self._hblk.flush()
+        self.blocks[k:] = [(first, total)]
+
+    def close(self):
+        self.sync()
+        self._writer.shutdown()
+        for f in (self._log, self._idx, self._hidx, self._hblk):
+            f.close()
+        for m in (self._index, self._postings, self._data):
+            m.close()
+
+    # --------------------------------------------------------------- queries
+
+    def _timestamp(self, seq: int) -> float:
+        with open(f"{self.prefix}.idx", "rb") as f:
+            f.seek(seq * INDEX_ENTRY.size)
+            return INDEX_ENTRY.unpack(f.read(INDEX_ENTRY.size))[0]
+
+    def read(self, seq: int) -> dict:
+        """Record number `seq` (in append order)."""
+        self.sync()
+        (_, offset) = INDEX_ENTRY.unpack_from(self._index.view(), seq * INDEX_ENTRY.size)
+        data = self._data.view()
+        (length, timestamp, verified) = RECORD_HEADER.unpack_from(data, offset)
+        start = offset + RECORD_HEADER.size
+        record = json.loads(data[start : start + length])
+        record["timestamp"] = timestamp
+        record["verified"] = bool(verified)
+        return record
+
+    def _first_at(self, timestamp: float) -> int:
+        index = self._index.view()
+        (lo, hi) = (0, self.count)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if INDEX_ENTRY.unpack_from(index, mid * INDEX_ENTRY.size)[0] < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def by_time(self, start: float, end: float):
+        """Records with start <= timestamp < end, oldest first."""
+        self.sync()
+        if not self.count:
+            return
+        for seq in range(self._first_at(start), self._first_at(end)):
+            yield self.read(seq)
+
+    def by_holder(self, connection_id: str) -> list:
+        """All records for a holder's connection, oldest first."""
+        self.sync()
+        if not self.count:
+            return []
+        key = holder_hash(connection_id)
+        postings = self._postings.view()
+        seqs = []
+        for (first, n) in self.blocks:
+            (lo, hi) = (first, first + n)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if POSTING.unpack_from(postings, mid * POSTING.size)[0] < key:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            while lo < first + n:
+                (h, seq) = POSTING.unpack_from(postings, lo * POSTING.size)
+                if h != key:
+                    break
+                if seq < self.count:
+                    seqs.append(seq)
+                lo += 1
+        records = (self.read(seq) for seq in sorted(seqs))
+        # a 64-bit hash can collide; check the stored connection id
+        return [r for r in records if r["connection_id"] == connection_id]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the audit log.")
+    parser.add_argument("--prefix", type=str, default="/tmp/audit-bench")
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--holders", type=int, default=10_000)
+    args = parser.parse_args()
+
+    for ext in ("log", "idx", "hidx", "hblk"):
+        if os.path.exists(f"{args.prefix}.{ext}"):
+            os.remove(f"{args.prefix}.{ext}")
+    audit = AuditLog(args.prefix, batch_size=50_000)
+    revealed = {"pseudonym": "userA", "fabricID": "x509::/CN=userA", "ethAddress": "0x0"}
+    t0 = 1_700_000_000.0
+    start = time.perf_counter()
+    for i in range(args.records):
+        audit.append(
+            f"pres-{i}", f"conn-{i % args.holders}", "Proof of CBDC Bridge Access",
+            True, revealed, t0 + i * 0.001,
+        )
+    audit.sync()
+    write_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    holder = audit.by_holder("conn-42")
+    holder_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    # one second of records from the middle of the log
+    middle = t0 + args.records * 0.0005
+    window = list(audit.by_time(middle, middle + 1.0))
+    time_ms = (time.perf_counter() - start) * 1000
+    audit.compact()
+    start = time.perf_counter()
+    assert len(audit.by_holder("conn-42")) == len(holder)
+    compact_ms = (time.perf_counter() - start) * 1000
+    audit.close()
+    json.dump(
+        {
+            "records": args.records,
+            "appends_per_second": round(args.records / write_s),
+            "holder_lookup_ms": round(holder_ms, 2),
+            "holder_records": len(holder),
+            "holder_lookup_compacted_ms": round(compact_ms, 2),
+            "time_range_ms": round(time_ms, 2),
+            "time_range_records": len(window),
+        },
+        sys.stdout,
+    )
+    print()
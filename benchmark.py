@@ -0,0 +1,212 @@
+"""
+Performance regression suite helpers.
+
+A scenario is an async operation run `iterations` times with at most
+`concurrency` in flight; its result records throughput, latency percentiles
+and errors. Results are written as JSON and compared against a stored
+baseline: a scenario regresses when its throughput drops, or its p95 latency
+grows, by more than the tolerance, or when it has more errors than before.
+
+The agent scenarios (connection, issuance, proof) are run by `test_main` in
+agent_container.py. The bridge scenario runs against the local Fabric and
+EVM stand-ins and needs no agents:
+
+    python benchmark.py --iterations 5000 --concurrency 50 --baseline base.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+
+
+def _pct(latencies: list, p: float):
+    if not latencies:
+        return None
+    return round(latencies[int(p * (len(latencies) - 1))] * 1000, 3)
+
+
+async def run_scenario(
+    name: str, op, iterations: int, concurrency: int = 1, **extra
+) -> dict:
+    """Run `await op(i)` for each iteration, `concurrency` at a time."""
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+    latencies = []
+    errors = []
+
+    async def run_one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await op(i)
+            except Exception as err:
+                errors.append(repr(err))
+                return
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run_one(i) for i in range(iterations)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    result = {
+        "scenario": name,
+        "iterations": iterations,
+        "concurrency": concurrency,
+        "errors": len(errors),
+        "seconds": round(elapsed, 3),
+        "throughput_per_sec": round(len(latencies) / elapsed, 2) if elapsed else 0,
+        "latency_ms_p50": _pct(latencies, 0.5),
+        "latency_ms_p95": _pct(latencies, 0.95),
+        "latency_ms_p99": _pct(latencies, 0.99),
+        "latency_ms_max": _pct(latencies, 1.0),
+    }
+    if errors:
+        result["first_error"] = errors[0]
+    result.update(extra)
+    return result
+
+
+def compare_to_baseline(results: list, baseline: list, tolerance: float) -> list:
+    """Describe every scenario that regressed beyond `tolerance` (a fraction)."""
+    base = {r["scenario"]: r for r in baseline}
+    regressions = []
+    for result in results:
+        ref = base.get(result["scenario"])
+        if not ref:
+            continue
+        name = result["scenario"]
+        if result["throughput_per_sec"] < ref["throughput_per_sec"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput {result['throughput_per_sec']}/s "
+                f"< baseline {ref['throughput_per_sec']}/s"
+            )
+        if (
+            result["latency_ms_p95"] is not None
+            and ref.get("latency_ms_p95") is not None
+            and result["latency_ms_p95"] > ref["latency_ms_p95"] * (1 + tolerance)
+        ):
+            regressions.append(
+                f"{name}: p95 latency {result['latency_ms_p95']}ms "
+                f"> baseline {ref['latency_ms_p95']}ms"
+            )
+        if result["errors"] > ref["errors"]:
+            regressions.append(
+                f"{name}: {result['errors']} errors > baseline {ref['errors']}"
+            )
+    return regressions
+
+
+def report(
+    results: list,
+    results_path: str = None,
+    baseline_path: str = None,
+    tolerance: float = 0.2,
+    update_baseline: bool = False,
+) -> list:
+    """Print/write the results, compare them to the baseline; returns regressions."""
+    document = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "results": results,
+    }
+    output = json.dumps(document, indent=2)
+    if results_path:
+        with open(results_path, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    regressions = []
+    if baseline_path and os.path.exists(baseline_path) and not update_baseline:
+        with open(baseline_path) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare_to_baseline(results, baseline, tolerance)
+        for regression in regressions:
+            print("REGRESSION", regression, file=sys.stderr)
+    elif baseline_path:
+        with open(baseline_path, "w") as f:
+            f.write(output + "\n")
+    return regressions
+
+
+async def bridge_scenario(iterations: int, concurrency: int) -> dict:
+    """Client onboarding + Escrow on the Fabric stand-in, relayed to the EVM."""
+    from runners.address_mapping import AddressMappingMirror
+    from runners.fabric_sim import (
+        DEFAULT_CHANNEL,
+        DEFAULT_CONTRACT,
+        MINTER_MSP_ID,
+        FabricStandIn,
+        x509_id,
+    )
+    from runners.relay import EscrowRelay, EvmStandIn
+
+    identities = {"minter": (x509_id("minter"), MINTER_MSP_ID)}
+    for i in range(iterations):
+        identities[f"client{i}"] = (x509_id(f"client{i}"), MINTER_MSP_ID)
+    fabric = FabricStandIn(identities=identities)
+    model = fabric.models[(DEFAULT_CHANNEL, DEFAULT_CONTRACT)]
+    mirror = AddressMappingMirror()
+    model.block_listeners.append(lambda b, t, w: mirror.apply_block(b, w))
+    relay = EscrowRelay(mirror, EvmStandIn(block_time=0.005))
+    model.listeners.append(relay.on_event)
+
+    def run_transaction(method, params, keychain_ref):
+        return fabric.run_transaction(
+            {
+                "contractName": DEFAULT_CONTRACT,
+                "channelName": DEFAULT_CHANNEL,
+                "params": list(params),
+                "methodName": method,
+                "invocationType": "FabricContractInvocationType.SEND",
+                "signingCredential": {"keychainId": "", "keychainRef": keychain_ref},
+            }
+        )
+
+    run_transaction("Initialize", ("CBDC", "CBDC", "2"), "minter")
+    run_transaction("Mint", (iterations * 10,), "minter")
+
+    async def onboard_and_escrow(i):
+        client = f"client{i}"
+        run_transaction(
+            "appendAddressMapping", (identities[client][0], f"0x{i:040x}"), client
+        )
+        run_transaction("Transfer", (identities[client][0], 10), "minter")
+        run_transaction("Escrow", (10, f"escrow-{i}"), client)
+        # let the relay pick up the escrow
+        await asyncio.sleep(0)
+
+    await relay.start()
+    result = await run_scenario("bridge", onboard_and_escrow, iterations, concurrency)
+    await relay.stop()
+    result["relay"] = relay.stats()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Runs the stand-in (agent-less) benchmark scenarios."
+    )
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--results", type=str, help="Write JSON results here")
+    parser.add_argument("--baseline", type=str, help="Baseline results to compare")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument(
+        "--update-baseline", action="store_true", help="Store results as baseline"
+    )
+    args = parser.parse_args()
+
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    results = [
+        asyncio.get_event_loop().run_until_complete(
+            bridge_scenario(args.iterations, args.concurrency)
+        )
+    ]
+    regressions = report(
+        results, args.results, args.baseline, args.tolerance, args.update_baseline
+    )
+    sys.exit(1 if regressions else 0)
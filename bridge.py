@@ -1,26 +1,42 @@
 import asyncio
-import asyncpg
-import datetime
 import json
 import logging
 import os
 import sys
-import requests
-import json
+import time
 from datetime import date
 from uuid import uuid4
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # noqa
 
-from runners.agent_container import (  # noqa:E402
-    arg_parser,
-    create_agent_with_args,
-    AriesAgent,
+from runners.startup_profile import STARTUP_PROFILE  # noqa:E402
+
+with STARTUP_PROFILE.phase("import runners.agent_container"):
+    from runners.agent_container import (  # noqa:E402
+        arg_parser,
+        create_agent_with_args,
+        AriesAgent,
+    )
+with STARTUP_PROFILE.phase("import bridge modules"):
+    from runners.address_mapping import AddressMappingMirror  # noqa:E402
+    from runners.admission import AdmissionController  # noqa:E402
+    from runners.fabric_events import FabricBlockSource  # noqa:E402
+    from runners.fabric_gateway import CommitUnknown, FabricSubmitter  # noqa:E402
+    from runners.fabric_routing import FabricRouter  # noqa:E402
+    from runners.ledger_cache import LedgerCache, restriction_ids  # noqa:E402
+    from runners.proof_policy import BRIDGE_PROOF_POLICY, ProofPolicy  # noqa:E402
+    from runners.signing import SigningContextCache  # noqa:E402
+from runners.logbuffer import LOG, log_msg, log_status  # noqa:E402
+from runners.metrics import (  # noqa:E402
+    EXCHANGES,
+    FABRIC_SUBMISSIONS,
+    PROOF_VERIFICATION,
+    QUEUE_DEPTH,
 )
+from runners.records import PresentationRecord  # noqa:E402
+from runners.tracing import TRACER  # noqa:E402
 from runners.support.utils import (  # noqa:E402
     check_requires,
-    log_msg,
-    log_status,
     log_timer,
     prompt,
     prompt_loop,
@@ -43,6 +59,42 @@ CRED_PREVIEW_TYPE = "https://didcomm.org/issue-credential/2.0/credential-preview
 SELF_ATTESTED = os.getenv("SELF_ATTESTED")
 TAILS_FILE_COUNT = int(os.getenv("TAILS_FILE_COUNT", 100))
 
+FABRIC_GATEWAY_URL = os.getenv(
+    "FABRIC_GATEWAY_URL", "http://gateway.docker.internal:4000"
+)
+RUN_TRANSACTION_URL = (
+    FABRIC_GATEWAY_URL
+    + "/api/v1/plugins/@hyperledger/cactus-plugin-ledger-connector-fabric/run-transaction"
+)
+GET_BLOCK_URL = (
+    FABRIC_GATEWAY_URL
+    + "/api/v1/plugins/@hyperledger/cactus-plugin-ledger-connector-fabric/get-block"
+)
+FABRIC_KEYCHAIN_ID = os.getenv(
+    "FABRIC_KEYCHAIN_ID", "df05d3c2-ddd5-4074-aae3-526564217459"
+)
+# keychain entry of FABRIC_BRIDGE_IDENTITY, the only identity allowed to Refund
+FABRIC_BRIDGE_KEYCHAIN_REF = os.getenv("FABRIC_BRIDGE_KEYCHAIN_REF", "bridge")
+# admission control: new proof workflows per second (0: unlimited) and burst,
+# the longest a client may wait for admission, and the in-flight verifications
+BRIDGE_ADMISSION_RATE = float(os.getenv("BRIDGE_ADMISSION_RATE", 0))
+BRIDGE_ADMISSION_BURST = int(os.getenv("BRIDGE_ADMISSION_BURST", 10))
+BRIDGE_ADMISSION_MAX_WAIT = float(os.getenv("BRIDGE_ADMISSION_MAX_WAIT", 5.0))
+BRIDGE_MAX_VERIFICATIONS = int(os.getenv("BRIDGE_MAX_VERIFICATIONS", 8))
+# Fabric transactions kept in flight at the gateway
+BRIDGE_MAX_SUBMISSIONS = int(os.getenv("BRIDGE_MAX_SUBMISSIONS", 16))
+# path prefix of the audit log of verified presentations, unset to disable
+BRIDGE_AUDIT_LOG = os.getenv("BRIDGE_AUDIT_LOG")
+# file persisting resolved schemas/cred defs, empty to keep them in memory only
+BRIDGE_LEDGER_CACHE = os.getenv("BRIDGE_LEDGER_CACHE", "bridge-ledger-cache.json")
+# relay Escrow events read from the ledger as mints (off by default: it reads
+# from the block checkpoint, block 0 without one, and relies on the Ethereum
+# side's per-escrow double-mint check for escrows relayed before a restart);
+# with several workers, turn it on in one of them only
+BRIDGE_ESCROW_RELAY = os.getenv("BRIDGE_ESCROW_RELAY", "0") not in ("", "0")
+# file keeping the last Fabric block read per channel, empty to start at 0
+BRIDGE_BLOCK_CHECKPOINT = os.getenv("BRIDGE_BLOCK_CHECKPOINT", "bridge-blocks.json")
+
 logging.basicConfig(level=logging.WARNING)
 LOGGER = logging.getLogger(__name__)
 
@@ -69,6 +121,68 @@ class BridgeAgent(AriesAgent):
         self.cred_state = {}
         self.cred_attrs = {}
         self.client_session: ClientSession = ClientSession()
+        # client pseudonym -> checked keychain entry to sign its submissions with
+        self.signing_contexts = SigningContextCache(
+            FABRIC_KEYCHAIN_ID, self.client_session
+        )
+        # pipelined run-transaction SENDs, each awaited until committed
+        self.fabric = FabricSubmitter(
+            self.client_session, RUN_TRANSACTION_URL, BRIDGE_MAX_SUBMISSIONS
+        )
+        # which channel/contract each client's mapping and balance live on
+        self.router = FabricRouter()
+        # local copy of the chaincode's fabricID -> ethAddress mappings
+        self.address_mirror = AddressMappingMirror(
+            loader=self.find_mapping, order=self.router.candidates
+        )
+        # relays Escrow events (see on_event) to the Ethereum side as mints
+        self.escrow_relay = None
+        if BRIDGE_ESCROW_RELAY:
+            from runners.relay import EscrowRelay, EvmStandIn
+
+            self.escrow_relay = EscrowRelay(self.address_mirror, EvmStandIn())
+            QUEUE_DEPTH.set_function(self.escrow_relay.queue.qsize, "escrow_relay")
+        # chaincode events and write sets of every shard's channel
+        self.block_source = FabricBlockSource(
+            self.client_session,
+            GET_BLOCK_URL,
+            self.router.shards,
+            {
+                "keychainId": FABRIC_KEYCHAIN_ID,
+                "keychainRef": FABRIC_BRIDGE_KEYCHAIN_REF,
+            },
+            checkpoint_path=BRIDGE_BLOCK_CHECKPOINT or None,
+        )
+        # keeps the mirror current with every mapping written on the ledger
+        self.block_source.block_listeners.append(
+            lambda block_number, tx_id, writes, shard: self.address_mirror.apply_block(
+                block_number, writes, shard
+            )
+        )
+        if self.escrow_relay:
+            self.block_source.listeners.append(self.escrow_relay.on_event)
+        self.audit_log = None
+        if BRIDGE_AUDIT_LOG:
+            from runners.audit_log import AuditLog
+
+            self.audit_log = AuditLog(BRIDGE_AUDIT_LOG)
+        self.ledger_cache = LedgerCache(self, BRIDGE_LEDGER_CACHE or None)
+        # set when running as one of several workers (see workers.py)
+        self.workers = None  # workers.WorkerGroup
+        self.onboarding = set()  # connections with a mapping being committed
+        # proof steps, and the actions their on_verified can name
+        self.policy = ProofPolicy.load(BRIDGE_PROOF_POLICY)
+        self.actions = {"fabric": self.onboard_client}
+        for step in self.policy.steps.values():
+            if step.action and step.action not in self.actions:
+                raise Exception(f"Unknown action in proof policy: {step.action}")
+        self.admission = AdmissionController(
+            rate=BRIDGE_ADMISSION_RATE,
+            burst=BRIDGE_ADMISSION_BURST,
+            max_wait=BRIDGE_ADMISSION_MAX_WAIT,
+            max_verifications=BRIDGE_MAX_VERIFICATIONS,
+            lanes=self.policy.lanes(),
+        )
 
     async def detect_connection(self):
         await self._connection_ready
@@ -82,6 +196,8 @@ class BridgeAgent(AriesAgent):
         pass
 
     async def handle_connections(self, message):
+        if self.track_pooled_connection(message):
+            return
         print(
             self.ident, "handle_connections", message["state"], message["rfc23_state"]
         )
@@ -125,227 +241,355 @@ class BridgeAgent(AriesAgent):
         self.log(f"Presentation: state = {state}, pres_ex_id = {pres_ex_id}")
 
         if state == "presentation-received":
+            if self.workers and message.get("connection_id"):
+                # handled by the worker owning the connection
+                await self.workers.dispatch("present_proof_v2_0", message)
+            else:
+                await self.process_presentation(message)
+
+    async def process_event(self, topic, payload):
+        """Handle a workflow event routed to this worker."""
+        if topic == "workflow_start":
+            await self.request_proofs(payload["connection_id"])
+        elif topic == "present_proof_v2_0":
+            await self.process_presentation(payload)
+
+    async def drain(self, timeout: float) -> bool:
+        """Drain in-flight proofs, then the worker group, block source, relay,
+        Fabric submissions, audit log and ledger cache, all within `timeout`.
+
+        Each stage gets the time left; what is left when it runs out is
+        cancelled.
+        """
+        deadline = time.monotonic() + timeout
+
+        def remaining():
+            return max(0.0, deadline - time.monotonic())
+
+        drained = await super().drain(timeout)
+        if self.workers:
+            await self.workers.stop(remaining())
+        await self.block_source.stop()
+        if self.escrow_relay:
+            await self.escrow_relay.stop(remaining())
+        await self.fabric.stop(remaining())
+        if self.audit_log:
+            self.audit_log.close()
+        self.ledger_cache.save()
+        return drained
+
+    async def start_workflow(self, connection_id):
+        """Start the proof chain for a newly connected client."""
+        if self.workers:
+            await self.workers.dispatch(
+                "workflow_start", {"connection_id": connection_id}
+            )
+        else:
+            await self.request_proofs(connection_id)
+
+    def save_stage(self, connection_id, stage, data=None):
+        if self.workers and connection_id:
+            self.workers.save(connection_id, stage, data)
+
+    async def resume_workflow(self, connection_id, stage, data):
+        """Continue a workflow taken over from a lost worker."""
+        self.log(f"Resuming workflow for {connection_id} at stage {stage}")
+        if stage in self.policy.steps:
+            await self.request_step(connection_id, stage)
+        elif stage == "fabric":
+            await self.onboard_client(connection_id, **data)
+
+    async def process_presentation(self, message):
+        pres_ex_id = message["pres_ex_id"]
+        connection_id = message.get("connection_id")
+        if message["state"] == "presentation-received":
             log_status("#27 Process the proof provided by X")
             log_status("#28 Check if proof is valid")
-            proof = await self.admin_POST(
-                f"/present-proof-2.0/records/{pres_ex_id}/verify-presentation"
-            )
-            self.log("Proof = ", proof["verified"])
-
-            # if presentation is a degree schema,
-            # check values received
-            pres_req = message["by_format"]["pres_request"]["indy"]
-            pres = message["by_format"]["pres"]["indy"]
-            is_proof_of_identity = (
-                pres_req["name"] == "Proof of Identity"
-            )
-            is_proof_of_cbdc_access = (
-                pres_req["name"] == "Proof of CBDC Access"
+            by_format = message.get("by_format") or {}
+            name = ((by_format.get("pres_request") or {}).get("indy") or {}).get("name")
+            step = self.policy.by_name.get(name)
+            # keep only the fields used below, not the whole exchange record
+            record = PresentationRecord.from_exchange(
+                message, referents=step.referents if step else None
             )
-            is_proof_of_bridge_access = (
-                pres_req["name"] == "Proof of CBDC Bridge Access"
-            )
-            if is_proof_of_identity:
-                self.reveal_presentation(pres_req, pres)
-                
-                if(proof["verified"]=="true"):
-                   await self.request_cbdc_proof()
-                               
-            elif is_proof_of_cbdc_access:
-                self.reveal_presentation(pres_req, pres)
-                
-                if(proof["verified"]=="true"):
-                    await self.request_bridge_proof()
-                
-            elif is_proof_of_bridge_access:
-                self.reveal_presentation(pres_req, pres)
-                if(proof["verified"]=="true"):
-                    for (referent, attr_spec) in pres_req["requested_attributes"].items():
-                        if(attr_spec['name']=="pseudonym"):
-                            user =  f"{pres['requested_proof']['revealed_attrs'][referent]['raw']}"
-
-                        if(attr_spec['name']=="fabricID"):
-                            fabricID =  f"{pres['requested_proof']['revealed_attrs'][referent]['raw']}"
-
-                        if(attr_spec['name']=="ethAddress"):
-                            ethAddress =  f"{pres['requested_proof']['revealed_attrs'][referent]['raw']}"
-                    await self.append_request(user,fabricID,ethAddress)
+            lane = step.key if step else self.policy.start
+            async with self.admission.verifications.slot(lane):
+                with PROOF_VERIFICATION.time(record.name):
+                    proof = await self.admin_POST(
+                        f"/present-proof-2.0/records/{pres_ex_id}/verify-presentation"
+                    )
+            record.verified = proof["verified"]
+            self.ledger_cache.learn(record.identifiers)
+            if self.audit_log:
+                self.audit_log.append_record(
+                    record, audited=step.audited if step else ()
+                )
+            EXCHANGES.inc("present-proof-2.0", "verified")
+            self.log("Proof = ", record.verified)
 
-                
-                # TODO placeholder for the next step
-            else:
+            if not step:
                 # in case there are any other kinds of proofs received
-                self.log("#28.1 Received ", pres_req["name"])
+                self.log("#28.1 Received ", record.name)
+                return
+            self.reveal_presentation(record)
+            if record.verified != "true":
+                return
+            if step.next_step:
+                await self.request_step(connection_id, step.next_step)
+            elif step.action:
+                await self.actions[step.action](
+                    connection_id, **step.args_from(record.revealed)
+                )
 
-    def reveal_presentation(self, pres_req, pres):
-        log_status("#28.1 Received " +pres_req["name"]+", check claims")
-        for (referent, attr_spec) in pres_req["requested_attributes"].items():
-            if referent in pres['requested_proof']['revealed_attrs']:
-                self.log(
-                            f"{attr_spec['name']}: "
-                            f"{pres['requested_proof']['revealed_attrs'][referent]['raw']}"
-                        )
+    async def onboard_client(self, connection_id, user, fabricID, ethAddress):
+        """Map the client's fabricID to its ethAddress on the Fabric side.
+
+        appendAddressMapping resets the client's balance, so a resumed
+        workflow or a redelivered event must not commit the mapping twice:
+        it is skipped if the workflow is done or the mapping is on the ledger.
+        """
+        if connection_id in self.onboarding:
+            # a resumed workflow and its redelivered event
+            return
+        if self.workers and connection_id:
+            if self.workers.is_done(connection_id):
+                self.log(f"Onboarding of {connection_id} is already done")
+                return
+        self.save_stage(
+            connection_id,
+            "fabric",
+            {"user": user, "fabricID": fabricID, "ethAddress": ethAddress},
+        )
+        self.onboarding.add(connection_id)
+        try:
+            (shard, mapped_to) = await self.address_mirror.locate(fabricID)
+            if mapped_to == ethAddress:
+                self.log(f"{fabricID} is already mapped to {ethAddress}")
+                mapped = True
+            else:
+                # an existing mapping is replaced where it is, even if the
+                # client now hashes to another shard, so its balance stays
+                mapped = await self.append_request(user, fabricID, ethAddress, shard)
+        finally:
+            self.onboarding.discard(connection_id)
+        if not mapped:
+            # left at the "fabric" stage, resumed by a worker taking it over
+            log_msg(f"Onboarding of {connection_id} failed: {fabricID} is not mapped")
+            TRACER.end_trace(connection_id, outcome="error")
+            return
+        if self.workers and connection_id:
+            self.workers.finish(connection_id)
+        if connection_id and len(self.router.shards) > 1:
+            try:
+                await self.announce_shard(connection_id, fabricID)
+            except Exception as err:
+                # the client is onboarded, it can still ask for its shard
+                log_msg(f"Could not send {connection_id} its shard: {err}")
+        # the Fabric transaction is the last stage of the onboarding
+        TRACER.end_trace(connection_id)
+
+    def reveal_presentation(self, record: PresentationRecord):
+        if not LOG.enabled("agent"):
+            return
+        log_status("#28.1 Received " +record.name+", check claims")
+        for name in record.requested:
+            if name in record.revealed:
+                self.log(f"{name}: {record.revealed[name]}")
             else:
                 self.log(
-                            f"{attr_spec['name']}: "
+                            f"{name}: "
                             "(attribute not revealed)"
                         )
-        for id_spec in pres["identifiers"]:
+        for (schema_id, cred_def_id) in record.identifiers:
                     # just print out the schema/cred def id's of presented claims
-            self.log(f"schema_id: {id_spec['schema_id']}")
-            self.log(f"cred_def_id {id_spec['cred_def_id']}")
+            self.log(f"schema_id: {schema_id}")
+            self.log(f"cred_def_id {cred_def_id}")
 
     async def handle_basicmessages(self, message):
         self.log("Received message:", message["content"])
 
-    async def append_request(self,user,fabricID,ethAddress):
+    async def append_request(self,user,fabricID,ethAddress,shard=None):
+        """Commit appendAddressMapping on `shard` (default: the client's
+        hashed shard); returns whether it was committed."""
+        context = await self.signing_contexts.get(user)
+        if not context:
+            log_msg(f"No valid keychain entry for {user}, not submitting")
+            FABRIC_SUBMISSIONS.observe(0.0, "appendAddressMapping", "rejected")
+            return False
+        if shard is None:
+            shard = self.router.shard_for(fabricID)
         post_data = {
-            "contractName": "cbdc",
-            "channelName": "mychannel",
+            "contractName": shard.contract,
+            "channelName": shard.channel,
             "params": [f"{fabricID}",f"{ethAddress}"],
             "methodName": "appendAddressMapping",
             "invocationType": "FabricContractInvocationType.SEND",
-            "signingCredential": {
-                "keychainId": "df05d3c2-ddd5-4074-aae3-526564217459",
-                "keychainRef": f"{user}"
-            }}
+            "signingCredential": context.credential,
+        }
         self.log(post_data)
+        span = TRACER.span("fabric appendAddressMapping", fabricID=fabricID)
         try:
-            headers = {"Content-Type": "application/json; charset=utf-8"}
-            r = requests.post(
-                url = "http://gateway.docker.internal:4000/api/v1/plugins/@hyperledger/cactus-plugin-ledger-connector-fabric/run-transaction",
-                headers=headers,
-                json = post_data
-                )
-            print(r.text)
-            r.raise_for_status()
-        except requests.exceptions as err:
+            result = await self.fabric.commit(post_data, span.traceparent)
+        except CommitUnknown as err:
+            # not resubmitted: the mapping check finds it if it did commit
             self.log(err)
-
-
-
-            
-    async def request_proofs(self):
-        await self.request_identity_proof()
-
-    async def request_identity_proof(self):
-        age = 18
-        d = datetime.date.today()
-        birth_date = datetime.date(d.year - age, d.month, d.day)
-        birth_date_format = "%Y%m%d"
-
-        log_status("#20 Request proof of Identity from Client")
-        indentity_req_attrs = [
-                        {
-                            "name": "name",
-                            "restrictions": [{"schema_name": "identity schema"}]
-                        }
-                    ]
-        indentity_req_preds = [                # test zero-knowledge proofs
+            span.end(outcome="unknown")
+            return False
+        except Exception as err:
+            self.log(err)
+            if "keychain" in str(err).lower():
+                # check the entry again before the client's next submission
+                self.signing_contexts.revoke(user)
+            span.end(outcome="error")
+            return False
+        self.log("Committed appendAddressMapping:", result.get("transactionId"))
+        self.address_mirror.record_commit(fabricID, ethAddress, shard)
+        self.router.record_write(shard)
+        span.end(outcome="ok", transaction_id=result.get("transactionId"))
+        return True
+
+    async def find_mapping(self, fabricID):
+        """(shard, ethAddress) of the client's mapping on the ledger, or (None, None).
+
+        Shards are queried in the router's order until one holds the mapping.
+        """
+        for shard in self.router.candidates(fabricID):
+            eth_address = await self.query_shard(shard, fabricID)
+            if eth_address:
+                return (shard, eth_address)
+        return (None, None)
+
+    async def announce_shard(self, connection_id, fabricID):
+        """Tell an onboarded client which channel/contract holds its account.
+
+        Its Escrow (and the balance Refund credits) must be on that shard.
+        """
+        shard = self.address_mirror.shard_of(fabricID)
+        if not shard:
+            shard = self.router.shard_for(fabricID)
+        await self.admin_POST(
+            f"/connections/{connection_id}/send-message",
+            {
+                "content": json.dumps(
                     {
-                        "name": "birthdate_dateint",
-                        "p_type": "<=",
-                        "p_value": int(birth_date.strftime(birth_date_format)),
-                        "restrictions": [{"schema_name": "identity schema"}],
-                    }
-                ]
-        indentity_req_name = "Proof of Identity"
-        indentity_version = "1.0"
-        
-        await self.request_proof(indentity_req_attrs, indentity_req_preds, indentity_req_name, indentity_version)
-
-    async def request_cbdc_proof(self):
-                    log_status("#20 Request proof of CBDC Access from Client")
-                    req_attrs = [
-                        {
-                            "name": "credential_type",
-                            "restrictions": [
-                            {           
-                                "schema_name": "cbdc transacation license schema",
-                            }
-                            ]
-                        },
-                    ]
-                    req_preds = []
-                    req_name = "Proof of CBDC Access"
-                    version = "1.0"
-                    await self.request_proof(req_attrs, req_preds, req_name, version)
-
-    async def request_bridge_proof(self):
-                    log_status("#20 Request proof of Bridge Access from Client")
-                    req_attrs = [
-                        {
-                            "name": "credential_type",
-                            "restrictions": [
-                            {           
-                                "schema_name": "cbdc bridging license schema",
-                            }
-                            ]
-                        },
-                        {
-                            "name": "pseudonym",
-                            "restrictions": [
-                            {           
-                                "schema_name": "cbdc bridging license schema"                        }
-                            ]
-                        },
-                        {
-                            "name": "privateKey",
-                            "restrictions": [
-                            {           
-                                "schema_name": "cbdc bridging license schema"                        }
-                            ]
-                        },
-                        {
-                            "name": "fabricID",
-                            "restrictions": [
-                            {           
-                                "schema_name": "cbdc bridging license schema"                        }
-                            ]
-                        },
-                        {
-                            "name": "ethAddress",
-                            "restrictions": [
-                            {           
-                                "schema_name": "cbdc bridging license schema"                        }
-                            ]
-                        }
-                    ]
-                    req_preds = []
-                    req_name = "Proof of CBDC Bridge Access"
-                    version = "1.0"
-                    await self.request_proof(req_attrs, req_preds, req_name, version)           
-
-    async def request_proof(self, req_attrs, req_preds, req_name, version): 
-        indy_proof_request = {
-                        "name": req_name,
-                        "version": version,
-                        "requested_attributes": {
-                            f"0_{req_attr['name']}_uuid": req_attr
-                            for req_attr in req_attrs
-                        },
-                        "requested_predicates": {
-                            f"0_{req_pred['name']}_GE_uuid": req_pred
-                            for req_pred in req_preds
-                        }
+                        "fabricID": fabricID,
+                        "channelName": shard.channel,
+                        "contractName": shard.contract,
                     }
+                )
+            },
+        )
+
+    async def query_shard(self, shard, fabricID):
+        post_data = {
+            "contractName": shard.contract,
+            "channelName": shard.channel,
+            "params": [fabricID],
+            "methodName": "getAddressMapping",
+            "invocationType": "FabricContractInvocationType.CALL",
+            "signingCredential": {
+                "keychainId": FABRIC_KEYCHAIN_ID,
+                "keychainRef": FABRIC_BRIDGE_KEYCHAIN_REF,
+            },
+        }
+        span = TRACER.span(
+            "fabric getAddressMapping", fabricID=fabricID, channel=shard.channel
+        )
+        headers = {"traceparent": span.traceparent} if span.traceparent else None
+        try:
+            async with self.client_session.post(
+                RUN_TRANSACTION_URL, json=post_data, headers=headers
+            ) as resp:
+                span.end(status=resp.status)
+                if resp.status != 200:
+                    return None
+                result = await resp.json()
+                return result.get("functionOutput") or None
+        except ClientError as err:
+            span.end(error=repr(err))
+            self.log(err)
+            return None
+
+    async def refund_request(self, fabricID, value, ethAddress):
+        """Bridge tokens back to `fabricID`, pre-validated against the mirror."""
+        reason = await self.address_mirror.validate_refund(fabricID, ethAddress)
+        if reason:
+            self.log(f"Refund to {fabricID} rejected locally: {reason}")
+            FABRIC_SUBMISSIONS.observe(0.0, "Refund", "rejected")
+            return False
+
+        # Refund runs on the shard holding the client's mapping, as the mirror
+        # (fed from every shard's blocks) knows it; the ledger is queried only
+        # if the mirror can't tell
+        shard = self.address_mirror.shard_of(fabricID)
+        if not shard:
+            (shard, _) = await self.find_mapping(fabricID)
+        if not shard:
+            self.log(f"Refund to {fabricID} rejected: no mapping on any shard")
+            FABRIC_SUBMISSIONS.observe(0.0, "Refund", "rejected")
+            return False
+        post_data = {
+            "contractName": shard.contract,
+            "channelName": shard.channel,
+            "params": [fabricID, str(value), ethAddress],
+            "methodName": "Refund",
+            "invocationType": "FabricContractInvocationType.SEND",
+            "signingCredential": {
+                "keychainId": FABRIC_KEYCHAIN_ID,
+                "keychainRef": FABRIC_BRIDGE_KEYCHAIN_REF,
+            },
+        }
+        try:
+            result = await self.fabric.commit(post_data)
+        except CommitUnknown as err:
+            # not resubmitted, that could credit the client twice
+            self.log(
+                f"Refund to {fabricID} may have committed, not resubmitted;"
+                f" fabric.status({err.client_id!r}) tells once it is known"
+            )
+            return False
+        except Exception as err:
+            self.log(err)
+            return False
+        self.log("Committed Refund:", result.get("transactionId"))
+        return True
+
+    async def request_proofs(self, connection_id=None):
+        if self.draining:
+            self.log(
+                "Bridge is shutting down, not starting proofs for connection",
+                connection_id or self.connection_id,
+            )
+            TRACER.end_trace(connection_id, admitted=False)
+            return
+        if not await self.admission.admit():
+            self.log(
+                "Bridge is at capacity, not starting proofs for connection",
+                connection_id or self.connection_id,
+            )
+            TRACER.end_trace(connection_id, admitted=False)
+            return
+        await self.request_step(connection_id, self.policy.start)
+
+    async def request_step(self, connection_id, key):
+        """Send the proof request of a policy step."""
+        step = self.policy.steps[key]
+        log_status(f"#20 Request {step.name} from Client")
+        self.save_stage(connection_id, key)
         proof_request_web_request = {
-                        "connection_id": self.connection_id,
-                        "presentation_request": {"indy": indy_proof_request},
-                    }
-                    # this sends the request to our agent, which forwards it to Client
-                    # (based on the connection_id)
+            "connection_id": connection_id or self.connection_id,
+            "presentation_request": {"indy": step.proof_request()},
+        }
+        # this sends the request to our agent, which forwards it to Client
+        # (based on the connection_id)
         await self.admin_POST(
-                        "/present-proof-2.0/send-request",
-                        proof_request_web_request
-                    )
-
-
-
+            "/present-proof-2.0/send-request", proof_request_web_request
+        )
 
 
 async def main(args):
-    bridge_agent = await create_agent_with_args(args, ident="bridge")
+    with STARTUP_PROFILE.phase("create agent container"):
+        bridge_agent = await create_agent_with_args(args, ident="bridge")
 
     try:
         log_status(
@@ -399,14 +643,47 @@ async def main(args):
                 revocation_registry_size=TAILS_FILE_COUNT,
             )
 
-        # generate an invitation for Alice
-        await bridge_agent.generate_invitation(display_qr=True, wait=True)
+        with STARTUP_PROFILE.phase("warm ledger cache"):
+            warmed = await agent.ledger_cache.warm(
+                [
+                    object_id
+                    for proof_request in agent.policy.proof_requests()
+                    for object_id in restriction_ids(proof_request)
+                ]
+            )
+        if warmed:
+            log_msg(f"Resolved {warmed} cached schemas/cred defs")
+        if agent.escrow_relay:
+            await agent.escrow_relay.start()
+        await agent.block_source.start()
+        if args.workers_db:
+            from runners.workers import SqliteWorkflowStore, WorkerGroup
+
+            agent.workers = WorkerGroup(
+                SqliteWorkflowStore(args.workers_db),
+                agent.process_event,
+                resume=agent.resume_workflow,
+                worker_id=args.worker_id,
+            )
+            await agent.workers.start()
+            log_msg("Joined bridge workers as", agent.workers.worker_id)
+
+        if bridge_agent.invitation_pool or bridge_agent.multi_use_invitations:
+            # every client that connects through the pool gets its own proof chain
+            await bridge_agent.generate_invitation_pool(
+                connection_workflow=agent.start_workflow, display_qr=True
+            )
+        else:
+            # generate an invitation for Alice
+            await bridge_agent.generate_invitation(display_qr=True, wait=True)
 
         options = (
             "    (1) Send Proof Requests\n"
             "    (2) Send Message\n"
+            "    (3) Bridge Back Tokens (Refund)\n"
+            "    (4) Revoke Client Signing Context\n"
             "    (X) Exit?\n"
-            "[1/2/X]"
+            "[1/2/3/4/X]"
         )
         async for option in prompt_loop(options):
             if option is not None:
@@ -428,23 +705,62 @@ async def main(args):
                     f"/connections/{agent.connection_id}/send-message", {"content": msg}
                 )
 
+            elif option == "3":
+                fabric_id = (await prompt("Enter client fabricID: ")).strip()
+                value = (await prompt("Enter amount: ")).strip()
+                eth_address = (await prompt("Enter client ethAddress: ")).strip()
+                await agent.refund_request(fabric_id, value, eth_address)
+
+            elif option == "4":
+                pseudonym = (await prompt("Enter client pseudonym: ")).strip()
+                if agent.signing_contexts.revoke(pseudonym):
+                    log_msg(f"Revoked signing context of {pseudonym}")
+                else:
+                    log_msg(f"No signing context cached for {pseudonym}")
+
         if bridge_agent.show_timing:
             timing = await bridge_agent.agent.fetch_timing()
             if timing:
                 for line in bridge_agent.agent.format_timing(timing):
                     log_msg(line)
+            if agent.escrow_relay:
+                log_msg("Escrow relay:", json.dumps(agent.escrow_relay.stats()))
+            log_msg("Fabric submissions:", json.dumps(agent.fabric.stats()))
+            log_msg("Fabric writes per shard:", json.dumps(agent.router.stats()))
+            log_msg(
+                "Signing contexts:",
+                f"{agent.signing_contexts.hits} hits,",
+                f"{agent.signing_contexts.misses} misses",
+            )
+            log_msg(
+                "Ledger cache:",
+                f"{agent.ledger_cache.warmed} schemas/cred defs resolved at startup",
+            )
 
     finally:
         terminated = await bridge_agent.terminate()
 
-    await asyncio.sleep(0.1)
-
     if not terminated:
         os._exit(1)
 
 
 if __name__ == "__main__":
     parser = arg_parser(ident="bridge", port=8050)
+    parser.add_argument(
+        "--workers-db",
+        type=str,
+        metavar="<path>",
+        help=(
+            "Run as one of several bridge workers sharing workflow state in "
+            "this SQLite file (the workers' agents must share one wallet)"
+        ),
+    )
+    parser.add_argument(
+        "--worker-id",
+        type=str,
+        metavar="<id>",
+        help="Stable id of this worker (default: random)",
+    )
     args = parser.parse_args()
 
     ENABLE_PYDEVD_PYCHARM = os.getenv("ENABLE_PYDEVD_PYCHARM", "").lower()
@@ -7,23 +7,24 @@ import time
 import datetime
 
 from aiohttp import ClientError
-from qrcode import QRCode
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from runners.agent_container import (  # noqa:E402
-    arg_parser,
-    create_agent_with_args,
-    AriesAgent,
-)
+from runners.startup_profile import STARTUP_PROFILE  # noqa:E402
+
+with STARTUP_PROFILE.phase("import runners.agent_container"):
+    from runners.agent_container import (  # noqa:E402
+        arg_parser,
+        create_agent_with_args,
+        AriesAgent,
+    )
 from runners.support.agent import (  # noqa:E402
     CRED_FORMAT_INDY,
     CRED_FORMAT_JSON_LD,
     SIG_TYPE_BLS,
 )
+from runners.logbuffer import log_msg, log_status  # noqa:E402
 from runners.support.utils import (  # noqa:E402
-    log_msg,
-    log_status,
     prompt,
     prompt_loop,
 )
@@ -73,7 +74,9 @@ class CentralBankAgent(AriesAgent):
     def connection_ready(self):
         return self._connection_ready.done() and self._connection_ready.result()
 
-    def generate_cbdc_credential_offer(self, aip, cred_type, cred_def_id, exchange_tracing):
+    def generate_cbdc_credential_offer(
+        self, aip, cred_type, cred_def_id, exchange_tracing, connection_id=None
+    ):
         age = 24
         d = datetime.date.today()
         birth_date = datetime.date(d.year - age, d.month, d.day)
@@ -95,7 +98,7 @@ class CentralBankAgent(AriesAgent):
                 ],
             }
         offer_request = {
-                "connection_id": self.connection_id,
+                "connection_id": connection_id or self.connection_id,
                 "cred_def_id": cred_def_id,
                 "comment": f"Offer on cred def id {cred_def_id}",
                 "auto_remove": True,
@@ -107,7 +110,9 @@ class CentralBankAgent(AriesAgent):
 
 
      
-    def generate_bridging_credential_offer(self, aip, cred_type, cred_def_id, exchange_tracing):
+    def generate_bridging_credential_offer(
+        self, aip, cred_type, cred_def_id, exchange_tracing, connection_id=None
+    ):
         age = 24
         d = datetime.date.today()
         birth_date = datetime.date(d.year - age, d.month, d.day)
@@ -134,7 +139,7 @@ class CentralBankAgent(AriesAgent):
                 ],
             }
         offer_request = {
-                "connection_id": self.connection_id,
+                "connection_id": connection_id or self.connection_id,
                 "cred_def_id": cred_def_id,
                 "comment": f"Offer on cred def id {cred_def_id}",
                 "auto_remove": True,
@@ -146,7 +151,8 @@ class CentralBankAgent(AriesAgent):
 
 
 async def main(args):
-    centralbank_agent = await create_agent_with_args(args, ident="centralbank")
+    with STARTUP_PROFILE.phase("create agent container"):
+        centralbank_agent = await create_agent_with_args(args, ident="centralbank")
 
     try:
         log_status(
@@ -197,20 +203,21 @@ async def main(args):
         ]
         if centralbank_agent.cred_type == CRED_FORMAT_INDY:
             centralbank_agent.public_did = True
+            # publish the license and bridging schemas/cred defs together
             await centralbank_agent.initialize(
                 the_agent=agent,
-                schema_name=centralbank_cbdc_schema_name,
-                schema_attrs=centralbank_cbdc_schema_attrs,
+                schemas=[
+                    (centralbank_cbdc_schema_name, centralbank_cbdc_schema_attrs),
+                    (
+                        centralbank_cbdc_bridging_schema_name,
+                        centralbank_cbdc_bridging_schema_attrs,
+                    ),
+                ],
                 create_endorser_agent=(centralbank_agent.endorser_role == "author")
                 if centralbank_agent.endorser_role
                 else False,
             )
-            # Create a bridging schema/cred def
-            centralbank_agent.bridging_cred_def_id = await centralbank_agent.agent.create_schema_and_cred_def(
-                centralbank_cbdc_bridging_schema_name,
-                centralbank_cbdc_bridging_schema_attrs,
-                centralbank_agent.revocation
-            )
+            centralbank_agent.bridging_cred_def_id = centralbank_agent.cred_def_ids[1]
 
             
             
@@ -220,12 +227,40 @@ async def main(args):
         else:
             raise Exception("Invalid credential type:" + centralbank_agent.cred_type)
 
-        # generate an invitation for Alice
-        await centralbank_agent.generate_invitation(
-            display_qr=True, reuse_connections=centralbank_agent.reuse_connections, wait=True
-        )
-
         exchange_tracing = False
+        if centralbank_agent.invitation_pool or centralbank_agent.multi_use_invitations:
+
+            async def offer_licence_credentials(connection_id):
+                # each pooled connection gets both licence credential offers
+                for offer_request in (
+                    agent.generate_cbdc_credential_offer(
+                        centralbank_agent.aip,
+                        centralbank_agent.cred_type,
+                        centralbank_agent.cred_def_id,
+                        exchange_tracing,
+                        connection_id=connection_id,
+                    ),
+                    agent.generate_bridging_credential_offer(
+                        centralbank_agent.aip,
+                        centralbank_agent.cred_type,
+                        centralbank_agent.bridging_cred_def_id,
+                        exchange_tracing,
+                        connection_id=connection_id,
+                    ),
+                ):
+                    await agent.admin_POST(
+                        "/issue-credential-2.0/send-offer", offer_request
+                    )
+
+            await centralbank_agent.generate_invitation_pool(
+                connection_workflow=offer_licence_credentials, display_qr=True
+            )
+        else:
+            # generate an invitation for Alice
+            await centralbank_agent.generate_invitation(
+                display_qr=True, reuse_connections=centralbank_agent.reuse_connections, wait=True
+            )
+
         options = (
             "    (1) Issue CBDC Transaction License Credential\n"
             "    (2) Issue CBDC Bridging License Credential\n"
@@ -369,12 +404,16 @@ async def main(args):
             if timing:
                 for line in centralbank_agent.agent.format_timing(timing):
                     log_msg(line)
+            revocation_states = centralbank_agent.agent.revocation_states
+            log_msg(
+                "Revocation states:",
+                f"{revocation_states.hits} hits,",
+                f"{revocation_states.misses} misses",
+            )
 
     finally:
         terminated = await centralbank_agent.terminate()
 
-    await asyncio.sleep(0.1)
-
     if not terminated:
         os._exit(1)
 
@@ -0,0 +1,116 @@
+"""
+Author side of ledger-write endorsement, batched.
+
+Each ledger write an author agent makes is created as an endorser
+transaction, and its endorsement request is queued; queued requests are
+sent to the endorser together, without waiting for earlier batches to be
+written, and every transaction's completion is tracked by its own future,
+resolved by the `endorse_transaction` webhooks once the (auto-written)
+transaction is acknowledged by the ledger.
+
+Authors started with --auto-request-endorsement have ACA-Py send each
+request itself as the transaction is created. Those transactions are only
+waited for: requesting them again would fail, as they are past the
+`transaction_created` state.
+
+Endorsers run ACA-Py with --auto-endorse-transactions, which endorses each
+request as it arrives, so a batch of requests is endorsed concurrently.
+
+Revocation registry writes (the registry definition and its initial entry,
+created by ACA-Py with --auto-create-revocation-transactions once a cred def
+is written) are not made through `write`. registry_active() waits for them
+by the `revocation_registry` webhook that marks a cred def's registry active.
+"""
+
+import asyncio
+
+from runners.exchanges import ExchangeWaiter
+
+
+class TransactionBatcher:
+    def __init__(self, agent, batch_size: int = 20, max_delay: float = 0.02):
+        self.agent = agent
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.written = ExchangeWaiter()  # transaction id -> acked webhook
+        self.registries = ExchangeWaiter()  # cred def id -> active registry
+        self.pending = []
+        self.batches = 0
+        self._flush_task = None
+
+    async def write(self, path: str, bodies: list, timeout: float = 120.0) -> list:
+        """POST each body to `path` as an endorsed ledger write.
+
+        Returns each transaction's meta_data context (holding, for example,
+        the schema_id or cred_def_id) once all of them are on the ledger.
+        """
+        conn_id = getattr(self.agent, "endorser_connection_id", None)
+        if not conn_id:
+            raise Exception("No connection to an endorser")
+        params = {"conn_id": conn_id, "create_transaction_for_endorser": "true"}
+        responses = await asyncio.gather(
+            *(self.agent.admin_POST(path, body, params=params) for body in bodies)
+        )
+        txns = [response["txn"] for response in responses]
+        await asyncio.gather(
+            *(
+                self.request(txn["transaction_id"], timeout)
+                if txn.get("state") == "transaction_created"
+                # already requested by ACA-Py (--auto-request-endorsement)
+                else self.wait(txn["transaction_id"], timeout)
+                for txn in txns
+            )
+        )
+        return [txn["meta_data"]["context"] for txn in txns]
+
+    async def request(self, transaction_id: str, timeout: float = 120.0) -> dict:
+        """Request endorsement in the next batch and wait until written."""
+        self.pending.append(transaction_id)
+        if not self._flush_task:
+            self._flush_task = asyncio.ensure_future(self._flush())
+        return await self.written.wait(transaction_id, timeout)
+
+    async def wait(self, transaction_id: str, timeout: float = 120.0) -> dict:
+        """Wait for a transaction ACA-Py requested endorsement for itself."""
+        return await self.written.wait(transaction_id, timeout)
+
+    async def registry_active(self, cred_def_id: str, timeout: float = 120.0) -> dict:
+        """Wait until the cred def's revocation registry is on the ledger."""
+        return await self.registries.wait(cred_def_id, timeout)
+
+    async def _flush(self):
+        # let writes started together join the same batch
+        await asyncio.sleep(self.max_delay)
+        try:
+            while self.pending:
+                batch = self.pending[: self.batch_size]
+                del self.pending[: self.batch_size]
+                self.batches += 1
+                results = await asyncio.gather(
+                    *(
+                        self.agent.admin_POST(
+                            "/transactions/create-request", {}, params={"tran_id": t}
+                        )
+                        for t in batch
+                    ),
+                    return_exceptions=True,
+                )
+                for (transaction_id, result) in zip(batch, results):
+                    if isinstance(result, Exception):
+                        self.written.resolve(transaction_id, error=result)
+        finally:
+            self._flush_task = None
+
+    def on_webhook(self, message: dict):
+        state = message.get("state")
+        transaction_id = message.get("transaction_id")
+        if state == "transaction_acked":
+            self.written.resolve(transaction_id, message)
+        elif state in ("transaction_refused", "transaction_cancelled"):
+            self.written.resolve(
+                transaction_id, error=Exception(f"Endorser transaction {state}")
+            )
+
+    def on_registry_webhook(self, message: dict):
+        if message.get("state") == "active":
+            self.registries.resolve(message.get("cred_def_id"), message)
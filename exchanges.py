@@ -0,0 +1,127 @@
+"""
+Futures for credential and presentation exchanges, keyed by exchange id.
+
+The webhook handlers `resolve` an exchange when its outcome is known (a
+credential stored, a presentation verified, a final state reached) and
+callers `wait` for it with a timeout, so many exchanges can be awaited at
+once. Outcomes that arrive before anyone waits are kept until collected,
+up to `keep` of them.
+"""
+
+import asyncio
+from collections import OrderedDict
+
+
+FINAL_STATES = ("done", "abandoned", "deleted")
+
+
+class ExchangeWaiter:
+    def __init__(self, keep: int = 256):
+        self.keep = keep
+        self.futures = {}
+        self.finished = OrderedDict()  # exchange id -> (result, error)
+        self._any = []  # futures waiting for whichever exchange comes next
+
+    def resolve(self, exchange_id: str, result=None, error: Exception = None):
+        """Hand an exchange's result (or error) to its waiter, or keep it."""
+        future = self.futures.pop(exchange_id, None)
+        while (not future or future.done()) and self._any:
+            future = self._any.pop(0)
+        if not future or future.done():
+            self.finished[exchange_id] = (result, error)
+            while len(self.finished) > self.keep:
+                self.finished.popitem(last=False)
+        elif error:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    async def wait(self, exchange_id: str = None, timeout: float = 30.0):
+        """Result of the exchange, or of the next one to finish if no id.
+
+        Raises the exchange's error, or asyncio.TimeoutError.
+        """
+        if exchange_id is None and self.finished:
+            (_, (result, error)) = self.finished.popitem(last=False)
+        elif exchange_id in self.finished:
+            (result, error) = self.finished.pop(exchange_id)
+        else:
+            future = asyncio.get_event_loop().create_future()
+            if exchange_id is None:
+                self._any.append(future)
+            else:
+                self.futures[exchange_id] = future
+            try:
+                return await asyncio.wait_for(future, timeout)
+            finally:
+                if self.futures.get(exchange_id) is future:
+                    del self.futures[exchange_id]
+                elif future in self._any:
+                    self._any.remove(future)
+        if error:
+            raise error
+        return result
+
+
+class ExchangeResult:
+    """How one exchange of a batch ended; `state` is None if it never did."""
+
+    __slots__ = ("index", "item", "exchange_id", "state", "payload", "error")
+
+    def __init__(self, index: int, item):
+        self.index = index
+        self.item = item
+        self.exchange_id = None
+        self.state = None
+        self.payload = None
+        self.error = None
+
+    def __repr__(self):
+        return (
+            f"ExchangeResult({self.index}, {self.exchange_id}, "
+            f"state={self.state}, error={self.error!r})"
+        )
+
+
+async def run_exchanges(items, start, wait, concurrency: int = 10, timeout=60.0):
+    """Start an exchange per item, yielding ExchangeResults as they finish.
+
+    `start(item)` sends the offer or request and returns its exchange record;
+    `wait(exchange_id, timeout)` returns the exchange's final webhook. At most
+    `concurrency` exchanges are in flight at once.
+    """
+    results = asyncio.Queue()
+    pending = iter(enumerate(items))
+
+    async def run_one(index, item):
+        result = ExchangeResult(index, item)
+        try:
+            record = await start(item)
+            if not record:
+                raise Exception("No exchange started")
+            result.exchange_id = record.get("cred_ex_id") or record.get("pres_ex_id")
+            result.payload = await wait(result.exchange_id, timeout)
+            result.state = result.payload["state"]
+        except Exception as e:
+            result.error = e
+        return result
+
+    async def worker():
+        try:
+            for (index, item) in pending:
+                results.put_nowait(await run_one(index, item))
+        finally:
+            results.put_nowait(None)
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(max(concurrency, 1))]
+    running = len(workers)
+    try:
+        while running:
+            result = await results.get()
+            if result is None:
+                running -= 1
+            else:
+                yield result
+    finally:
+        for task in workers:
+            task.cancel()
@@ -0,0 +1,184 @@
+"""
+Chaincode events and write sets read from the Fabric ledger.
+
+FabricBlockSource follows each channel in the bridge's shard list block by
+block through the Cactus Fabric connector's get-block endpoint. It hands the
+valid transactions of the shards' contracts to the same two kinds of
+listener the in-memory model (fabric_sim.TokenERC20Model) calls:
+
+  listeners         callable(event), event being a ChaincodeEvent
+  block_listeners   callable(block_number, tx_id, writes, shard), writes
+                    being the transaction's key -> value write set on the
+                    shard's contract (None: deleted); fabric_sim's model
+                    passes no shard, as it is one ledger
+
+The last block handled on each channel is saved to `checkpoint_path`, so a
+restarted bridge resumes after it instead of replaying the channel. A block
+is checkpointed only once every listener has handled it; if one raises, the
+block is handled again after `poll_interval`, so listeners must tolerate
+seeing a transaction twice.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from collections import namedtuple
+
+from aiohttp import ClientError
+
+from runners.fabric_routing import FabricShard
+
+
+FABRIC_BLOCK_POLL_INTERVAL = float(os.getenv("FABRIC_BLOCK_POLL_INTERVAL", 1.0))
+
+LOGGER = logging.getLogger(__name__)
+
+ChaincodeEvent = namedtuple(
+    "ChaincodeEvent", ["block_number", "tx_id", "event_name", "payload"]
+)
+
+# index of the per-transaction validation codes in the block metadata
+TRANSACTIONS_FILTER = 2
+VALID = 0
+
+
+def _bytes(value) -> bytes:
+    """A decoded block's Buffer ({"type": "Buffer", "data": [...]}) as bytes."""
+    if isinstance(value, dict):
+        return bytes(value.get("data") or ())
+    if isinstance(value, list):
+        return bytes(value)
+    if isinstance(value, str):
+        return value.encode()
+    return value or b""
+
+
+class FabricBlockSource:
+    def __init__(
+        self,
+        session,
+        url: str,
+        shards: list,
+        signing_credential: dict,
+        checkpoint_path: str = None,
+        poll_interval: float = FABRIC_BLOCK_POLL_INTERVAL,
+    ):
+        self.session = session
+        self.url = url
+        self.signing_credential = signing_credential
+        self.checkpoint_path = checkpoint_path
+        self.poll_interval = poll_interval
+        self.contracts = {}  # channel -> contract names on it
+        for shard in shards:
+            self.contracts.setdefault(shard.channel, set()).add(shard.contract)
+        self.listeners = []
+        self.block_listeners = []
+        self.checkpoints = {}  # channel -> last block handled
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as f:
+                self.checkpoints = json.load(f)
+        self.blocks = 0
+        self._tasks = []
+
+    async def start(self):
+        self._tasks = [
+            asyncio.ensure_future(self._follow(channel)) for channel in self.contracts
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _follow(self, channel: str):
+        number = self.checkpoints.get(channel, -1) + 1
+        while True:
+            block = await self._get_block(channel, number)
+            if block is None:
+                # not cut yet (or the gateway is unavailable)
+                await asyncio.sleep(self.poll_interval)
+                continue
+            try:
+                self._handle_block(channel, number, block)
+            except Exception:
+                LOGGER.exception(f"Error handling block {number} of {channel}:")
+                await asyncio.sleep(self.poll_interval)
+                continue
+            self.blocks += 1
+            self.checkpoints[channel] = number
+            self._save()
+            number += 1
+
+    async def _get_block(self, channel: str, number: int):
+        body = {
+            "channelName": channel,
+            "gatewayOptions": {
+                "identity": self.signing_credential["keychainRef"],
+                "wallet": {"keychain": self.signing_credential},
+            },
+            "query": {"blockNumber": str(number)},
+            "skipDecode": False,
+        }
+        try:
+            async with self.session.post(self.url, json=body) as resp:
+                if resp.status != 200:
+                    return None
+                result = await resp.json(content_type=None)
+        except (ClientError, ValueError):
+            return None
+        return (result or {}).get("decodedBlock")
+
+    def _handle_block(self, channel: str, number: int, block: dict):
+        contracts = self.contracts[channel]
+        metadata = (block.get("metadata") or {}).get("metadata") or []
+        codes = (
+            _bytes(metadata[TRANSACTIONS_FILTER])
+            if len(metadata) > TRANSACTIONS_FILTER
+            else b""
+        )
+        for (i, envelope) in enumerate(block["data"]["data"]):
+            if i < len(codes) and codes[i] != VALID:
+                continue
+            payload = envelope["payload"]
+            tx_id = payload["header"]["channel_header"].get("tx_id")
+            for action in (payload.get("data") or {}).get("actions") or ():
+                extension = action["payload"]["action"]["proposal_response_payload"][
+                    "extension"
+                ]
+                self._handle_action(channel, contracts, number, tx_id, extension)
+
+    def _handle_action(
+        self, channel: str, contracts, number: int, tx_id: str, extension: dict
+    ):
+        for ns in (extension.get("results") or {}).get("ns_rwset") or ():
+            if ns.get("namespace") not in contracts:
+                continue
+            writes = {}
+            for write in (ns.get("rwset") or {}).get("writes") or ():
+                writes[write["key"]] = (
+                    None
+                    if write.get("is_delete")
+                    else _bytes(write.get("value")).decode()
+                )
+            if writes:
+                shard = FabricShard(channel, ns["namespace"])
+                for listener in self.block_listeners:
+                    listener(number, tx_id, writes, shard)
+        event = extension.get("events") or {}
+        if event.get("event_name") and event.get("chaincode_id") in contracts:
+            chaincode_event = ChaincodeEvent(
+                number, tx_id, event["event_name"], _bytes(event.get("payload"))
+            )
+            for listener in self.listeners:
+                listener(chaincode_event)
+
+    def _save(self):
+        if not self.checkpoint_path:
+            return
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.checkpoints, f)
+        os.replace(tmp_path, self.checkpoint_path)
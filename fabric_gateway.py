@@ -0,0 +1,309 @@
+"""
+Pipelined Fabric transaction submission through the Cactus gateway.
+
+Callers queue a run-transaction body and await a future that resolves when
+the transaction is committed. A fixed pool of senders keeps up to
+`max_in_flight` transactions at the gateway, so a slow commit holds back one
+sender rather than the caller's workflow or the transactions queued behind
+it.
+
+The connector's SEND invocation submits through the Fabric SDK, which
+collects endorsements, sends the transaction to the orderer and returns
+only once the peers report it committed. A successful response is therefore
+the commit status of its `transactionId`. A transaction invalidated at
+commit (an MVCC or phantom read conflict with a transaction in the same
+block, more likely with more in flight) is endorsed again and resubmitted,
+up to `retries` times.
+
+Every transaction's phases (queued, submitted, committed or failed) are
+timestamped, so stats() reports end-to-end latency from queueing to commit
+next to the time spent at the gateway.
+
+A caller that stops waiting cancels its transaction if it is still queued.
+If it is already at the gateway it may yet commit, and the caller gets
+CommitUnknown rather than a failure, as it does for a response that can't
+be read: resubmitting could commit the transaction twice.
+
+Every transaction gets a client-side id when it is queued, and the most
+recent ones, whatever their outcome, are kept so status() can report on a
+transaction a CommitUnknown (which carries the id) left undecided, by that
+id or by its Fabric transactionId once committed.
+"""
+
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict, deque
+
+from aiohttp import ClientError
+
+from runners.metrics import FABRIC_COMMITS, FABRIC_SUBMISSIONS, QUEUE_DEPTH
+
+
+FABRIC_COMMIT_TIMEOUT = float(os.getenv("FABRIC_COMMIT_TIMEOUT", 120))
+
+CONFLICT_CODES = ("MVCC_READ_CONFLICT", "PHANTOM_READ_CONFLICT")
+
+
+class CommitUnknown(Exception):
+    """Raised when a transaction reached the gateway but its outcome is unknown."""
+
+    client_id = None  # the FabricTransaction's, set by the submitter
+
+
+class FabricTransaction:
+    __slots__ = (
+        "client_id",
+        "method",
+        "body",
+        "traceparent",
+        "future",
+        "transaction_id",
+        "state",
+        "attempts",
+        "error",
+        "queued_at",
+        "submitted_at",
+        "finished_at",
+    )
+
+    def __init__(self, body: dict, traceparent: str = None):
+        self.client_id = uuid.uuid4().hex
+        self.method = body["methodName"]
+        self.body = body
+        self.traceparent = traceparent
+        self.future = asyncio.get_event_loop().create_future()
+        self.transaction_id = None
+        self.state = "queued"
+        self.attempts = 0
+        self.error = None
+        self.queued_at = time.perf_counter()
+        self.submitted_at = None
+        self.finished_at = None
+
+
+class FabricSubmitter:
+    def __init__(
+        self,
+        session,
+        url: str,
+        max_in_flight: int = 16,
+        retries: int = 2,
+        keep: int = 1024,
+    ):
+        self.session = session
+        self.url = url
+        self.max_in_flight = max_in_flight
+        self.retries = retries
+        self.keep = keep
+        self.queue = asyncio.Queue()
+        self.transactions = OrderedDict()  # client id -> most recent `keep`
+        self.transaction_ids = {}  # Fabric transactionId -> client id
+        self.in_flight = 0
+        self.committed = 0
+        self.failed = 0
+        self.unknown = 0
+        self.resubmitted = 0
+        # recent queued -> committed times, and last attempt's gateway call times
+        self.latencies = deque(maxlen=10_000)
+        self.gateway_latencies = deque(maxlen=10_000)
+        self._senders = []
+        QUEUE_DEPTH.set_function(self.queue.qsize, "fabric_submissions")
+
+    def start(self):
+        if not self._senders:
+            self._senders = [
+                asyncio.ensure_future(self._run()) for _ in range(self.max_in_flight)
+            ]
+
+    async def stop(self, timeout: float = None):
+        """Submit everything queued so far, for up to `timeout` seconds, then
+        stop the senders.
+
+        Transactions still queued then fail; those at the gateway end as
+        unknown, as they may yet commit.
+        """
+        if self._senders:
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        for sender in self._senders:
+            sender.cancel()
+        if self._senders:
+            await asyncio.gather(*self._senders, return_exceptions=True)
+        self._senders = []
+        while not self.queue.empty():
+            transaction = self.queue.get_nowait()
+            self.queue.task_done()
+            if transaction.state == "queued":
+                self._finish(
+                    transaction,
+                    "failed",
+                    error=Exception(f"{transaction.method} not submitted, stopping"),
+                )
+
+    def submit(self, body: dict, traceparent: str = None) -> FabricTransaction:
+        """Queue a run-transaction body; its future resolves on commit."""
+        self.start()
+        transaction = FabricTransaction(body, traceparent)
+        self.transactions[transaction.client_id] = transaction
+        while len(self.transactions) > self.keep:
+            (_, old) = self.transactions.popitem(last=False)
+            self.transaction_ids.pop(old.transaction_id, None)
+        self.queue.put_nowait(transaction)
+        return transaction
+
+    async def commit(
+        self, body: dict, traceparent: str = None, timeout: float = FABRIC_COMMIT_TIMEOUT
+    ) -> dict:
+        """Submit and wait for the commit; returns the gateway's response.
+
+        Raises the submission's error if the transaction is not committed.
+        """
+        transaction = self.submit(body, traceparent)
+        try:
+            return await asyncio.wait_for(asyncio.shield(transaction.future), timeout)
+        except asyncio.TimeoutError:
+            # nobody waits for the outcome any more
+            transaction.future.add_done_callback(
+                lambda f: f.cancelled() or f.exception()
+            )
+            if transaction.state == "queued":
+                transaction.state = "cancelled"
+                raise Exception(
+                    f"{transaction.method} not submitted within {timeout}s"
+                ) from None
+            error = CommitUnknown(
+                f"{transaction.method} {transaction.client_id} not committed"
+                f" within {timeout}s, it may still commit"
+            )
+            error.client_id = transaction.client_id
+            raise error from None
+
+    def status(self, transaction_id: str):
+        """State of a recent transaction, by client id or Fabric transactionId."""
+        client_id = self.transaction_ids.get(transaction_id, transaction_id)
+        transaction = self.transactions.get(client_id)
+        return transaction.state if transaction else None
+
+    async def _run(self):
+        while True:
+            transaction = await self.queue.get()
+            if transaction.state == "cancelled":
+                self.failed += 1
+                self.queue.task_done()
+                continue
+            self.in_flight += 1
+            try:
+                await self._send(transaction)
+            except asyncio.CancelledError:
+                error = CommitUnknown(f"{transaction.method} at the gateway, stopping")
+                self._finish(transaction, "unknown", error=error)
+                raise
+            except Exception as err:
+                self._finish(transaction, "failed", error=err)
+            finally:
+                self.in_flight -= 1
+                self.queue.task_done()
+
+    async def _send(self, transaction: FabricTransaction):
+        headers = (
+            {"traceparent": transaction.traceparent} if transaction.traceparent else None
+        )
+        while True:
+            transaction.attempts += 1
+            transaction.state = "submitted"
+            transaction.submitted_at = time.perf_counter()
+            outcome = "error"
+            try:
+                async with self.session.post(
+                    self.url, json=transaction.body, headers=headers
+                ) as resp:
+                    text = await resp.text()
+                    if resp.status == 200:
+                        try:
+                            result = json.loads(text)
+                        except ValueError:
+                            result = None
+                        if not isinstance(result, dict):
+                            error = CommitUnknown(
+                                f"unreadable run-transaction response: {text[:200]}"
+                            )
+                            self._finish(transaction, "unknown", error=error)
+                            return
+                        outcome = "ok"
+                        self._finish(transaction, "committed", result=result)
+                        return
+                    error = Exception(f"run-transaction failed ({resp.status}): {text}")
+            except asyncio.TimeoutError:
+                # the client's timeout, the gateway may still commit it
+                error = CommitUnknown(f"{transaction.method} timed out at the gateway")
+                self._finish(transaction, "unknown", error=error)
+                return
+            except ClientError as err:
+                error = err
+            finally:
+                FABRIC_SUBMISSIONS.observe(
+                    time.perf_counter() - transaction.submitted_at,
+                    transaction.method,
+                    outcome,
+                )
+            if (
+                any(code in str(error) for code in CONFLICT_CODES)
+                and transaction.attempts <= self.retries
+            ):
+                transaction.state = "invalidated"
+                self.resubmitted += 1
+                continue
+            self._finish(transaction, "failed", error=error)
+            return
+
+    def _finish(self, transaction, state, result=None, error=None):
+        now = time.perf_counter()
+        transaction.state = state
+        transaction.finished_at = now
+        transaction.error = error
+        if transaction.submitted_at is not None:
+            self.gateway_latencies.append(now - transaction.submitted_at)
+        FABRIC_COMMITS.observe(now - transaction.queued_at, transaction.method, state)
+        if state == "committed":
+            self.committed += 1
+            self.latencies.append(now - transaction.queued_at)
+            transaction.transaction_id = result.get("transactionId")
+            if transaction.transaction_id and transaction.client_id in self.transactions:
+                self.transaction_ids[transaction.transaction_id] = transaction.client_id
+        elif state == "unknown":
+            self.unknown += 1
+            error.client_id = transaction.client_id
+        else:
+            self.failed += 1
+        # the body is no longer needed, only the transaction's status
+        transaction.body = None
+        if not transaction.future.done():
+            if error:
+                transaction.future.set_exception(error)
+            else:
+                transaction.future.set_result(result)
+
+    def stats(self) -> dict:
+        def pct(values, p):
+            values = sorted(values)
+            if not values:
+                return None
+            return round(values[int(p * (len(values) - 1))] * 1000, 3)
+
+        return {
+            "committed": self.committed,
+            "failed": self.failed,
+            "unknown": self.unknown,
+            "resubmitted": self.resubmitted,
+            "queued": self.queue.qsize(),
+            "in_flight": self.in_flight,
+            "commit_ms_p50": pct(self.latencies, 0.5),
+            "commit_ms_p99": pct(self.latencies, 0.99),
+            "gateway_ms_p50": pct(self.gateway_latencies, 0.5),
+            "gateway_ms_p99": pct(self.gateway_latencies, 0.99),
+        }
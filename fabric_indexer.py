@@ -0,0 +1,344 @@
+"""
+Incremental indexer for the tokenERC20 chaincode events.
+
+Consumes the `Transfer` and `Approval` events set by tokenERC20.js (and the
+Escrow/Refund variants of `Transfer`, which carry a `FABRIC_BRIDGE_IDENTITY`
+key instead of `to`), keeps per-account balances, allowances and escrow
+records in memory for O(1) lookups, and writes them together with the
+transfer history to a local SQLite store in batches. The store records the
+last fully indexed block so a restarted indexer resumes where it left off.
+
+Events can come from a live source, the in-memory stand-in
+(`fabric_sim.TokenERC20Model`) or a `fabric_events.FabricBlockSource` for
+one shard, through `attach`, which also feeds it the write sets that give
+exact balances; or from a recorded JSON-lines file (see `load_events`).
+
+A block is only checkpointed once it is known to be complete: when the
+next block's first transaction arrives, or when `end_block()` is called.
+Rows of a block still being indexed are never written, so a restarted
+indexer indexes it again from the start.
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+
+from collections import namedtuple
+
+
+EscrowRecord = namedtuple(
+    "EscrowRecord", ["tx_id", "block_number", "account", "value"]
+)
+
+MINT_BURN_ACCOUNT = "0x0"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoint (id INTEGER PRIMARY KEY, block_number INTEGER);
+CREATE TABLE IF NOT EXISTS balances (account TEXT PRIMARY KEY, balance INTEGER);
+CREATE TABLE IF NOT EXISTS allowances (
+    owner TEXT, spender TEXT, value INTEGER, PRIMARY KEY (owner, spender)
+);
+CREATE TABLE IF NOT EXISTS escrows (
+    tx_id TEXT PRIMARY KEY, block_number INTEGER, account TEXT, value INTEGER
+);
+CREATE TABLE IF NOT EXISTS transfers (
+    block_number INTEGER, tx_id TEXT, sender TEXT, recipient TEXT, value INTEGER
+);
+CREATE INDEX IF NOT EXISTS transfers_sender ON transfers (sender, block_number);
+CREATE INDEX IF NOT EXISTS transfers_recipient ON transfers (recipient, block_number);
+CREATE INDEX IF NOT EXISTS escrows_account ON escrows (account, block_number);
+"""
+
+
+def _payload(event) -> dict:
+    payload = event.payload if hasattr(event, "payload") else event["payload"]
+    if isinstance(payload, (bytes, str)):
+        payload = json.loads(payload)
+    return payload
+
+
+def _field(event, name):
+    return getattr(event, name) if hasattr(event, name) else event[name]
+
+
+class FabricEventIndexer:
+    """Checkpointed, batched index of balances, escrows and transfer history."""
+
+    def __init__(
+        self,
+        path: str = ":memory:",
+        bridge_identity: str = None,
+        batch_size: int = 5000,
+    ):
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+        self.bridge_identity = bridge_identity
+        self.batch_size = batch_size
+
+        row = self.db.execute("SELECT block_number FROM checkpoint").fetchone()
+        # last block whose events are all persisted
+        self.checkpoint = row[0] if row else -1
+        self.balances = dict(self.db.execute("SELECT account, balance FROM balances"))
+        self.allowances = {
+            (owner, spender): value
+            for (owner, spender, value) in self.db.execute(
+                "SELECT owner, spender, value FROM allowances"
+            )
+        }
+        self.escrows = {
+            row[0]: EscrowRecord(*row)
+            for row in self.db.execute(
+                "SELECT tx_id, block_number, account, value FROM escrows"
+            )
+        }
+
+        self.current_block = self.checkpoint
+        self._block_complete = True
+        self._dirty_balances = set()
+        self._dirty_allowances = set()
+        self._new_escrows = []
+        self._new_transfers = []
+        # tx_id -> accounts whose balance its write set already set exactly
+        self._exact_balances = {}
+        self.events_indexed = 0
+
+    # ------------------------------------------------------------- ingestion
+
+    def attach(self, source):
+        """Index a live source's events and write sets as they are committed."""
+        source.block_listeners.append(self.ingest_writes)
+        source.listeners.append(self.ingest)
+
+    def _advance(self, block_number: int):
+        if block_number != self.current_block:
+            # previous block is complete, a safe point to flush a full batch
+            self._block_complete = True
+            if len(self._new_transfers) + len(self._dirty_balances) >= self.batch_size:
+                self.flush()
+            self.current_block = block_number
+            self._exact_balances = {
+                t: a for (t, a) in self._exact_balances.items() if a[0] >= block_number
+            }
+        self._block_complete = False
+
+    def end_block(self):
+        """Mark the block being indexed complete, and write what is pending."""
+        self._block_complete = True
+        self.flush()
+
+    def ingest(self, event):
+        """Index one chaincode event; events at or below the checkpoint are skipped."""
+        block_number = _field(event, "block_number")
+        if block_number <= self.checkpoint:
+            return False
+        self._advance(block_number)
+
+        name = _field(event, "event_name")
+        payload = _payload(event)
+        if name == "Transfer":
+            self._index_transfer(block_number, _field(event, "tx_id"), payload)
+        elif name == "Approval":
+            key = (payload["owner"], payload["spender"])
+            self.allowances[key] = payload["value"]
+            self._dirty_allowances.add(key)
+        self.events_indexed += 1
+        return True
+
+    def ingest_many(self, events):
+        for event in events:
+            self.ingest(event)
+
+    def ingest_writes(self, block_number: int, tx_id: str, writes: dict, shard=None):
+        """Take exact balances from a committed write set, when one is available.
+
+        Events alone can't see balances reset by appendAddressMapping or the
+        recipient of a Refund; block write sets can. The Transfer event of the
+        same transaction then leaves these balances alone, so the transfer is
+        not counted twice.
+        """
+        if block_number <= self.checkpoint:
+            return
+        self._advance(block_number)
+        prefix = "\x00balance\x00"
+        exact = set()
+        for (key, value) in writes.items():
+            if key.startswith(prefix):
+                account = key[len(prefix) : -1]
+                self.balances[account] = int(value)
+                self._dirty_balances.add(account)
+                exact.add(account)
+        if exact:
+            self._exact_balances[tx_id] = (block_number, exact)
+
+    def _credit(self, account: str, value: int):
+        if account != MINT_BURN_ACCOUNT:
+            self.balances[account] = self.balances.get(account, 0) + value
+            self._dirty_balances.add(account)
+
+    def _index_transfer(self, block_number: int, tx_id: str, payload: dict):
+        sender = payload["from"]
+        value = payload["value"]
+        if "to" in payload:
+            recipient = payload["to"]
+        else:
+            # Escrow (client -> bridge) or Refund (bridge -> unnamed client)
+            bridge = payload.get("FABRIC_BRIDGE_IDENTITY") or self.bridge_identity
+            if sender == bridge:
+                recipient = None
+            else:
+                recipient = bridge
+                record = EscrowRecord(tx_id, block_number, sender, value)
+                self.escrows[tx_id] = record
+                self._new_escrows.append(record)
+
+        (_, exact) = self._exact_balances.pop(tx_id, (None, ()))
+        if sender not in exact:
+            self._credit(sender, -value)
+        if recipient and recipient not in exact:
+            self._credit(recipient, value)
+        self._new_transfers.append((block_number, tx_id, sender, recipient, value))
+
+    def flush(self):
+        """Write pending rows in one transaction and checkpoint the current block.
+
+        Does nothing while a block is partly indexed (see end_block()); its
+        rows would otherwise be applied again when the stream is resumed.
+        """
+        if not self._block_complete:
+            return
+        checkpoint = self.current_block
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO balances VALUES (?, ?)",
+                [(a, self.balances[a]) for a in self._dirty_balances],
+            )
+            self.db.executemany(
+                "INSERT OR REPLACE INTO allowances VALUES (?, ?, ?)",
+                [(o, s, self.allowances[(o, s)]) for (o, s) in self._dirty_allowances],
+            )
+            self.db.executemany(
+                "INSERT OR REPLACE INTO escrows VALUES (?, ?, ?, ?)", self._new_escrows
+            )
+            self.db.executemany(
+                "INSERT INTO transfers VALUES (?, ?, ?, ?, ?)", self._new_transfers
+            )
+            if checkpoint > self.checkpoint:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO checkpoint VALUES (0, ?)", (checkpoint,)
+                )
+                self.checkpoint = checkpoint
+        self._dirty_balances.clear()
+        self._dirty_allowances.clear()
+        self._new_escrows.clear()
+        self._new_transfers.clear()
+
+    def close(self):
+        """Write complete blocks; a partly indexed one is indexed again on resume."""
+        self.flush()
+        self.db.close()
+
+    # --------------------------------------------------------------- queries
+
+    def balance(self, account: str) -> int:
+        return self.balances.get(account)
+
+    def allowance(self, owner: str, spender: str) -> int:
+        return self.allowances.get((owner, spender))
+
+    def escrow(self, tx_id: str) -> EscrowRecord:
+        return self.escrows.get(tx_id)
+
+    def escrows_by(self, account: str, from_block: int = 0, to_block: int = None):
+        to_block = self.current_block if to_block is None else to_block
+        records = [
+            EscrowRecord(*row)
+            for row in self.db.execute(
+                "SELECT tx_id, block_number, account, value FROM escrows"
+                " WHERE account = ? AND block_number BETWEEN ? AND ?",
+                (account, from_block, to_block),
+            )
+        ]
+        records += [
+            r
+            for r in self._new_escrows
+            if r.account == account and from_block <= r.block_number <= to_block
+        ]
+        return sorted(records, key=lambda r: (r.block_number, r.tx_id))
+
+    def transfers(self, account: str, from_block: int = 0, to_block: int = None):
+        """Transfer history (sent or received) for `account` in a block range."""
+        to_block = self.current_block if to_block is None else to_block
+        rows = self.db.execute(
+            "SELECT block_number, tx_id, sender, recipient, value FROM transfers"
+            " WHERE sender = ?1 AND block_number BETWEEN ?2 AND ?3"
+            " UNION ALL"
+            " SELECT block_number, tx_id, sender, recipient, value FROM transfers"
+            " WHERE recipient = ?1 AND sender != ?1"
+            " AND block_number BETWEEN ?2 AND ?3",
+            (account, from_block, to_block),
+        ).fetchall()
+        rows += [
+            t
+            for t in self._new_transfers
+            if (t[2] == account or t[3] == account) and from_block <= t[0] <= to_block
+        ]
+        return sorted(rows)
+
+
+def load_events(path: str):
+    """Yield events from a JSON-lines recording."""
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def dump_events(events, path: str):
+    """Record events (e.g. from fabric_sim) as JSON lines for later replay."""
+    with open(path, "w") as f:
+        for event in events:
+            f.write(json.dumps(event._asdict()) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Indexes a recorded or synthetic tokenERC20 event stream."
+    )
+    parser.add_argument("--events", type=str, help="JSON-lines event recording")
+    parser.add_argument("--db", type=str, default=":memory:")
+    parser.add_argument("--transfers", type=int, default=200_000)
+    args = parser.parse_args()
+
+    if args.events:
+        events = load_events(args.events)
+    else:
+        sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        from runners.fabric_sim import TokenERC20Model, bootstrap, simulate_transfers
+
+        model = TokenERC20Model()
+        events = None
+
+    indexer = FabricEventIndexer(args.db)
+    start = time.perf_counter()
+    if events is None:
+        # index live, with the write sets' exact balances
+        indexer.attach(model)
+        simulate_transfers(model, bootstrap(model, 100, 1_000_000), args.transfers)
+    else:
+        indexer.ingest_many(events)
+    indexer.end_block()
+    elapsed = time.perf_counter() - start
+    print(
+        json.dumps(
+            {
+                "events": indexer.events_indexed,
+                "seconds": round(elapsed, 3),
+                "events_per_second": round(indexer.events_indexed / elapsed),
+                "checkpoint": indexer.checkpoint,
+                "accounts": len(indexer.balances),
+            }
+        )
+    )
@@ -0,0 +1,85 @@
+"""
+Routing of the bridge's Fabric operations across channels and contracts.
+
+FABRIC_SHARDS lists the channel/contract pairs the tokenERC20 chaincode is
+deployed on, for example "mychannel/cbdc,channel2/cbdc,channel2/cbdc2". A
+client's address mapping, and with it the balance its Escrow and Refund
+operate on, lives on one shard. That shard is chosen by rendezvous hashing
+of the fabricID, so every bridge worker routes a client to the same shard,
+and adding a shard moves only the clients that hash to the new one.
+
+Each shard is a separate tokenERC20 ledger, so a client's Escrow has to be
+invoked on its shard for the bridge to relay it, and a Refund credits the
+balance there. The bridge tells each client its shard (channelName and
+contractName, in a message on its connection) once it is onboarded. Central
+bank and ministry transactions for the client belong on the same shard.
+
+Mappings written under an earlier shard list may live on another shard.
+Queries therefore go to the hashed shard first, then to the rest in
+rendezvous order, so every worker finds the same mapping first. Which
+shard holds a mapping is tracked by the bridge's address mirror.
+
+A client onboarded again after the shard list changed keeps its shard: the
+bridge finds its existing mapping and rewrites it there, so its balance is
+never left behind on a shard queries no longer reach first. Only clients
+without a mapping are placed on their hashed shard.
+"""
+
+import hashlib
+import os
+from collections import namedtuple
+
+
+FABRIC_SHARDS = os.getenv("FABRIC_SHARDS", "mychannel/cbdc")
+
+FabricShard = namedtuple("FabricShard", ["channel", "contract"])
+
+
+def parse_shards(spec: str) -> list:
+    """Parse "channel/contract,..." (the contract defaults to cbdc)."""
+    shards = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        (channel, _, contract) = entry.partition("/")
+        shard = FabricShard(channel, contract or "cbdc")
+        if shard not in shards:
+            shards.append(shard)
+    if not shards:
+        raise Exception(f"No Fabric shards in {spec!r}")
+    return shards
+
+
+def _score(shard: FabricShard, fabric_id: str) -> int:
+    digest = hashlib.sha256(
+        f"{shard.channel}/{shard.contract}/{fabric_id}".encode()
+    ).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+class FabricRouter:
+    def __init__(self, shards: list = None):
+        self.shards = shards or parse_shards(FABRIC_SHARDS)
+        self.writes = dict.fromkeys(self.shards, 0)
+
+    def shard_for(self, fabric_id: str) -> FabricShard:
+        """The shard new operations for `fabric_id` go to."""
+        if len(self.shards) == 1:
+            return self.shards[0]
+        return max(self.shards, key=lambda shard: _score(shard, fabric_id))
+
+    def candidates(self, fabric_id: str) -> list:
+        """Shards to query for `fabric_id`'s mapping, most likely first."""
+        return sorted(
+            self.shards, key=lambda shard: _score(shard, fabric_id), reverse=True
+        )
+
+    def record_write(self, shard: FabricShard):
+        self.writes[shard] = self.writes.get(shard, 0) + 1
+
+    def stats(self) -> dict:
+        return {
+            f"{shard.channel}/{shard.contract}": count
+            for (shard, count) in self.writes.items()
+        }
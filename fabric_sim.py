@@ -0,0 +1,581 @@
+"""
+In-memory model of the tokenERC20 chaincode (tokenERC20.js).
+
+The model keeps the contract's world state in a flat dict keyed exactly like
+the chaincode's composite keys, applies each transaction's writes atomically
+on success, and records the (single) chaincode event a transaction emits.
+`FabricStandIn` serves it behind the Cactus `run-transaction` endpoint so the
+bridge can be driven end to end without a Fabric network.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import time
+
+from collections import deque, namedtuple
+
+
+RUN_TRANSACTION_PATH = (
+    "/api/v1/plugins/@hyperledger/cactus-plugin-ledger-connector-fabric"
+    "/run-transaction"
+)
+DEFAULT_CHANNEL = "mychannel"
+DEFAULT_CONTRACT = "cbdc"
+MINTER_MSP_ID = "Org1MSP"
+# recent chaincode events a model retains for event subscribers
+SIM_MAX_EVENTS = int(os.getenv("SIM_MAX_EVENTS", 100_000))
+
+# Define objectType names for prefix
+BALANCE_PREFIX = "balance"
+ALLOWANCE_PREFIX = "allowance"
+ADDRESS_PREFIX = "address"
+
+# Define key names for options
+NAME_KEY = "name"
+SYMBOL_KEY = "symbol"
+DECIMALS_KEY = "decimals"
+TOTAL_SUPPLY_KEY = "totalSupply"
+
+# JavaScript numbers lose integer precision beyond this, which is what the
+# chaincode's add()/sub() overflow checks detect
+MAX_SAFE_INTEGER = 2**53 - 1
+
+ChaincodeEvent = namedtuple(
+    "ChaincodeEvent", ["block_number", "tx_id", "event_name", "payload"]
+)
+
+
+class ChaincodeError(Exception):
+    """Raised wherever the chaincode throws; the transaction is not committed."""
+
+
+def x509_id(cn: str, org: str = "org1") -> str:
+    """Client identity string as returned by ctx.clientIdentity.getID()."""
+    return (
+        f"x509::/OU=client/OU={org}/OU=department1/CN={cn}"
+        f"::/C=US/ST=North Carolina/L=Durham/O={org}.example.com"
+        f"/CN=ca.{org}.example.com"
+    )
+
+
+def composite_key(object_type: str, *attributes: str) -> str:
+    """Same layout as ctx.stub.createCompositeKey()."""
+    return "\x00" + object_type + "\x00" + "".join(a + "\x00" for a in attributes)
+
+
+def parse_int(value) -> int:
+    if isinstance(value, int):
+        return value
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        # parseInt() would yield NaN and corrupt the balances; refuse instead
+        raise ChaincodeError(f"{value!r} is not an integer amount")
+
+
+def _add(a: int, b: int) -> int:
+    c = a + b
+    if abs(c) > MAX_SAFE_INTEGER:
+        raise ChaincodeError(f"Math: addition overflow occurred {a} + {b}")
+    return c
+
+
+def _sub(a: int, b: int) -> int:
+    c = a - b
+    if abs(c) > MAX_SAFE_INTEGER:
+        raise ChaincodeError(f"Math: subtraction overflow occurred {a} - {b}")
+    return c
+
+
+class TxContext:
+    """Per-transaction view of the world state (the chaincode's `ctx`).
+
+    Like Fabric, reads see committed state only and writes are buffered
+    until the transaction commits; only the last event set is emitted.
+    """
+
+    __slots__ = ("state", "writes", "client_id", "msp_id", "tx_id", "event")
+
+    def __init__(self, state: dict, client_id: str, msp_id: str, tx_id: str):
+        self.state = state
+        self.writes = {}
+        self.client_id = client_id
+        self.msp_id = msp_id
+        self.tx_id = tx_id
+        self.event = None
+
+    def get_state(self, key):
+        return self.state.get(key)
+
+    def put_state(self, key, value):
+        self.writes[key] = value
+
+    def set_event(self, name: str, payload: dict):
+        self.event = (name, payload)
+
+
+class TokenERC20Model:
+    """Python model of TokenERC20Contract, one instance per channel/contract."""
+
+    def __init__(
+        self,
+        bridge_identity: str = None,
+        accounts: list = None,
+        block_size: int = 10,
+        max_events: int = SIM_MAX_EVENTS,
+    ):
+        self.bridge_identity = bridge_identity or x509_id("bridge")
+        # (fabricID, ethAddress) pairs set up by Initialize()
+        self.accounts = (
+            accounts
+            if accounts is not None
+            else [
+                (x509_id("userB"), "0x0000000000000000000000000000000000000000"),
+                (self.bridge_identity, "0x0000000000000000000000000000000000000001"),
+            ]
+        )
+        self.state = {}
+        # state of the asset-reference-contract invoked by Escrow
+        self.asset_references = {}
+        self.block_size = block_size
+        self.tx_count = 0
+        self.events = deque(maxlen=max_events)
+        # callables(event) for chaincode events, and
+        # callables(block_number, tx_id, writes) for committed write sets
+        self.listeners = []
+        self.block_listeners = []
+        self._tx_ids = itertools.count(1)
+        self._methods = {
+            "TokenName": self.token_name,
+            "Symbol": self.symbol,
+            "Decimals": self.decimals,
+            "TotalSupply": self.total_supply,
+            "BalanceOf": self.balance_of,
+            "Transfer": self.transfer,
+            "TransferFrom": self.transfer_from,
+            "Approve": self.approve,
+            "Allowance": self.allowance,
+            "Initialize": self.initialize,
+            "Mint": self.mint,
+            "Burn": self.burn,
+            "ClientAccountBalance": self.client_account_balance,
+            "ClientAccountID": self.client_account_id,
+            "CheckInitialized": self.check_initialized,
+            "Escrow": self.escrow,
+            "Refund": self.refund,
+            "initializeAddressMapping": self.initialize_address_mapping,
+            "appendAddressMapping": self.append_address_mapping,
+            "getAddressMapping": self.get_address_mapping,
+            "checkAddressMapping": self.check_address_mapping,
+            "ResetState": self.reset_state,
+        }
+
+    @property
+    def block_height(self) -> int:
+        return self.tx_count // self.block_size
+
+    def invoke(
+        self,
+        method_name: str,
+        params=(),
+        client_id: str = None,
+        msp_id: str = MINTER_MSP_ID,
+    ):
+        """Run one transaction; commit its writes and event if it succeeds."""
+        method = self._methods.get(method_name)
+        if not method:
+            raise ChaincodeError(
+                f"You've asked to invoke a function that does not exist: {method_name}"
+            )
+        tx_id = format(next(self._tx_ids), "064x")
+        ctx = TxContext(self.state, client_id, msp_id, tx_id)
+        result = method(ctx, *params)
+        if ctx.writes:
+            self.state.update(ctx.writes)
+            for listener in self.block_listeners:
+                listener(self.block_height, tx_id, ctx.writes)
+        if ctx.event:
+            event = ChaincodeEvent(self.block_height, tx_id, *ctx.event)
+            self.events.append(event)
+            for listener in self.listeners:
+                listener(event)
+        self.tx_count += 1
+        return tx_id, result
+
+    def get(self, key, default=None):
+        return self.state.get(key, default)
+
+    # ---------------------------------------------------------------- reads
+
+    def token_name(self, ctx):
+        self.check_initialized(ctx)
+        return ctx.get_state(NAME_KEY)
+
+    def symbol(self, ctx):
+        self.check_initialized(ctx)
+        return ctx.get_state(SYMBOL_KEY)
+
+    def decimals(self, ctx):
+        self.check_initialized(ctx)
+        return parse_int(ctx.get_state(DECIMALS_KEY))
+
+    def total_supply(self, ctx):
+        self.check_initialized(ctx)
+        return ctx.get_state(TOTAL_SUPPLY_KEY)
+
+    def balance_of(self, ctx, owner):
+        self.check_initialized(ctx)
+        balance = ctx.get_state(composite_key(BALANCE_PREFIX, owner))
+        if balance is None:
+            raise ChaincodeError(f"the account {owner} does not exist")
+        return balance
+
+    def allowance(self, ctx, owner, spender):
+        self.check_initialized(ctx)
+        allowance = ctx.get_state(composite_key(ALLOWANCE_PREFIX, owner, spender))
+        if allowance is None:
+            raise ChaincodeError(f"spender {spender} has no allowance from {owner}")
+        return allowance
+
+    def client_account_balance(self, ctx):
+        return self.balance_of(ctx, ctx.client_id)
+
+    def client_account_id(self, ctx):
+        self.check_initialized(ctx)
+        return ctx.client_id
+
+    def check_initialized(self, ctx):
+        if not ctx.get_state(NAME_KEY):
+            raise ChaincodeError(
+                "contract options need to be set before calling any function, "
+                "call Initialize() to initialize contract"
+            )
+
+    def get_address_mapping(self, ctx, fabric_id):
+        self.check_initialized(ctx)
+        address = ctx.get_state(composite_key(ADDRESS_PREFIX, fabric_id))
+        if not address:
+            raise ChaincodeError(f"the account {fabric_id} does not exist")
+        return address
+
+    def check_address_mapping(self, ctx, fabric_id, eth_address):
+        if self.get_address_mapping(ctx, fabric_id) != eth_address:
+            raise ChaincodeError("it is not possible to bridge CBDC to another user.")
+
+    # ------------------------------------------------------------ transfers
+
+    def transfer(self, ctx, to, value):
+        self.check_initialized(ctx)
+        self._transfer(ctx, ctx.client_id, to, value)
+        ctx.set_event(
+            "Transfer", {"from": ctx.client_id, "to": to, "value": parse_int(value)}
+        )
+        return True
+
+    def transfer_from(self, ctx, from_, to, value):
+        self.check_initialized(ctx)
+        spender = ctx.client_id
+        allowance_key = composite_key(ALLOWANCE_PREFIX, from_, spender)
+        current_allowance = ctx.get_state(allowance_key)
+        if current_allowance is None:
+            raise ChaincodeError(f"spender {spender} has no allowance from {from_}")
+        value_int = parse_int(value)
+        if current_allowance < value_int:
+            raise ChaincodeError(
+                "The spender does not have enough allowance to spend."
+            )
+        self._transfer(ctx, from_, to, value)
+        ctx.put_state(allowance_key, _sub(current_allowance, value_int))
+        ctx.set_event("Transfer", {"from": from_, "to": to, "value": value_int})
+        return True
+
+    def _transfer(self, ctx, from_, to, value):
+        if from_ == to:
+            raise ChaincodeError(
+                f"cannot transfer to and from same client account: {from_}"
+            )
+        value_int = parse_int(value)
+        if value_int < 0:
+            # transfer of 0 is allowed in ERC20, so just validate against negative amounts
+            raise ChaincodeError("transfer amount cannot be negative")
+
+        from_key = composite_key(BALANCE_PREFIX, from_)
+        from_balance = ctx.get_state(from_key)
+        if from_balance is None:
+            raise ChaincodeError(f"client account {from_} has no balance")
+        if from_balance < value_int:
+            raise ChaincodeError(f"client account {from_} has insufficient funds.")
+
+        to_key = composite_key(BALANCE_PREFIX, to)
+        to_balance = ctx.get_state(to_key) or 0
+
+        ctx.put_state(from_key, _sub(from_balance, value_int))
+        ctx.put_state(to_key, _add(to_balance, value_int))
+        return True
+
+    def approve(self, ctx, spender, value):
+        self.check_initialized(ctx)
+        owner = ctx.client_id
+        value_int = parse_int(value)
+        ctx.put_state(composite_key(ALLOWANCE_PREFIX, owner, spender), value_int)
+        ctx.set_event(
+            "Approval", {"owner": owner, "spender": spender, "value": value_int}
+        )
+        return True
+
+    # ---------------------------------------------------- extended functions
+
+    def initialize(self, ctx, name, symbol, decimals):
+        if ctx.msp_id != MINTER_MSP_ID:
+            raise ChaincodeError("client is not authorized to initialize contract")
+        if ctx.get_state(NAME_KEY):
+            raise ChaincodeError(
+                "contract options are already set, "
+                "client is not authorized to change them"
+            )
+        ctx.put_state(NAME_KEY, name)
+        ctx.put_state(SYMBOL_KEY, symbol)
+        ctx.put_state(DECIMALS_KEY, decimals)
+        self.initialize_address_mapping(ctx)
+        return True
+
+    def mint(self, ctx, amount):
+        self.check_initialized(ctx)
+        if ctx.msp_id != MINTER_MSP_ID:
+            raise ChaincodeError("client is not authorized to mint new tokens")
+        minter = ctx.client_id
+        amount_int = parse_int(amount)
+        if amount_int <= 0:
+            raise ChaincodeError("mint amount must be a positive integer")
+
+        balance_key = composite_key(BALANCE_PREFIX, minter)
+        ctx.put_state(balance_key, _add(ctx.get_state(balance_key) or 0, amount_int))
+        total_supply = ctx.get_state(TOTAL_SUPPLY_KEY) or 0
+        ctx.put_state(TOTAL_SUPPLY_KEY, _add(total_supply, amount_int))
+        ctx.set_event("Transfer", {"from": "0x0", "to": minter, "value": amount_int})
+        return True
+
+    def burn(self, ctx, amount):
+        self.check_initialized(ctx)
+        if ctx.msp_id != MINTER_MSP_ID:
+            raise ChaincodeError("client is not authorized to mint new tokens")
+        minter = ctx.client_id
+        amount_int = parse_int(amount)
+
+        balance_key = composite_key(BALANCE_PREFIX, minter)
+        current_balance = ctx.get_state(balance_key)
+        if current_balance is None:
+            raise ChaincodeError("The balance does not exist")
+        total_supply = ctx.get_state(TOTAL_SUPPLY_KEY)
+        if total_supply is None:
+            raise ChaincodeError("totalSupply does not exist.")
+        ctx.put_state(balance_key, _sub(current_balance, amount_int))
+        ctx.put_state(TOTAL_SUPPLY_KEY, _sub(total_supply, amount_int))
+        ctx.set_event("Transfer", {"from": minter, "to": "0x0", "value": amount_int})
+        return True
+
+    def escrow(self, ctx, value, id):
+        self.check_initialized(ctx)
+        from_ = ctx.client_id
+        self._transfer(ctx, from_, self.bridge_identity, value)
+        # NOTE the chaincode emits the bridge identity under the key
+        # "FABRIC_BRIDGE_IDENTITY" rather than "to"; consumers rely on that
+        ctx.set_event(
+            "Transfer",
+            {
+                "from": from_,
+                "FABRIC_BRIDGE_IDENTITY": self.bridge_identity,
+                "value": parse_int(value),
+            },
+        )
+        # invokeChaincode("asset-reference-contract", ["CreateAssetReference", ...])
+        if id in self.asset_references:
+            raise ChaincodeError(f"The asset {id} already exists")
+        self.asset_references[id] = (str(value), from_)
+
+    def refund(self, ctx, to, value, eth_address):
+        self.check_initialized(ctx)
+        from_ = ctx.client_id
+        if from_ != self.bridge_identity:
+            raise ChaincodeError("client is not authorized to refund tokens")
+        if self.get_address_mapping(ctx, to) != eth_address:
+            raise ChaincodeError(
+                "client is not authorized to bridge back tokens "
+                "to another client account"
+            )
+        self._transfer(ctx, from_, to, value)
+        ctx.set_event(
+            "Transfer",
+            {
+                "from": from_,
+                "FABRIC_BRIDGE_IDENTITY": self.bridge_identity,
+                "value": parse_int(value),
+            },
+        )
+
+    def initialize_address_mapping(self, ctx):
+        for (fabric_id, eth_address) in self.accounts:
+            ctx.put_state(composite_key(ADDRESS_PREFIX, fabric_id), eth_address)
+            ctx.put_state(composite_key(BALANCE_PREFIX, fabric_id), 0)
+
+    def append_address_mapping(self, ctx, fabric_id, eth_address):
+        ctx.put_state(composite_key(ADDRESS_PREFIX, fabric_id), eth_address)
+        ctx.put_state(composite_key(BALANCE_PREFIX, fabric_id), 0)
+
+    def reset_state(self, ctx):
+        for (fabric_id, _) in self.accounts:
+            ctx.put_state(composite_key(BALANCE_PREFIX, fabric_id), 0)
+
+
+class FabricStandIn:
+    """Local stand-in for the Cactus Fabric connector's run-transaction endpoint."""
+
+    def __init__(self, models: dict = None, identities: dict = None):
+        # (channelName, contractName) -> TokenERC20Model
+        self.models = models or {(DEFAULT_CHANNEL, DEFAULT_CONTRACT): TokenERC20Model()}
+        # signingCredential.keychainRef -> (client identity, MSP id)
+        self.identities = identities or {
+            ref: (x509_id(ref), MINTER_MSP_ID) for ref in ("userA", "userB", "bridge")
+        }
+        self.runner = None
+
+    def run_transaction(self, request: dict) -> dict:
+        """Handle one RunTransactionRequest body, returning the response body."""
+        model = self.models.get((request["channelName"], request["contractName"]))
+        if not model:
+            raise ChaincodeError(
+                f"contract {request['contractName']} is not deployed "
+                f"on channel {request['channelName']}"
+            )
+        keychain_ref = request["signingCredential"]["keychainRef"]
+        if keychain_ref not in self.identities:
+            raise ChaincodeError(f"{keychain_ref} not found in keychain")
+        (client_id, msp_id) = self.identities[keychain_ref]
+        tx_id, result = model.invoke(
+            request["methodName"], request.get("params", ()), client_id, msp_id
+        )
+        if result is None:
+            output = ""
+        elif isinstance(result, bool):
+            # JSON-style, as the chaincode's JavaScript return value
+            output = json.dumps(result)
+        else:
+            output = str(result)
+        return {
+            "functionOutput": output,
+            "success": True,
+            "transactionId": tx_id,
+        }
+
+    async def _handle_run_transaction(self, request):
+        from aiohttp import web
+
+        body = await request.json()
+        try:
+            return web.json_response(self.run_transaction(body))
+        except ChaincodeError as err:
+            return web.json_response(
+                {"message": "runTransaction failed", "error": str(err)}, status=500
+            )
+
+    async def start(self, host: str = "0.0.0.0", port: int = 4000):
+        # aiohttp is only needed when serving over HTTP
+        from aiohttp import web
+
+        app = web.Application()
+        app.add_routes([web.post(RUN_TRANSACTION_PATH, self._handle_run_transaction)])
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+
+
+def bootstrap(model: TokenERC20Model, accounts: int, amount: int) -> list:
+    """Initialize the token and fund `accounts` simulated clients."""
+    minter = x509_id("minter")
+    model.invoke("Initialize", ("CBDC", "CBDC", "2"), minter)
+    model.invoke("Mint", (amount * accounts,), minter)
+    clients = [x509_id(f"user{i}") for i in range(accounts)]
+    for client in clients:
+        model.invoke("Transfer", (client, amount), minter)
+    return clients
+
+
+def simulate_transfers(model: TokenERC20Model, clients: list, count: int) -> float:
+    """Run `count` Transfer transactions round-robin; returns elapsed seconds."""
+    invoke = model.invoke
+    n = len(clients)
+    start = time.perf_counter()
+    for i in range(count):
+        invoke("Transfer", (clients[(i + 1) % n], 1), clients[i % n])
+    return time.perf_counter() - start
+
+
+async def serve(port: int, shards: list = None):
+    """Serve a tokenERC20 model for each (channel, contract) shard."""
+    shards = shards or [(DEFAULT_CHANNEL, DEFAULT_CONTRACT)]
+    stand_in = FabricStandIn(
+        {(channel, contract): TokenERC20Model() for (channel, contract) in shards}
+    )
+    for model in stand_in.models.values():
+        model.invoke("Initialize", ("CBDC", "CBDC", "2"), x509_id("minter"))
+    await stand_in.start(port=port)
+    print(f"Fabric stand-in listening on :{port}{RUN_TRANSACTION_PATH}")
+    while True:
+        await asyncio.sleep(3600)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Runs the in-memory tokenERC20 model (benchmark or stand-in)."
+    )
+    parser.add_argument("--serve", action="store_true", help="Serve run-transaction")
+    parser.add_argument("-p", "--port", type=int, default=4000)
+    parser.add_argument(
+        "--shards",
+        default=os.getenv("FABRIC_SHARDS", f"{DEFAULT_CHANNEL}/{DEFAULT_CONTRACT}"),
+        help="Channel/contract pairs to serve, as in FABRIC_SHARDS",
+    )
+    parser.add_argument("--transfers", type=int, default=1_000_000)
+    parser.add_argument("--accounts", type=int, default=1000)
+    parser.add_argument(
+        "--max-events",
+        type=int,
+        default=SIM_MAX_EVENTS,
+        help="Number of recent chaincode events to retain",
+    )
+    args = parser.parse_args()
+
+    if args.serve:
+        sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        from runners.fabric_routing import parse_shards
+
+        try:
+            asyncio.get_event_loop().run_until_complete(
+                serve(args.port, parse_shards(args.shards))
+            )
+        except KeyboardInterrupt:
+            pass
+    else:
+        model = TokenERC20Model(max_events=args.max_events)
+        clients = bootstrap(model, args.accounts, 1_000_000)
+        elapsed = simulate_transfers(model, clients, args.transfers)
+        print(
+            json.dumps(
+                {
+                    "transfers": args.transfers,
+                    "seconds": round(elapsed, 3),
+                    "tps": round(args.transfers / elapsed),
+                    "state_keys": len(model.state),
+                    "block_height": model.block_height,
+                }
+            )
+        )
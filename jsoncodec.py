@@ -0,0 +1,205 @@
+"""
+Pluggable JSON codec for webhook bodies and admin API requests.
+
+`CODEC` is orjson when it is installed and the standard library otherwise;
+set JSON_CODEC=json to force the latter. `lazy_json` defers serialization
+until a log line is actually written.
+
+Run as a script for a microbenchmark of webhook parse and dispatch.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class JsonCodec:
+    def __init__(self, name: str, dumps, dumpb, loads):
+        self.name = name
+        self.dumps = dumps  # obj -> str
+        self.dumpb = dumpb  # obj -> bytes
+        self.loads = loads  # str | bytes -> obj
+
+
+def _json_dumps(obj) -> str:
+    return json.dumps(obj)
+
+
+def _json_dumpb(obj) -> bytes:
+    return json.dumps(obj).encode("utf-8")
+
+
+CODECS = {"json": JsonCodec("json", _json_dumps, _json_dumpb, json.loads)}
+
+if orjson:
+
+    def _orjson_dumpb(obj) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+    def _orjson_dumps(obj) -> str:
+        return _orjson_dumpb(obj).decode("utf-8")
+
+    CODECS["orjson"] = JsonCodec("orjson", _orjson_dumps, _orjson_dumpb, orjson.loads)
+
+
+def get_codec(name: str = None) -> JsonCodec:
+    """The named codec, or the fastest one available."""
+    if name:
+        if name not in CODECS:
+            raise Exception(f"JSON codec not available: {name}")
+        return CODECS[name]
+    return CODECS.get("orjson") or CODECS["json"]
+
+
+CODEC = get_codec(os.getenv("JSON_CODEC"))
+
+# errors raised by any codec's loads(); orjson.JSONDecodeError subclasses this
+DecodeError = ValueError
+
+
+class lazy_json:
+    """Serializes `obj` only when converted to a string, e.g. by a log call."""
+
+    __slots__ = ("obj", "indent")
+
+    def __init__(self, obj, indent: int = None):
+        self.obj = obj
+        self.indent = indent
+
+    def __str__(self):
+        if self.indent:
+            return json.dumps(self.obj, indent=self.indent)
+        return CODEC.dumps(self.obj)
+
+
+def sample_webhook(attributes: int = 8) -> dict:
+    """A present_proof_v2_0 "presentation-received" webhook of realistic size."""
+    referents = [f"0_attr{i}_uuid" for i in range(attributes)]
+    return {
+        "state": "presentation-received",
+        "pres_ex_id": "3fa85f64-5717-4562-b3fc-2c963f66afa6",
+        "connection_id": "8b1f2c5e-9d6e-4b1a-a1f0-6d9d2f4b6c11",
+        "thread_id": "a9d2c1b0-7e3f-4c2d-9b8a-0f1e2d3c4b5a",
+        "role": "verifier",
+        "initiator": "self",
+        "auto_present": False,
+        "trace": False,
+        "created_at": "2023-01-01T00:00:00.000000Z",
+        "updated_at": "2023-01-01T00:00:01.000000Z",
+        "by_format": {
+            "pres_request": {
+                "indy": {
+                    "name": "Proof of CBDC Bridge Access",
+                    "version": "1.0",
+                    "nonce": "1234567890123456789012345",
+                    "requested_attributes": {
+                        r: {
+                            "name": f"attr{i}",
+                            "restrictions": [
+                                {"schema_name": "cbdc bridging license schema"}
+                            ],
+                        }
+                        for (i, r) in enumerate(referents)
+                    },
+                    "requested_predicates": {},
+                }
+            },
+            "pres": {
+                "indy": {
+                    "proof": {
+                        "proofs": [
+                            {
+                                "primary_proof": {
+                                    "eq_proof": {
+                                        "revealed_attrs": {
+                                            f"attr{i}": str(10**40 + i)
+                                            for i in range(attributes)
+                                        },
+                                        "a_prime": "9" * 600,
+                                        "e": "8" * 160,
+                                        "v": "7" * 1200,
+                                        "m": {"master_secret": "6" * 180},
+                                        "m2": "5" * 180,
+                                    },
+                                    "ge_proofs": [],
+                                },
+                                "non_revoc_proof": None,
+                            }
+                        ],
+                        "aggregated_proof": {
+                            "c_hash": "4" * 77,
+                            "c_list": [[i % 256 for i in range(256)]] * 4,
+                        },
+                    },
+                    "requested_proof": {
+                        "revealed_attrs": {
+                            r: {
+                                "sub_proof_index": 0,
+                                "raw": f"value {i}",
+                                "encoded": str(10**40 + i),
+                            }
+                            for (i, r) in enumerate(referents)
+                        },
+                        "self_attested_attrs": {},
+                        "unrevealed_attrs": {},
+                        "predicates": {},
+                    },
+                    "identifiers": [
+                        {
+                            "schema_id": "Th7MpTaRZVRYnPiabds81Y:2:bridge:1.0",
+                            "cred_def_id": "Th7MpTaRZVRYnPiabds81Y:3:CL:12:default",
+                            "rev_reg_id": None,
+                            "timestamp": None,
+                        }
+                    ],
+                }
+            },
+        },
+    }
+
+
+async def benchmark(codec: JsonCodec, payload: dict, iterations: int) -> dict:
+    """Parse webhook bodies and dispatch them to a handle_<topic> coroutine."""
+
+    class Handlers:
+        seen = 0
+
+        async def handle_present_proof_v2_0(self, message):
+            if message["state"] == "presentation-received":
+                self.seen += 1
+
+    handlers = Handlers()
+    # the same bytes for every codec, as the agent would send them
+    body = json.dumps(payload).encode("utf-8")
+    start = time.perf_counter()
+    for _ in range(iterations):
+        message = codec.loads(body)
+        await getattr(handlers, "handle_present_proof_v2_0")(message)
+    elapsed = time.perf_counter() - start
+    return {
+        "codec": codec.name,
+        "payload_bytes": len(body),
+        "webhooks_per_second": round(iterations / elapsed),
+        "us_per_webhook": round(elapsed / iterations * 1e6, 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmarks webhook parse and dispatch per JSON codec."
+    )
+    parser.add_argument("--iterations", type=int, default=20_000)
+    parser.add_argument("--attributes", type=int, default=8)
+    args = parser.parse_args()
+
+    payload = sample_webhook(args.attributes)
+    loop = asyncio.new_event_loop()
+    for codec in CODECS.values():
+        print(json.dumps(loop.run_until_complete(benchmark(codec, payload, args.iterations))))
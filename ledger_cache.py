@@ -0,0 +1,148 @@
+"""
+Startup warm-up of the ledger objects (schemas and credential definitions)
+the bridge verifies presentations against.
+
+ACA-Py resolves a presentation's schemas and cred defs itself when it
+verifies it, and caches them, but only once the first presentation naming
+them arrives. LedgerCache keeps the ids (and last resolved value) of every
+schema and cred def named in proof restrictions or seen in a verified
+presentation in a JSON file, and at startup resolves them all through the
+agent, so ACA-Py's cache is warm before the first verification. The bridge
+does not read objects from this cache; it reports how many were warmed.
+
+Schemas and cred defs never change once written to an Indy ledger, so an
+entry only expires after LEDGER_CACHE_TTL, which guards against a ledger
+reset. Revocation state (registry deltas and accumulators) is never cached
+here: ACA-Py resolves it fresh for each verification, so revoking a
+credential takes effect at once.
+"""
+
+import asyncio
+import os
+import time
+
+from runners.jsoncodec import CODEC
+
+
+LEDGER_CACHE_TTL = float(os.getenv("LEDGER_CACHE_TTL", 86400))
+
+KINDS = {
+    "schema": ("/schemas/", "schema"),
+    "cred_def": ("/credential-definitions/", "credential_definition"),
+}
+
+
+def restriction_ids(proof_request: dict) -> list:
+    """(kind, id) of every schema and cred def named in the request's restrictions."""
+    ids = []
+    for group in ("requested_attributes", "requested_predicates"):
+        for spec in (proof_request.get(group) or {}).values():
+            for restriction in spec.get("restrictions", ()):
+                if "schema_id" in restriction:
+                    ids.append(("schema", restriction["schema_id"]))
+                if "cred_def_id" in restriction:
+                    ids.append(("cred_def", restriction["cred_def_id"]))
+    return ids
+
+
+class LedgerCache:
+    def __init__(
+        self,
+        agent,
+        path: str = None,
+        ttl: float = LEDGER_CACHE_TTL,
+        save_delay: float = 5.0,
+    ):
+        self.agent = agent
+        self.path = path
+        self.ttl = ttl
+        self.save_delay = save_delay
+        self.entries = {kind: {} for kind in KINDS}  # kind -> id -> [time, value]
+        self.warmed = 0
+        self._fetching = {}
+        self._save_timer = None
+        if path and os.path.exists(path):
+            with open(path, "rb") as f:
+                for (kind, entries) in CODEC.loads(f.read()).items():
+                    self.entries.setdefault(kind, {}).update(entries)
+
+    def cached(self, kind: str, object_id: str):
+        """Cached object, or None if missing or expired."""
+        entry = self.entries[kind].get(object_id)
+        if entry and time.time() - entry[0] < self.ttl:
+            return entry[1]
+        return None
+
+    async def fetch(self, kind: str, object_id: str):
+        """Resolve through the agent, sharing a fetch already in flight."""
+        key = (kind, object_id)
+        if key not in self._fetching:
+            self._fetching[key] = asyncio.ensure_future(self._fetch(kind, object_id))
+        try:
+            return await asyncio.shield(self._fetching[key])
+        finally:
+            if self._fetching.get(key) and self._fetching[key].done():
+                del self._fetching[key]
+
+    async def _fetch(self, kind: str, object_id: str):
+        (prefix, field) = KINDS[kind]
+        response = await self.agent.admin_GET(prefix + object_id)
+        value = response.get(field) if response else None
+        if value:
+            self.entries[kind][object_id] = [time.time(), value]
+            self._schedule_save()
+        return value
+
+    def learn(self, identifiers):
+        """Remember the (schema_id, cred_def_id) pairs of a presentation.
+
+        Unknown ids are resolved in the background, after verification has
+        put them in ACA-Py's cache, so they add no latency.
+        """
+        for (schema_id, cred_def_id) in identifiers:
+            for (kind, object_id) in (("schema", schema_id), ("cred_def", cred_def_id)):
+                if object_id and self.cached(kind, object_id) is None:
+                    asyncio.ensure_future(self._learn(kind, object_id))
+
+    async def _learn(self, kind: str, object_id: str):
+        try:
+            await self.fetch(kind, object_id)
+        except Exception as e:
+            self.agent.log(f"Could not resolve {kind} {object_id}: {e}")
+
+    async def warm(self, ids=()) -> int:
+        """Resolve every cached object and `ids` through the agent again."""
+        keys = {(kind, object_id) for kind in KINDS for object_id in self.entries[kind]}
+        keys.update(ids)
+        results = await asyncio.gather(
+            *(self.fetch(kind, object_id) for (kind, object_id) in keys),
+            return_exceptions=True,
+        )
+        self.warmed = sum(1 for r in results if r and not isinstance(r, Exception))
+        return self.warmed
+
+    def _schedule_save(self):
+        """Save once `save_delay` seconds after the first unsaved change."""
+        if not self.path or self._save_timer:
+            return
+        self._save_timer = asyncio.get_event_loop().call_later(
+            self.save_delay, self._save_later
+        )
+
+    def _save_later(self):
+        self._save_timer = None
+        data = CODEC.dumpb(self.entries)
+        asyncio.get_event_loop().run_in_executor(None, self._write, data)
+
+    def save(self):
+        if self._save_timer:
+            self._save_timer.cancel()
+            self._save_timer = None
+        if self.path:
+            self._write(CODEC.dumpb(self.entries))
+
+    def _write(self, data: bytes):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,209 @@
+"""
+Buffered, level-aware replacements for the demo's terminal logging.
+
+`log_status`, `log_msg` and `log_json` take the same arguments as their
+runners.support.utils counterparts, but only queue the formatted line: a
+background thread writes queued lines to stdout in batches, so webhook
+handlers never block on terminal I/O. Lines are formatted by the caller, so
+the writer never reads arguments the caller may still change. Each record
+belongs to a subsystem ("status" for the #NN narration, "msg", "json", and
+"agent" for `AriesAgent.log`) with its own level; a disabled record costs
+one dict lookup and is never formatted. At most `max_queued` lines wait for
+the writer; lines beyond that, or that fail to format, are dropped and
+counted in `dropped`.
+
+Levels come from LOG_LEVELS (or --log-levels), e.g. "status=off,json=debug"
+or "*=warning".
+
+Without an explicit stream, each batch goes to the current `sys.stdout`, so
+while a prompt is shown the lines go through prompt_toolkit's patch_stdout
+proxy, which is thread safe and redraws the prompt below them.
+"""
+
+import atexit
+import json
+import os
+import queue
+import re
+import sys
+import threading
+
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+OFF = 100
+LEVELS = {"debug": DEBUG, "info": INFO, "warning": WARNING, "off": OFF}
+
+ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*m")
+
+ANSI_COLORS = {
+    "ansiblack": "30",
+    "ansired": "31",
+    "ansigreen": "32",
+    "ansiyellow": "33",
+    "ansiblue": "34",
+    "ansimagenta": "35",
+    "ansicyan": "36",
+    "ansigray": "37",
+    "ansibrightblack": "90",
+    "ansibrightred": "91",
+    "ansibrightgreen": "92",
+    "ansibrightyellow": "93",
+    "ansibrightblue": "94",
+    "ansibrightmagenta": "95",
+    "ansibrightcyan": "96",
+    "ansiwhite": "97",
+}
+
+
+def parse_levels(spec: str) -> dict:
+    """Parse "subsystem=level,..." ("*" sets the default) into a level map."""
+    levels = {}
+    for item in (spec or "").split(","):
+        if "=" in item:
+            (subsystem, level) = item.split("=", 1)
+            level = level.strip().lower()
+            if level not in LEVELS:
+                raise Exception(f"Invalid log level: {level}")
+            levels[subsystem.strip()] = LEVELS[level]
+    return levels
+
+
+def _ansi(color) -> str:
+    """ANSI escape for a prompt_toolkit style string such as "fg:ansiblue"."""
+    codes = []
+    for part in (color or "").split():
+        if part == "bold":
+            codes.append("1")
+        elif part.startswith("fg:") and part[3:] in ANSI_COLORS:
+            codes.append(ANSI_COLORS[part[3:]])
+    return "\x1b[" + ";".join(codes) + "m" if codes else ""
+
+
+def format_msg(
+    *msg,
+    color=None,
+    label=None,
+    prefix=None,
+    indent=None,
+    end="\n",
+    ansi=False,
+    **kwargs,
+) -> str:
+    text = " ".join(str(m) for m in msg)
+    if label:
+        text = f"{label} {text}"
+    prefix_str = (prefix or "") + (" " * indent if indent else "")
+    if prefix_str:
+        text = "\n".join(prefix_str + line for line in text.split("\n"))
+    if ansi and color:
+        text = _ansi(color) + text + "\x1b[0m"
+    return text + end
+
+
+def format_json(data, label=None, **kwargs) -> str:
+    return format_msg(json.dumps(data, indent=4), label=label, **kwargs)
+
+
+def format_status(*msg, **kwargs) -> str:
+    kwargs.setdefault("color", "bold")
+    return "\n" + format_msg(*msg, **kwargs) + "\n"
+
+
+def _ansi_ok(stream) -> bool:
+    """Whether escapes written to `stream` reach a terminal as colors."""
+    if hasattr(stream, "original_stdout"):
+        # patch_stdout's proxy escapes them unless it was made raw
+        return bool(getattr(stream, "raw", False)) and stream.isatty()
+    return stream.isatty() if hasattr(stream, "isatty") else False
+
+
+class BufferedLog:
+    def __init__(
+        self,
+        stream=None,
+        levels: dict = None,
+        default_level: int = INFO,
+        max_batch: int = 1000,
+        max_queued: int = 10_000,
+    ):
+        self.stream = stream  # None: whatever sys.stdout is at write time
+        self.levels = {"*": default_level, **(levels or {})}
+        self.max_batch = max_batch
+        self.queue = queue.Queue(max_queued)
+        self.dropped = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def set_levels(self, levels: dict):
+        self.levels.update(levels)
+
+    def enabled(self, subsystem: str, level: int = INFO) -> bool:
+        return level >= self.levels.get(subsystem, self.levels["*"])
+
+    def emit(self, subsystem: str, level: int, formatter, *args, **kwargs):
+        """Queue `formatter(*args, **kwargs)` if the subsystem logs at `level`."""
+        if level < self.levels.get(subsystem, self.levels["*"]):
+            return
+        try:
+            # with colors; the writer strips them if its stream can't show them
+            line = formatter(*args, ansi=True, **kwargs)
+        except Exception:
+            self.dropped += 1
+            return
+        if not self._thread:
+            self._start()
+        try:
+            self.queue.put_nowait(line)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        with self._lock:
+            if not self._thread:
+                self._thread = threading.Thread(
+                    target=self._run, name="logbuffer", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stream = self.stream or sys.stdout
+            data = "".join(batch)
+            if not _ansi_ok(stream):
+                data = ANSI_ESCAPE.sub("", data)
+            try:
+                stream.write(data)
+                stream.flush()
+            except Exception:
+                self.dropped += len(batch)
+            for _ in batch:
+                self.queue.task_done()
+
+    def flush(self):
+        """Block until everything queued so far has been written."""
+        if self._thread:
+            self.queue.join()
+
+
+LOG = BufferedLog(levels=parse_levels(os.getenv("LOG_LEVELS")))
+atexit.register(LOG.flush)
+
+
+def log_msg(*msg, color="fg:ansimagenta", **kwargs):
+    LOG.emit("msg", INFO, format_msg, *msg, color=color, **kwargs)
+
+
+def log_status(*msg, **kwargs):
+    LOG.emit("status", INFO, format_status, *msg, **kwargs)
+
+
+def log_json(data, **kwargs):
+    LOG.emit("json", INFO, format_json, data, **kwargs)
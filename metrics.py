@@ -0,0 +1,229 @@
+"""
+Minimal Prometheus-style metrics for the demo agents.
+
+Counters, gauges and histograms are plain Python objects updated in place
+(an observation is a dict lookup plus a bisect), and are only formatted
+when the text endpoint is scraped.
+"""
+
+import time
+
+from bisect import bisect_left
+
+
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def _labels(names, values, extra: str = None) -> str:
+    pairs = [f'{n}="{v}"' for (n, v) in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def inc(self, *labelvalues, amount: float = 1):
+        self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for (labelvalues, value) in self.values.items():
+            lines.append(f"{self.name}{_labels(self.labelnames, labelvalues)} {value}")
+        return lines
+
+
+class Gauge:
+    """A gauge set directly, or read from a callable at scrape time."""
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.functions = {}
+
+    def set(self, value: float, *labelvalues):
+        self.values[labelvalues] = value
+
+    def set_function(self, function, *labelvalues):
+        self.functions[labelvalues] = function
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        values = dict(self.values)
+        for (labelvalues, function) in self.functions.items():
+            try:
+                values[labelvalues] = function()
+            except Exception:
+                continue
+        for (labelvalues, value) in values.items():
+            lines.append(f"{self.name}{_labels(self.labelnames, labelvalues)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self, name: str, help: str, labelnames=(), buckets: tuple = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labelvalues -> [per-bucket counts (+Inf last), sum, count]
+        self.series = {}
+
+    def observe(self, value: float, *labelvalues):
+        series = self.series.get(labelvalues)
+        if series is None:
+            series = self.series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def time(self, *labelvalues):
+        return _HistogramTimer(self, labelvalues)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for (labelvalues, (counts, total, count)) in self.series.items():
+            cumulative = 0
+            for (bound, bucket_count) in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                labels = _labels(self.labelnames, labelvalues, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class _HistogramTimer:
+    __slots__ = ("histogram", "labelvalues", "start")
+
+    def __init__(self, histogram: Histogram, labelvalues: tuple):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labelvalues)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labelnames=()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames=()) -> Gauge:
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames=(), **kwargs) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, **kwargs))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+ADMIN_REQUESTS = REGISTRY.histogram(
+    "aries_admin_request_seconds",
+    "Latency of admin API calls",
+    ("method", "route"),
+)
+ADMIN_ERRORS = REGISTRY.counter(
+    "aries_admin_request_errors_total", "Failed admin API calls", ("method", "route")
+)
+WEBHOOKS = REGISTRY.counter(
+    "aries_webhooks_total", "Webhook events dispatched", ("topic",)
+)
+EXCHANGES = REGISTRY.counter(
+    "aries_exchanges_total",
+    "Credential/presentation exchanges reaching a final state",
+    ("protocol", "state"),
+)
+PROOF_VERIFICATION = REGISTRY.histogram(
+    "aries_proof_verification_seconds",
+    "Time to verify a received presentation",
+    ("proof",),
+)
+FABRIC_SUBMISSIONS = REGISTRY.histogram(
+    "fabric_submission_seconds",
+    "Latency of Fabric gateway run-transaction calls",
+    ("method", "outcome"),
+)
+FABRIC_COMMITS = REGISTRY.histogram(
+    "fabric_commit_seconds",
+    "Time from queueing a Fabric transaction to its commit (or failure)",
+    ("method", "outcome"),
+)
+QUEUE_DEPTH = REGISTRY.gauge("queue_depth", "Items waiting in a queue", ("queue",))
+IN_FLIGHT = REGISTRY.gauge("in_flight", "Slots in use", ("resource",))
+ADMISSIONS = REGISTRY.counter(
+    "bridge_admissions_total",
+    "New bridge workflows admitted or rejected (queued: admitted after a wait)",
+    ("outcome",),
+)
+REVOCATION_STATES = REGISTRY.counter(
+    "revocation_state_requests_total",
+    "Non-revocation timestamps chosen by a holder (hit: shared with a recent proof)",
+    ("outcome",),
+)
+
+
+def route_of(path: str) -> str:
+    """Admin path with identifiers collapsed, to keep label cardinality low."""
+    route = []
+    for segment in path.split("?")[0].split("/"):
+        if len(segment) >= 20 or ":" in segment:
+            segment = "{id}"
+        route.append(segment)
+    return "/".join(route)
+
+
+async def start_metrics_server(port: int, registry: Registry = REGISTRY):
+    """Serve `GET /metrics` in the Prometheus text format."""
+    from aiohttp import web
+
+    async def handle_metrics(request):
+        return web.Response(
+            text=registry.render(), content_type="text/plain", charset="utf-8"
+        )
+
+    app = web.Application()
+    app.add_routes([web.get("/metrics", handle_metrics)])
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "0.0.0.0", port).start()
+    return runner
@@ -7,23 +7,24 @@ import time
 import datetime
 
 from aiohttp import ClientError
-from qrcode import QRCode
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from runners.agent_container import (  # noqa:E402
-    arg_parser,
-    create_agent_with_args,
-    AriesAgent,
-)
+from runners.startup_profile import STARTUP_PROFILE  # noqa:E402
+
+with STARTUP_PROFILE.phase("import runners.agent_container"):
+    from runners.agent_container import (  # noqa:E402
+        arg_parser,
+        create_agent_with_args,
+        AriesAgent,
+    )
 from runners.support.agent import (  # noqa:E402
     CRED_FORMAT_INDY,
     CRED_FORMAT_JSON_LD,
     SIG_TYPE_BLS,
 )
+from runners.logbuffer import log_msg, log_status  # noqa:E402
 from runners.support.utils import (  # noqa:E402
-    log_msg,
-    log_status,
     prompt,
     prompt_loop,
 )
@@ -73,7 +74,9 @@ class MinistryAgent(AriesAgent):
     def connection_ready(self):
         return self._connection_ready.done() and self._connection_ready.result()
 
-    def generate_credential_offer(self, aip, cred_type, cred_def_id, exchange_tracing):
+    def generate_credential_offer(
+        self, aip, cred_type, cred_def_id, exchange_tracing, connection_id=None
+    ):
         age = 24
         d = datetime.date.today()
         birth_date = datetime.date(d.year - age, d.month, d.day)
@@ -97,7 +100,7 @@ class MinistryAgent(AriesAgent):
                 ],
             }
         offer_request = {
-                "connection_id": self.connection_id,
+                "connection_id": connection_id or self.connection_id,
                 "cred_def_id": cred_def_id,
                 "comment": f"Offer on cred def id {cred_def_id}",
                 "auto_remove": True,
@@ -112,7 +115,8 @@ class MinistryAgent(AriesAgent):
 
 
 async def main(args):
-    ministry_agent = await create_agent_with_args(args, ident="ministry")
+    with STARTUP_PROFILE.phase("create agent container"):
+        ministry_agent = await create_agent_with_args(args, ident="ministry")
 
     try:
         log_status(
@@ -166,12 +170,29 @@ async def main(args):
         else:
             raise Exception("Invalid credential type:" + ministry_agent.cred_type)
 
-        # generate an invitation for Alice
-        await ministry_agent.generate_invitation(
-            display_qr=True, reuse_connections=ministry_agent.reuse_connections, wait=True
-        )
-
         exchange_tracing = False
+        if ministry_agent.invitation_pool or ministry_agent.multi_use_invitations:
+
+            async def offer_identity_credential(connection_id):
+                # each pooled connection gets its identity credential offer
+                offer_request = agent.generate_credential_offer(
+                    ministry_agent.aip,
+                    ministry_agent.cred_type,
+                    ministry_agent.cred_def_id,
+                    exchange_tracing,
+                    connection_id=connection_id,
+                )
+                await agent.admin_POST("/issue-credential-2.0/send-offer", offer_request)
+
+            await ministry_agent.generate_invitation_pool(
+                connection_workflow=offer_identity_credential, display_qr=True
+            )
+        else:
+            # generate an invitation for Alice
+            await ministry_agent.generate_invitation(
+                display_qr=True, reuse_connections=ministry_agent.reuse_connections, wait=True
+            )
+
         options = (
             "    (1) Issue Identity Credential\n"
             "    (2) Create New Invitation\n"
@@ -309,12 +330,16 @@ async def main(args):
             if timing:
                 for line in ministry_agent.agent.format_timing(timing):
                     log_msg(line)
+            revocation_states = ministry_agent.agent.revocation_states
+            log_msg(
+                "Revocation states:",
+                f"{revocation_states.hits} hits,",
+                f"{revocation_states.misses} misses",
+            )
 
     finally:
         terminated = await ministry_agent.terminate()
 
-    await asyncio.sleep(0.1)
-
     if not terminated:
         os._exit(1)
 
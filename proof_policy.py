@@ -0,0 +1,227 @@
+"""
+Declarative proof policy for the bridge.
+
+A policy names the proof requests the bridge sends and what to do once
+each one is verified. Each step defines a proof request (attributes,
+predicates and restrictions) and an `on_verified` follow-up: either the
+step to request next, or an action run with revealed attributes as its
+arguments. The policy is compiled once, at startup, into steps that hold
+their proof request template, the referent -> attribute mapping used to
+read presentations, and a lookup by proof name. Adding a step means
+editing the policy file, not the bridge.
+
+An attribute marked `secret: true` (the bridging license's privateKey) is
+used by the bridge but never written to the audit log; `audited` lists the
+attributes of a step that are.
+
+The policy is loaded from BRIDGE_PROOF_POLICY (YAML or JSON) if set, and
+otherwise is DEFAULT_POLICY, the bridge's identity -> CBDC license ->
+bridging license chain:
+
+    start: identity
+    steps:
+      identity:
+        name: Proof of Identity
+        attributes:
+          - name: name
+            restrictions: [{schema_name: identity schema}]
+        predicates:
+          - name: birthdate_dateint
+            p_type: "<="
+            min_age: 18   # p_value: the dateint of today minus 18 years
+            restrictions: [{schema_name: identity schema}]
+        on_verified: {request: cbdc}
+      ...
+"""
+
+import copy
+import datetime
+import json
+import os
+
+
+BRIDGE_PROOF_POLICY = os.getenv("BRIDGE_PROOF_POLICY")
+
+_BRIDGING_LICENSE = [{"schema_name": "cbdc bridging license schema"}]
+
+DEFAULT_POLICY = {
+    "start": "identity",
+    "steps": {
+        "identity": {
+            "name": "Proof of Identity",
+            "attributes": [
+                {"name": "name", "restrictions": [{"schema_name": "identity schema"}]}
+            ],
+            "predicates": [
+                {
+                    "name": "birthdate_dateint",
+                    "p_type": "<=",
+                    "min_age": 18,
+                    "restrictions": [{"schema_name": "identity schema"}],
+                }
+            ],
+            "on_verified": {"request": "cbdc"},
+        },
+        "cbdc": {
+            "name": "Proof of CBDC Access",
+            "attributes": [
+                {
+                    "name": "credential_type",
+                    "restrictions": [
+                        {"schema_name": "cbdc transacation license schema"}
+                    ],
+                }
+            ],
+            "on_verified": {"request": "bridge"},
+        },
+        "bridge": {
+            "name": "Proof of CBDC Bridge Access",
+            "attributes": [
+                {
+                    "name": name,
+                    "restrictions": _BRIDGING_LICENSE,
+                    "secret": name == "privateKey",
+                }
+                for name in (
+                    "credential_type",
+                    "pseudonym",
+                    "privateKey",
+                    "fabricID",
+                    "ethAddress",
+                )
+            ],
+            "on_verified": {
+                "action": "fabric",
+                # action argument -> revealed attribute
+                "args": {
+                    "user": "pseudonym",
+                    "fabricID": "fabricID",
+                    "ethAddress": "ethAddress",
+                },
+            },
+        },
+    },
+}
+
+
+def _dateint_years_ago(years: int) -> int:
+    today = datetime.date.today()
+    try:
+        date = today.replace(year=today.year - years)
+    except ValueError:
+        # 29 February
+        date = today.replace(year=today.year - years, day=28)
+    return int(date.strftime("%Y%m%d"))
+
+
+class ProofStep:
+    """A compiled policy step."""
+
+    __slots__ = (
+        "key",
+        "name",
+        "version",
+        "template",
+        "referents",
+        "dynamic_predicates",
+        "next_step",
+        "action",
+        "action_args",
+        "audited",
+    )
+
+    def __init__(self, key: str, spec: dict):
+        self.key = key
+        self.name = spec["name"]
+        self.version = str(spec.get("version", "1.0"))
+        attributes = {
+            f"0_{attr['name']}_uuid": {
+                "name": attr["name"],
+                "restrictions": attr.get("restrictions", []),
+            }
+            for attr in spec.get("attributes", ())
+        }
+        predicates = {}
+        self.dynamic_predicates = []
+        for pred in spec.get("predicates", ()):
+            referent = f"0_{pred['name']}_GE_uuid"
+            predicates[referent] = {
+                "name": pred["name"],
+                "p_type": pred.get("p_type", ">="),
+                "p_value": pred.get("p_value", 0),
+                "restrictions": pred.get("restrictions", []),
+            }
+            if "min_age" in pred:
+                self.dynamic_predicates.append((referent, int(pred["min_age"])))
+        self.template = {
+            "name": self.name,
+            "version": self.version,
+            "requested_attributes": attributes,
+            "requested_predicates": predicates,
+        }
+        # (referent, attribute name) of every requested attribute, in order
+        self.referents = tuple(
+            (referent, attr["name"]) for (referent, attr) in attributes.items()
+        )
+        # attributes that may be kept in the audit log
+        self.audited = frozenset(
+            attr["name"]
+            for attr in spec.get("attributes", ())
+            if not attr.get("secret")
+        )
+        on_verified = spec.get("on_verified") or {}
+        self.next_step = on_verified.get("request")
+        self.action = on_verified.get("action")
+        self.action_args = tuple((on_verified.get("args") or {}).items())
+
+    def proof_request(self) -> dict:
+        """The indy proof request, with date-dependent predicate values filled in."""
+        if not self.dynamic_predicates:
+            return self.template
+        request = copy.deepcopy(self.template)
+        for (referent, years) in self.dynamic_predicates:
+            request["requested_predicates"][referent]["p_value"] = _dateint_years_ago(
+                years
+            )
+        return request
+
+    def args_from(self, revealed: dict) -> dict:
+        return {arg: revealed.get(attr) for (arg, attr) in self.action_args}
+
+
+class ProofPolicy:
+    def __init__(self, policy: dict):
+        self.steps = {
+            key: ProofStep(key, spec) for (key, spec) in policy["steps"].items()
+        }
+        self.start = policy.get("start") or next(iter(self.steps))
+        self.by_name = {step.name: step for step in self.steps.values()}
+        for step in self.steps.values():
+            if step.next_step and step.next_step not in self.steps:
+                raise Exception(f"Unknown proof step in policy: {step.next_step}")
+        if self.start not in self.steps:
+            raise Exception(f"Unknown proof step in policy: {self.start}")
+
+    @classmethod
+    def load(cls, path: str = None):
+        if not path:
+            return cls(DEFAULT_POLICY)
+        with open(path) as f:
+            if path.endswith((".yml", ".yaml")):
+                import yaml
+
+                return cls(yaml.safe_load(f))
+            return cls(json.load(f))
+
+    def lanes(self) -> dict:
+        """Verification priority per step: steps further along the chain first."""
+        order = []
+        key = self.start
+        while key and key not in order:
+            order.append(key)
+            key = self.steps[key].next_step
+        order.extend(key for key in self.steps if key not in order)
+        return {key: len(order) - 1 - i for (i, key) in enumerate(order)}
+
+    def proof_requests(self) -> list:
+        return [step.template for step in self.steps.values()]
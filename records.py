@@ -0,0 +1,140 @@
+"""
+Compact records of received credentials and presentations.
+
+Webhook and admin responses carry the whole exchange (offers, requests,
+presentations, proofs) even though the handlers only look at a few fields.
+These records keep just those fields; the raw payload is kept as well only
+when KEEP_RAW_PAYLOADS is set, for debugging.
+"""
+
+import os
+
+
+KEEP_RAW_PAYLOADS = os.getenv("KEEP_RAW_PAYLOADS", "").lower() not in ("", "0", "false")
+
+
+class CredentialRecord:
+    """A credential stored in the holder's wallet (`GET /credential/{id}`)."""
+
+    __slots__ = ("cred_id", "cred_def_id", "schema_id", "attrs", "rev_reg_id", "raw")
+
+    def __init__(
+        self,
+        cred_id: str,
+        cred_def_id: str,
+        schema_id: str,
+        attrs: dict,
+        rev_reg_id: str = None,
+        raw: dict = None,
+    ):
+        self.cred_id = cred_id
+        self.cred_def_id = cred_def_id
+        self.schema_id = schema_id
+        self.attrs = attrs
+        self.rev_reg_id = rev_reg_id
+        self.raw = raw
+
+    @classmethod
+    def from_admin(cls, cred: dict, keep_raw: bool = KEEP_RAW_PAYLOADS):
+        return cls(
+            cred.get("referent"),
+            cred["cred_def_id"],
+            cred["schema_id"],
+            cred.get("attrs") or {},
+            cred.get("rev_reg_id"),
+            cred if keep_raw else None,
+        )
+
+    def __repr__(self):
+        return f"CredentialRecord({self.cred_id!r}, {self.cred_def_id!r})"
+
+
+class PresentationRecord:
+    """An indy presentation exchange, as seen by the verifier.
+
+    `requested` lists the requested attribute names in request order, and
+    `revealed` maps each revealed one to its raw value. `verified` is the
+    admin API's "true"/"false" (None until the presentation is verified).
+    """
+
+    __slots__ = (
+        "pres_ex_id",
+        "connection_id",
+        "name",
+        "verified",
+        "requested",
+        "revealed",
+        "identifiers",
+        "raw",
+    )
+
+    def __init__(
+        self,
+        pres_ex_id: str,
+        connection_id: str,
+        name: str,
+        verified: str,
+        requested: tuple,
+        revealed: dict,
+        identifiers: tuple,
+        raw: dict = None,
+    ):
+        self.pres_ex_id = pres_ex_id
+        self.connection_id = connection_id
+        self.name = name
+        self.verified = verified
+        self.requested = requested
+        self.revealed = revealed
+        self.identifiers = identifiers
+        self.raw = raw
+
+    @classmethod
+    def from_exchange(
+        cls,
+        message: dict,
+        verified: str = None,
+        keep_raw: bool = KEEP_RAW_PAYLOADS,
+        referents: tuple = None,
+    ):
+        """Parse a present-proof 2.0 webhook or exchange record (indy format).
+
+        `referents` is the (referent, attribute name) pairs of the request,
+        when known in advance; otherwise they are read from the request.
+        """
+        by_format = message.get("by_format") or {}
+        pres_req = (by_format.get("pres_request") or {}).get("indy") or {}
+        pres = (by_format.get("pres") or {}).get("indy") or {}
+        revealed_attrs = (pres.get("requested_proof") or {}).get("revealed_attrs", {})
+
+        if referents is None:
+            referents = tuple(
+                (referent, attr_spec.get("name"))
+                for (referent, attr_spec) in pres_req.get(
+                    "requested_attributes", {}
+                ).items()
+            )
+        revealed = {
+            name: revealed_attrs[referent]["raw"]
+            for (referent, name) in referents
+            if referent in revealed_attrs
+        }
+
+        return cls(
+            message.get("pres_ex_id"),
+            message.get("connection_id"),
+            pres_req.get("name"),
+            message.get("verified") if verified is None else verified,
+            tuple(name for (_, name) in referents),
+            revealed,
+            tuple(
+                (id_spec["schema_id"], id_spec["cred_def_id"])
+                for id_spec in pres.get("identifiers", ())
+            ),
+            message if keep_raw else None,
+        )
+
+    def __repr__(self):
+        return (
+            f"PresentationRecord({self.pres_ex_id!r}, {self.name!r}, "
+            f"verified={self.verified!r})"
+        )
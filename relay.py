@@ -0,0 +1,335 @@
+"""
+Escrow -> Ethereum relay stage for the bridge.
+
+Clients lock tokens on Fabric with Escrow (a Transfer to
+FABRIC_BRIDGE_IDENTITY). The relay picks those events up, checks the
+sender's fabricID -> ethAddress mapping, and mints the same amount to the
+mapped address on the Ethereum side. Mint calls are batched, given
+consecutive nonces from a local nonce manager, and submitted without
+waiting for earlier batches to be mined. A batch the node rejects, or an
+escrow with no receipt, is queued again after resyncing the nonces, up to
+`max_attempts` times; the node's per-escrow double-mint check keeps a
+retried batch from minting twice. The relay itself remembers only the most
+recent `max_seen` escrow references, in memory: the double-mint check is
+what keeps a replayed Escrow from minting again.
+
+`EvmStandIn` is a minimal local EVM endpoint (nonce-ordered mempool and
+token balances) used in place of a real chain.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from collections import OrderedDict, deque
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class EvmError(Exception):
+    """Raised by the EVM stand-in for a rejected transaction or batch."""
+
+
+class EvmStandIn:
+    """Local stand-in for an Ethereum node running the bridged token contract."""
+
+    def __init__(self, block_time: float = 0.0):
+        self.block_time = block_time
+        self.balances = {}  # eth address -> token balance
+        self.nonces = {}  # sender -> next nonce to execute
+        self.pending = {}  # (sender, nonce) -> tx waiting for earlier nonces
+        self.minted = {}  # escrow reference -> tx hash, to reject double mints
+        self.receipts = {}
+        self.tx_count = 0
+
+    async def get_transaction_count(self, sender: str) -> int:
+        """Pending nonce, as eth_getTransactionCount(sender, "pending")."""
+        nonce = self.nonces.get(sender, 0)
+        while (sender, nonce) in self.pending:
+            nonce += 1
+        return nonce
+
+    async def send_transactions(self, txs: list) -> list:
+        """Accept a JSON-RPC style batch; returns receipts once it is mined."""
+        for tx in txs:
+            if tx["nonce"] < self.nonces.get(tx["from"], 0):
+                raise EvmError(f"nonce too low: {tx['nonce']}")
+            self.pending[(tx["from"], tx["nonce"])] = tx
+        if self.block_time:
+            await asyncio.sleep(self.block_time)
+        for sender in {tx["from"] for tx in txs}:
+            self._execute(sender)
+        return [self.receipts.get(tx["hash"]) for tx in txs]
+
+    def _execute(self, sender: str):
+        nonce = self.nonces.get(sender, 0)
+        while (sender, nonce) in self.pending:
+            tx = self.pending.pop((sender, nonce))
+            (method, to, value, reference) = tx["data"]
+            status = 0
+            if method == "mint" and reference not in self.minted:
+                self.balances[to] = self.balances.get(to, 0) + value
+                self.minted[reference] = tx["hash"]
+                status = 1
+            self.receipts[tx["hash"]] = {
+                "transactionHash": tx["hash"],
+                "nonce": nonce,
+                "status": status,
+                "blockNumber": self.tx_count,
+            }
+            self.tx_count += 1
+            nonce += 1
+        self.nonces[sender] = nonce
+
+
+class NonceManager:
+    """Hands out consecutive nonces locally; resyncs from the node on error."""
+
+    def __init__(self, evm, sender: str):
+        self.evm = evm
+        self.sender = sender
+        self.next_nonce = None
+
+    async def allocate(self, count: int) -> int:
+        if self.next_nonce is None:
+            await self.resync()
+        first = self.next_nonce
+        self.next_nonce += count
+        return first
+
+    async def resync(self):
+        self.next_nonce = await self.evm.get_transaction_count(self.sender)
+
+
+class EscrowRelay:
+    """Batches verified escrows into pipelined Ethereum mint transactions."""
+
+    def __init__(
+        self,
+        address_mirror,
+        evm,
+        sender: str = "0xB41d6e0000000000000000000000000000000001",
+        batch_size: int = 100,
+        max_delay: float = 0.05,
+        max_in_flight: int = 8,
+        max_attempts: int = 3,
+        retry_delay: float = 1.0,
+        max_seen: int = 100_000,
+    ):
+        self.address_mirror = address_mirror
+        self.evm = evm
+        self.sender = sender
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.nonces = NonceManager(evm, sender)
+        self.queue = asyncio.Queue()
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self._tasks = set()
+        self._worker = None
+        self.max_seen = max_seen
+        self.seen = OrderedDict()  # most recent escrow references queued
+        self.relayed = 0
+        self.rejected = 0
+        self.retried = 0
+        self.latencies = deque(maxlen=10_000)
+        self.started_at = None
+
+    def on_event(self, event):
+        """Chaincode event listener; queues Escrow transfers for relaying."""
+        payload = event.payload
+        if isinstance(payload, (bytes, str)):
+            payload = json.loads(payload)
+        bridge = payload.get("FABRIC_BRIDGE_IDENTITY")
+        if event.event_name != "Transfer" or not bridge or payload["from"] == bridge:
+            # ordinary transfer, or a Refund from the bridge
+            return
+        self.submit(event.tx_id, payload["from"], payload["value"])
+
+    def submit(self, reference: str, fabric_id: str, value: int):
+        if reference in self.seen:
+            return
+        self.seen[reference] = True
+        while len(self.seen) > self.max_seen:
+            self.seen.popitem(last=False)
+        self.queue.put_nowait((reference, fabric_id, value, time.perf_counter(), 1))
+
+    async def start(self):
+        self.started_at = time.perf_counter()
+        self._worker = asyncio.ensure_future(self._run())
+
+    async def stop(self, timeout: float = None):
+        """Relay everything queued so far, for up to `timeout` seconds, then
+        stop the worker and cancel what is left."""
+        try:
+            await asyncio.wait_for(self._drain(), timeout)
+        except asyncio.TimeoutError:
+            LOGGER.warning(
+                f"Escrow relay stopped with {self.queue.qsize()} escrows queued"
+                f" and {len(self._tasks)} batches in flight"
+            )
+        for task in list(self._tasks):
+            task.cancel()
+        if self._worker:
+            self._worker.cancel()
+            self._worker = None
+
+    async def _drain(self):
+        while self._worker and not self._worker.done():
+            await self.queue.join()
+            if not self._tasks:
+                break
+            # a failed batch may be queued again
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _next_batch(self) -> list:
+        batch = [await self.queue.get()]
+        deadline = time.perf_counter() + self.max_delay
+        while len(batch) < self.batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                txs = []
+                for item in batch:
+                    (reference, fabric_id, value, _, _) = item
+                    eth_address = await self.address_mirror.lookup(fabric_id)
+                    if not eth_address:
+                        # no mapping means no SSI-verified bridge onboarding
+                        self.rejected += 1
+                        continue
+                    txs.append((item, ("mint", eth_address, value, reference)))
+                if txs:
+                    await self._in_flight.acquire()
+                    first = await self.nonces.allocate(len(txs))
+                    task = asyncio.ensure_future(self._send(first, txs))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def _send(self, first_nonce: int, txs: list):
+        try:
+            batch = [
+                {
+                    "from": self.sender,
+                    "nonce": first_nonce + i,
+                    "hash": f"0x{self.sender[-8:]}{first_nonce + i:056x}",
+                    "data": data,
+                }
+                for (i, (_, data)) in enumerate(txs)
+            ]
+            try:
+                receipts = await self.evm.send_transactions(batch)
+            except Exception:
+                # nonces may now be out of step with the node
+                await self.nonces.resync()
+                await self._retry([item for (item, _) in txs])
+                return
+            now = time.perf_counter()
+            unconfirmed = []
+            for ((item, _), receipt) in zip(txs, receipts):
+                if receipt is None:
+                    # not mined (e.g. stuck behind a lost nonce)
+                    unconfirmed.append(item)
+                elif receipt["status"]:
+                    self.relayed += 1
+                    self.latencies.append(now - item[3])
+                else:
+                    self.rejected += 1
+            if unconfirmed:
+                await self.nonces.resync()
+                await self._retry(unconfirmed)
+        finally:
+            self._in_flight.release()
+
+    async def _retry(self, items: list):
+        await asyncio.sleep(self.retry_delay)
+        for (reference, fabric_id, value, queued_at, attempts) in items:
+            if attempts < self.max_attempts:
+                self.retried += 1
+                self.queue.put_nowait(
+                    (reference, fabric_id, value, queued_at, attempts + 1)
+                )
+            else:
+                self.seen.pop(reference, None)
+                self.rejected += 1
+
+    def stats(self) -> dict:
+        elapsed = time.perf_counter() - (self.started_at or time.perf_counter())
+        latencies = sorted(self.latencies)
+
+        def pct(p):
+            return round(latencies[int(p * (len(latencies) - 1))] * 1000, 3)
+
+        return {
+            "relayed": self.relayed,
+            "rejected": self.rejected,
+            "retried": self.retried,
+            "throughput_per_sec": round(self.relayed / elapsed, 1) if elapsed else 0,
+            "latency_ms_p50": pct(0.5) if latencies else None,
+            "latency_ms_p99": pct(0.99) if latencies else None,
+            "latency_ms_max": pct(1.0) if latencies else None,
+        }
+
+
+async def benchmark(escrows: int, clients: int, block_time: float, batch_size: int):
+    """Escrow on the Fabric stand-in and relay to the EVM stand-in."""
+    from runners.address_mapping import AddressMappingMirror
+    from runners.fabric_sim import TokenERC20Model, x509_id
+
+    model = TokenERC20Model()
+    mirror = AddressMappingMirror()
+    model.block_listeners.append(lambda b, t, w: mirror.apply_block(b, w))
+    minter = x509_id("minter")
+    model.invoke("Initialize", ("CBDC", "CBDC", "2"), minter)
+    model.invoke("Mint", (escrows + clients,), minter)
+    accounts = [x509_id(f"user{i}") for i in range(clients)]
+    for (i, fabric_id) in enumerate(accounts):
+        # appendAddressMapping resets the balance, so fund the client after it
+        model.invoke("appendAddressMapping", (fabric_id, f"0x{i:040x}"), fabric_id)
+        model.invoke("Transfer", (fabric_id, escrows // clients + 1), minter)
+
+    relay = EscrowRelay(mirror, EvmStandIn(block_time), batch_size=batch_size)
+    model.listeners.append(relay.on_event)
+    await relay.start()
+    for i in range(escrows):
+        model.invoke("Escrow", (1, f"escrow-{i}"), accounts[i % clients])
+        if i % batch_size == 0:
+            # let the relay drain while escrows keep arriving
+            await asyncio.sleep(0)
+    await relay.stop()
+    return relay.stats()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the escrow relay.")
+    parser.add_argument("--escrows", type=int, default=50_000)
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--block-time", type=float, default=0.01)
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    stats = asyncio.get_event_loop().run_until_complete(
+        benchmark(args.escrows, args.clients, args.block_time, args.batch_size)
+    )
+    print(json.dumps(stats))
@@ -0,0 +1,77 @@
+"""
+Time-bucketed non-revocation intervals.
+
+A verifier asking for non-revocation "as of now" gives every proof request
+a unique timestamp, so every presentation needs its own revocation delta
+and witness. NonRevokedPolicy aligns `to` down to a NON_REVOKED_BUCKET
+second window instead, and sends `from` as NON_REVOKED_MAX_AGE seconds
+before the aligned `to`. Requests in the same window then send the same
+interval and ask for the same revocation state. A proof may then show the
+registry as it was up to NON_REVOKED_MAX_AGE + NON_REVOKED_BUCKET seconds
+ago, the freshness bound the verifier accepts; a bucket longer than the
+maximum age is not aligned.
+
+On the holder side, RevocationStateCache remembers the timestamp proven
+for each (rev_reg_id, bucket). Later presentations reuse it while it lies
+within the request's interval, so a burst of proofs asks the ledger for
+the same deltas. A request without `from` accepts a timestamp up to one
+cache bucket before its `to`.
+"""
+
+import os
+import time
+from collections import OrderedDict
+
+from runners.metrics import REVOCATION_STATES
+
+
+NON_REVOKED_BUCKET = int(os.getenv("NON_REVOKED_BUCKET", 0))
+NON_REVOKED_MAX_AGE = int(os.getenv("NON_REVOKED_MAX_AGE", 300))
+
+
+class NonRevokedPolicy:
+    def __init__(
+        self, bucket: int = NON_REVOKED_BUCKET, max_age: int = NON_REVOKED_MAX_AGE
+    ):
+        self.bucket = bucket
+        self.max_age = max_age
+
+    def interval(self, now: int = None) -> dict:
+        now = int(time.time()) if now is None else now
+        if self.bucket <= 0:
+            return {"to": now}
+        to = now if self.bucket > self.max_age else now - now % self.bucket
+        return {"from": to - self.max_age, "to": to}
+
+
+class RevocationStateCache:
+    def __init__(
+        self, bucket: int = NON_REVOKED_BUCKET or 60, max_entries: int = 1000
+    ):
+        self.bucket = bucket
+        self.max_entries = max_entries
+        self.timestamps = OrderedDict()  # (rev_reg_id, bucket) -> timestamp
+        self.hits = 0
+        self.misses = 0
+
+    def timestamp(self, rev_reg_id: str, interval: dict) -> int:
+        """The timestamp to prove non-revocation at, for the request's interval."""
+        to = interval.get("to") or int(time.time())
+        start = interval.get("from")
+        if start is None:
+            start = to - self.bucket
+        key = (rev_reg_id, to // self.bucket)
+        cached = self.timestamps.get(key)
+        if cached is not None and start <= cached <= to:
+            self.hits += 1
+            REVOCATION_STATES.inc("hit")
+            return cached
+        self.misses += 1
+        REVOCATION_STATES.inc("miss")
+        self.timestamps[key] = to
+        while len(self.timestamps) > self.max_entries:
+            self.timestamps.popitem(last=False)
+        return to
+
+
+NON_REVOKED_POLICY = NonRevokedPolicy()
@@ -0,0 +1,135 @@
+"""
+Signing contexts for Fabric submissions made on behalf of clients.
+
+A client's pseudonym (revealed in its bridging license proof) names the
+keychain entry its transactions are signed with. Checking that entry and
+building the `signingCredential` is done once per pseudonym. The result
+is kept in an LRU cache until it expires, is evicted, or is revoked
+explicitly, for example when the client's license is revoked or the
+gateway rejects the keychain entry.
+
+The check is a format check of the keychainId/keychainRef. When
+FABRIC_KEYCHAIN_URL is set, it also asks the keychain plugin whether the
+entry exists (has-keychain-entry). Only its answer that the entry is not
+present rejects a client. If the plugin can't be reached, times out or
+errs, the context is used unchecked, and not cached, so the gateway
+decides as it did before the cache existed. A check still in flight when
+its context is revoked is not cached either.
+"""
+
+import asyncio
+import os
+import re
+import time
+from collections import OrderedDict
+
+from aiohttp import ClientError
+
+
+FABRIC_KEYCHAIN_URL = os.getenv("FABRIC_KEYCHAIN_URL")
+SIGNING_CONTEXT_TTL = float(os.getenv("SIGNING_CONTEXT_TTL", 3600))
+
+# any printable reference without whitespace
+KEYCHAIN_REF_PATTERN = re.compile(r"^[^\s\x00-\x1f\x7f]{1,512}$")
+
+
+class SigningContext:
+    __slots__ = ("pseudonym", "credential", "validated_at")
+
+    def __init__(self, pseudonym: str, keychain_id: str, validated_at: float):
+        self.pseudonym = pseudonym
+        # sent as is in every run-transaction payload signed by this client
+        self.credential = {"keychainId": keychain_id, "keychainRef": pseudonym}
+        self.validated_at = validated_at
+
+
+class SigningContextCache:
+    def __init__(
+        self,
+        keychain_id: str,
+        session=None,
+        keychain_url: str = FABRIC_KEYCHAIN_URL,
+        max_entries: int = 10_000,
+        ttl: float = SIGNING_CONTEXT_TTL,
+    ):
+        self.keychain_id = keychain_id
+        self.session = session
+        self.keychain_url = keychain_url
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.contexts = OrderedDict()  # pseudonym -> SigningContext
+        self.hits = 0
+        self.misses = 0
+        self._validating = {}
+        self._revocations = 0  # revoke() calls, to spot one during a check
+
+    async def get(self, pseudonym: str):
+        """The client's signing context, or None if its keychain entry is invalid."""
+        context = self.contexts.get(pseudonym)
+        if context and time.monotonic() - context.validated_at < self.ttl:
+            self.contexts.move_to_end(pseudonym)
+            self.hits += 1
+            return context
+        self.misses += 1
+        if pseudonym not in self._validating:
+            self._validating[pseudonym] = asyncio.ensure_future(
+                self._validate(pseudonym)
+            )
+        try:
+            return await asyncio.shield(self._validating[pseudonym])
+        finally:
+            task = self._validating.get(pseudonym)
+            if task and task.done():
+                del self._validating[pseudonym]
+
+    async def _validate(self, pseudonym: str):
+        revocations = self._revocations
+        valid = await self.check(pseudonym)
+        if valid is None or revocations != self._revocations:
+            if valid is False:
+                return None
+            # unchecked, or revoked meanwhile: checked again next time
+            return SigningContext(pseudonym, self.keychain_id, time.monotonic())
+        if not valid:
+            self.contexts.pop(pseudonym, None)
+            return None
+        context = SigningContext(pseudonym, self.keychain_id, time.monotonic())
+        self.contexts[pseudonym] = context
+        self.contexts.move_to_end(pseudonym)
+        while len(self.contexts) > self.max_entries:
+            self.contexts.popitem(last=False)
+        return context
+
+    async def check(self, pseudonym: str):
+        """True if the entry is valid, False if not, None if it can't be told."""
+        if not (
+            self.keychain_id
+            and pseudonym
+            and KEYCHAIN_REF_PATTERN.match(pseudonym)
+        ):
+            return False
+        if not (self.keychain_url and self.session):
+            return True
+        try:
+            async with self.session.post(
+                self.keychain_url + "/has-keychain-entry", json={"key": pseudonym}
+            ) as resp:
+                if resp.status != 200:
+                    return None
+                result = await resp.json(content_type=None)
+        except (ClientError, asyncio.TimeoutError, ValueError):
+            # unchecked, and so checked again on the next submission
+            return None
+        present = result.get("isPresent") if isinstance(result, dict) else None
+        return present if isinstance(present, bool) else None
+
+    def revoke(self, pseudonym: str) -> bool:
+        """Forget a client's context; its next submission is checked again."""
+        self._revocations += 1
+        self._validating.pop(pseudonym, None)
+        return self.contexts.pop(pseudonym, None) is not None
+
+    def revoke_all(self):
+        self._revocations += 1
+        self._validating.clear()
+        self.contexts.clear()
@@ -0,0 +1,60 @@
+import os
+import time
+
+from contextlib import contextmanager
+
+
+# taken when this module is first imported, i.e. before any of the heavy
+# runner/support modules are loaded by the entry point
+STARTUP_T0 = time.perf_counter()
+STARTUP_BUDGET = float(os.getenv("STARTUP_BUDGET", 0) or 0)
+
+
+class StartupProfile:
+    """Records import and initialization phases from process start to ready."""
+
+    def __init__(self, budget: float = None):
+        self.t0 = STARTUP_T0
+        self.budget = budget if budget is not None else STARTUP_BUDGET
+        self.phases = []
+        self.ready_at = None
+        self._depth = 0
+
+    @contextmanager
+    def phase(self, label: str):
+        """Time a phase; phases may be nested (e.g. imports of imports)."""
+        entry = [label, self._depth, 0.0]
+        self.phases.append(entry)
+        self._depth += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry[2] = time.perf_counter() - start
+            self._depth -= 1
+
+    def mark_ready(self):
+        if self.ready_at is None:
+            self.ready_at = time.perf_counter()
+
+    @property
+    def total(self) -> float:
+        return (self.ready_at or time.perf_counter()) - self.t0
+
+    def over_budget(self) -> bool:
+        return bool(self.budget) and self.total > self.budget
+
+    def format_report(self) -> list:
+        lines = ["Startup profile (seconds since first runner import):"]
+        for (label, depth, elapsed) in self.phases:
+            lines.append(f"  {'  ' * depth}{label:<{48 - 2 * depth}} {elapsed:8.3f}")
+        lines.append(f"  {'Ready':<48} {self.total:8.3f}")
+        if self.budget:
+            lines.append(
+                f"  {'Budget':<48} {self.budget:8.3f}"
+                + ("  ** EXCEEDED **" if self.over_budget() else "")
+            )
+        return lines
+
+
+STARTUP_PROFILE = StartupProfile()
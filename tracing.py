@@ -0,0 +1,204 @@
+"""
+Lightweight in-process tracing of credential/proof exchanges.
+
+A trace is opened per client connection (keyed by connection_id) and every
+stage of that client's flow - proof requests, verification, admin calls,
+Fabric submissions - is recorded as a span under it. The current span is
+held in a context variable, so handler tasks spawned while it is set (e.g.
+webhook dispatch) inherit it. Traces are sampled by a hash of their key;
+an unsampled trace costs that hash when opened and one dict lookup per
+stage, and is not stored. Finished spans are buffered and
+written to a local JSON-lines file.
+"""
+
+import contextvars
+import hashlib
+import json
+import os
+import random
+import time
+
+
+CURRENT_SPAN = contextvars.ContextVar("current_span", default=None)
+
+
+def _new_id(bits: int = 64) -> str:
+    return format(random.getrandbits(bits), f"0{bits // 4}x")
+
+
+class Span:
+    __slots__ = (
+        "tracer",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "name",
+        "attrs",
+        "started_at",
+        "start",
+        "duration",
+        "_token",
+    )
+
+    def __init__(self, tracer, name: str, trace_id: str, parent_id: str, attrs: dict):
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.span_id = _new_id()
+        self.parent_id = parent_id
+        self.name = name
+        self.attrs = attrs
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+        self._token = None
+
+    @property
+    def traceparent(self) -> str:
+        """W3C trace context header value, for calls to other services."""
+        return f"00-{self.trace_id:0>32}-{self.span_id}-01"
+
+    def child(self, name: str, **attrs):
+        return Span(self.tracer, name, self.trace_id, self.span_id, attrs)
+
+    def end(self, **attrs):
+        if self.duration is None:
+            self.duration = time.perf_counter() - self.start
+            self.attrs.update(attrs)
+            self.tracer.export(self)
+
+    def __enter__(self):
+        self._token = CURRENT_SPAN.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        CURRENT_SPAN.reset(self._token)
+        self.end(**({"error": repr(exc)} if exc else {}))
+
+    def as_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.started_at,
+            "duration_ms": None
+            if self.duration is None
+            else round(self.duration * 1000, 3),
+            "attrs": self.attrs,
+        }
+
+
+class _NoopSpan:
+    """Stands in for a span of an unsampled (or absent) trace."""
+
+    traceparent = None
+
+    def child(self, name: str, **attrs):
+        return self
+
+    def end(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    def __init__(self, sample_rate: float = 0.0, path: str = None, batch: int = 100):
+        self.sample_rate = sample_rate
+        self.path = path
+        self.batch = batch
+        self.traces = {}  # key (connection_id) -> root span
+        self.open_spans = {}  # key (e.g. pres_ex_id) -> span awaiting a later event
+        self._buffer = []
+
+    def configure(self, sample_rate: float = None, path: str = None):
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        if path:
+            self.path = path
+
+    def start_trace(self, key: str, name: str, **attrs):
+        """Open (or return) the trace for `key`, subject to sampling.
+
+        Sampling is decided by a hash of the key, so later events of an
+        unsampled exchange don't get another chance to start a trace, and
+        nothing is kept for unsampled keys.
+        """
+        span = self.traces.get(key)
+        if span is None:
+            if not self.sampled(key):
+                return NOOP_SPAN
+            span = Span(self, name, _new_id(128), None, attrs)
+            self.traces[key] = span
+        return span
+
+    def sampled(self, key: str) -> bool:
+        if self.sample_rate <= 0:
+            return False
+        digest = hashlib.sha256(str(key).encode()).digest()
+        return int.from_bytes(digest[:8], "big") < self.sample_rate * 2 ** 64
+
+    def trace_for(self, key: str):
+        return self.traces.get(key, NOOP_SPAN) if self.traces else NOOP_SPAN
+
+    def end_trace(self, key: str, **attrs):
+        span = self.traces.pop(key, None)
+        if span:
+            span.end(**attrs)
+
+    def span(self, name: str, parent=None, **attrs):
+        """A child of `parent` (default: the current span), or a no-op span."""
+        parent = parent or CURRENT_SPAN.get()
+        if parent is None:
+            return NOOP_SPAN
+        return parent.child(name, **attrs)
+
+    def open_span(self, key: str, name: str, parent, **attrs):
+        """Start a span that a later webhook closes with `close_span(key)`."""
+        span = parent.child(name, **attrs)
+        if span is not NOOP_SPAN:
+            self.open_spans[key] = span
+        return span
+
+    def close_span(self, key: str, **attrs):
+        span = self.open_spans.pop(key, None) if self.open_spans else None
+        if span:
+            span.end(**attrs)
+        return span or NOOP_SPAN
+
+    def export(self, span: Span):
+        if not self.path:
+            return
+        self._buffer.append(span.as_dict())
+        if len(self._buffer) >= self.batch:
+            self.flush()
+
+    def flush(self):
+        if self._buffer and self.path:
+            with open(self.path, "a") as f:
+                f.write("".join(json.dumps(s) + "\n" for s in self._buffer))
+        self._buffer = []
+
+    def close(self):
+        """Export unfinished spans (marked as such) and flush the buffer."""
+        for span in list(self.open_spans.values()) + list(self.traces.values()):
+            if span is NOOP_SPAN or span.duration is not None:
+                continue
+            span.attrs["unfinished"] = True
+            self._buffer.append(span.as_dict())
+        self.open_spans.clear()
+        self.traces.clear()
+        self.flush()
+
+
+TRACER = Tracer(
+    sample_rate=float(os.getenv("TRACE_SAMPLE_RATE", 0) or 0),
+    path=os.getenv("TRACE_FILE"),
+)
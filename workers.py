@@ -0,0 +1,572 @@
+"""
+Partitioned workflow state for running the bridge as several worker processes.
+
+Connections are split into NUM_PARTITIONS partitions by a hash of their
+connection_id, and partitions are spread over the live workers with a
+consistent-hash ring, so a worker joining or leaving only moves its share.
+Workflow events (a connection to start proofs for, a presentation to verify)
+are written to a shared store before they are handled; the worker owning the
+connection's partition claims and handles them, and deletes them when done.
+A claim expires with its worker's lease and is renewed while the event is
+being handled, so when a worker is lost the new owners of its partitions
+pick up both its unhandled events and the workflows it had in progress. A
+redelivered event may already have been (partly) handled, so handlers must
+check the workflow's saved stage before repeating a side effect.
+
+Workers on one host share a SQLite file (`SqliteWorkflowStore`);
+`MemoryWorkflowStore` is an in-process stand-in with the same interface.
+The workers' agents must share their wallet (a multi-instance ACA-Py
+deployment), so any worker can act on any connection's records.
+
+Run as a script to measure scaling with simulated workers:
+
+    python workers.py --workers 1 2 4 --events 20000 [--kill-one]
+"""
+
+import argparse
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+import uuid
+
+
+NUM_PARTITIONS = 64
+
+LOGGER = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS workers (worker_id TEXT PRIMARY KEY, heartbeat REAL);
+CREATE TABLE IF NOT EXISTS workflows (
+    connection_id TEXT PRIMARY KEY,
+    partition INTEGER,
+    worker_id TEXT,
+    stage TEXT,
+    data TEXT,
+    updated REAL
+);
+CREATE INDEX IF NOT EXISTS workflows_partition ON workflows (partition, stage);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    partition INTEGER,
+    connection_id TEXT,
+    topic TEXT,
+    payload TEXT,
+    claimed_by TEXT,
+    claimed_at REAL
+);
+CREATE INDEX IF NOT EXISTS events_partition ON events (partition, id);
+"""
+
+DONE = "done"
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+def partition_of(connection_id: str) -> int:
+    return _hash(connection_id) % NUM_PARTITIONS
+
+
+class HashRing:
+    """Consistent-hash ring of worker ids, with virtual nodes for balance."""
+
+    def __init__(self, nodes, vnodes: int = 64):
+        self.nodes = sorted(nodes)
+        ring = sorted(
+            (_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(vnodes)
+        )
+        self._keys = [k for (k, _) in ring]
+        self._nodes = [n for (_, n) in ring]
+
+    def owner(self, partition: int) -> str:
+        if not self._keys:
+            return None
+        i = bisect.bisect(self._keys, _hash(f"partition-{partition}"))
+        return self._nodes[i % len(self._nodes)]
+
+    def partitions_of(self, node: str) -> set:
+        return {p for p in range(NUM_PARTITIONS) if self.owner(p) == node}
+
+
+class SqliteWorkflowStore:
+    """Workflow store shared by the worker processes of one host."""
+
+    def __init__(self, path: str):
+        self.db = sqlite3.connect(path, isolation_level=None, timeout=30.0)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    # workers
+    def heartbeat(self, worker_id: str, now: float):
+        self.db.execute(
+            "INSERT OR REPLACE INTO workers VALUES (?, ?)", (worker_id, now)
+        )
+
+    def live_workers(self, since: float) -> list:
+        return [
+            row[0]
+            for row in self.db.execute(
+                "SELECT worker_id FROM workers WHERE heartbeat >= ?", (since,)
+            )
+        ]
+
+    def remove_worker(self, worker_id: str):
+        self.db.execute("DELETE FROM workers WHERE worker_id = ?", (worker_id,))
+
+    # events
+    def put_event(self, partition, connection_id, topic, payload, claimed_by, now):
+        cursor = self.db.execute(
+            "INSERT INTO events"
+            " (partition, connection_id, topic, payload, claimed_by, claimed_at)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                partition,
+                connection_id,
+                topic,
+                json.dumps(payload),
+                claimed_by,
+                now if claimed_by else None,
+            ),
+        )
+        return cursor.lastrowid
+
+    def claim_events(self, partitions, worker_id, expired_before, now, limit) -> list:
+        """Claim unclaimed (or expired) events of `partitions`, oldest first."""
+        if not partitions:
+            return []
+        marks = ",".join("?" * len(partitions))
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self.db.execute(
+                "SELECT id, connection_id, topic, payload FROM events"
+                f" WHERE partition IN ({marks})"
+                " AND (claimed_by IS NULL OR claimed_at < ?)"
+                " ORDER BY id LIMIT ?",
+                (*partitions, expired_before, limit),
+            ).fetchall()
+            self.db.executemany(
+                "UPDATE events SET claimed_by = ?, claimed_at = ? WHERE id = ?",
+                [(worker_id, now, row[0]) for row in rows],
+            )
+            self.db.execute("COMMIT")
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+        return [(i, c, t, json.loads(p)) for (i, c, t, p) in rows]
+
+    def renew_claims(self, event_ids, worker_id, now):
+        if event_ids:
+            self.db.executemany(
+                "UPDATE events SET claimed_at = ? WHERE id = ? AND claimed_by = ?",
+                [(now, i, worker_id) for i in event_ids],
+            )
+
+    def complete_events(self, event_ids: list):
+        if event_ids:
+            self.db.execute("BEGIN")
+            self.db.executemany(
+                "DELETE FROM events WHERE id = ?", [(i,) for i in event_ids]
+            )
+            self.db.execute("COMMIT")
+
+    def pending_events(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+    # workflows
+    def save_workflow(self, connection_id, partition, worker_id, stage, data, now):
+        self.db.execute(
+            "INSERT OR REPLACE INTO workflows VALUES (?, ?, ?, ?, ?, ?)",
+            (connection_id, partition, worker_id, stage, json.dumps(data), now),
+        )
+
+    def load_workflow(self, connection_id: str):
+        row = self.db.execute(
+            "SELECT stage, data FROM workflows WHERE connection_id = ?",
+            (connection_id,),
+        ).fetchone()
+        return (row[0], json.loads(row[1])) if row else (None, {})
+
+    def orphaned_workflows(self, partitions, live_workers) -> list:
+        """Unfinished workflows of `partitions` last run by a worker now gone."""
+        if not partitions:
+            return []
+        marks = ",".join("?" * len(partitions))
+        live = ",".join("?" * len(live_workers)) or "NULL"
+        return [
+            (c, s, json.loads(d))
+            for (c, s, d) in self.db.execute(
+                "SELECT connection_id, stage, data FROM workflows"
+                f" WHERE partition IN ({marks}) AND stage != ?"
+                f" AND worker_id NOT IN ({live})",
+                (*partitions, DONE, *live_workers),
+            )
+        ]
+
+    def close(self):
+        self.db.close()
+
+
+class MemoryWorkflowStore:
+    """In-process stand-in for SqliteWorkflowStore."""
+
+    def __init__(self):
+        self.workers = {}
+        self.events = {}
+        self.workflows = {}
+        self._next_id = 1
+
+    def heartbeat(self, worker_id, now):
+        self.workers[worker_id] = now
+
+    def live_workers(self, since):
+        return [w for (w, beat) in self.workers.items() if beat >= since]
+
+    def remove_worker(self, worker_id):
+        self.workers.pop(worker_id, None)
+
+    def put_event(self, partition, connection_id, topic, payload, claimed_by, now):
+        event_id = self._next_id
+        self._next_id += 1
+        self.events[event_id] = [
+            partition,
+            connection_id,
+            topic,
+            payload,
+            claimed_by,
+            now if claimed_by else None,
+        ]
+        return event_id
+
+    def claim_events(self, partitions, worker_id, expired_before, now, limit):
+        claimed = []
+        for (event_id, event) in self.events.items():
+            if len(claimed) >= limit:
+                break
+            if event[0] in partitions and (event[4] is None or event[5] < expired_before):
+                event[4:6] = [worker_id, now]
+                claimed.append((event_id, event[1], event[2], event[3]))
+        return claimed
+
+    def renew_claims(self, event_ids, worker_id, now):
+        for event_id in event_ids:
+            event = self.events.get(event_id)
+            if event and event[4] == worker_id:
+                event[5] = now
+
+    def complete_events(self, event_ids):
+        for event_id in event_ids:
+            self.events.pop(event_id, None)
+
+    def pending_events(self):
+        return len(self.events)
+
+    def save_workflow(self, connection_id, partition, worker_id, stage, data, now):
+        self.workflows[connection_id] = (partition, worker_id, stage, data, now)
+
+    def load_workflow(self, connection_id):
+        workflow = self.workflows.get(connection_id)
+        return (workflow[2], workflow[3]) if workflow else (None, {})
+
+    def orphaned_workflows(self, partitions, live_workers):
+        return [
+            (c, stage, data)
+            for (c, (p, w, stage, data, _)) in self.workflows.items()
+            if p in partitions and stage != DONE and w not in live_workers
+        ]
+
+    def close(self):
+        pass
+
+
+class WorkerGroup:
+    """One worker's membership in the group, and its share of the events.
+
+    `handler(topic, payload)` handles an event of a connection this worker
+    owns; `resume(connection_id, stage, data)` restarts a workflow taken over
+    from a lost worker.
+    """
+
+    def __init__(
+        self,
+        store,
+        handler,
+        resume=None,
+        worker_id: str = None,
+        lease_ttl: float = 10.0,
+        poll_interval: float = 0.05,
+        batch_size: int = 100,
+    ):
+        self.store = store
+        self.handler = handler
+        self.resume = resume
+        self.worker_id = worker_id or f"worker-{uuid.uuid4().hex[:8]}"
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.partitions = set()
+        self.live = []
+        self.handled = 0
+        self.in_hand = set()  # ids of claimed events being handled
+        self._task = None
+        self._keepalive = None
+        self._stopping = False
+
+    def owns(self, connection_id: str) -> bool:
+        return partition_of(connection_id) in self.partitions
+
+    def _rebalance(self, now: float):
+        self.store.heartbeat(self.worker_id, now)
+        live = self.store.live_workers(now - self.lease_ttl)
+        if live == self.live:
+            return
+        self.live = live
+        partitions = HashRing(live).partitions_of(self.worker_id)
+        gained = partitions - self.partitions
+        self.partitions = partitions
+        if gained and self.resume:
+            for (conn_id, stage, data) in self.store.orphaned_workflows(
+                sorted(gained), live
+            ):
+                self.save(conn_id, stage, data)
+                asyncio.ensure_future(self._resume(conn_id, stage, data))
+
+    async def _resume(self, connection_id: str, stage: str, data: dict):
+        try:
+            await self.resume(connection_id, stage, data)
+        except Exception:
+            LOGGER.exception(f"Error resuming workflow {connection_id} at {stage}:")
+
+    async def start(self):
+        self._rebalance(time.time())
+        self._task = asyncio.ensure_future(self._run())
+        self._keepalive = asyncio.ensure_future(self._keep_alive())
+
+    async def stop(self, timeout: float = None):
+        """Finish the batch in hand, for up to `timeout` seconds, and leave
+        the group.
+
+        Events still in hand when the time runs out are cancelled; they stay
+        claimed and are delivered again. The remaining workers take over this
+        worker's partitions at once.
+        """
+        if self._task:
+            self._stopping = True
+            try:
+                await asyncio.wait_for(self._task, timeout)
+            except asyncio.TimeoutError:
+                LOGGER.warning(
+                    f"Worker {self.worker_id} stopped with"
+                    f" {len(self.in_hand)} events in hand"
+                )
+            self._task = None
+        if self._keepalive:
+            self._keepalive.cancel()
+            self._keepalive = None
+        self.store.remove_worker(self.worker_id)
+
+    async def _keep_alive(self):
+        """Heartbeat, and renew the claims in hand, while handlers run."""
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            now = time.time()
+            try:
+                self._rebalance(now)
+                self.store.renew_claims(sorted(self.in_hand), self.worker_id, now)
+            except Exception:
+                LOGGER.exception(f"Error renewing worker {self.worker_id}:")
+
+    async def dispatch(self, topic: str, payload: dict):
+        """Record an event, handling it here if this worker owns the connection."""
+        conn_id = payload["connection_id"]
+        partition = partition_of(conn_id)
+        now = time.time()
+        if partition in self.partitions:
+            event_id = self.store.put_event(
+                partition, conn_id, topic, payload, self.worker_id, now
+            )
+            self.in_hand.add(event_id)
+            try:
+                await self.handler(topic, payload)
+            finally:
+                self.in_hand.discard(event_id)
+            self.store.complete_events([event_id])
+            self.handled += 1
+        else:
+            self.store.put_event(partition, conn_id, topic, payload, None, now)
+
+    def save(self, connection_id: str, stage: str, data: dict = None):
+        """Record a workflow's current stage, for takeover by another worker."""
+        self.store.save_workflow(
+            connection_id,
+            partition_of(connection_id),
+            self.worker_id,
+            stage,
+            data or {},
+            time.time(),
+        )
+
+    def load(self, connection_id: str):
+        """(stage, data) last saved for a workflow, (None, {}) if none."""
+        return self.store.load_workflow(connection_id)
+
+    def finish(self, connection_id: str):
+        """Record that a workflow is done; it is never resumed."""
+        self.save(connection_id, DONE)
+
+    def is_done(self, connection_id: str) -> bool:
+        return self.load(connection_id)[0] == DONE
+
+    async def _handle_in_order(self, events, completed: list):
+        """Handle a connection's events in order, up to the first failure.
+
+        A failed event, and the connection's events after it, stay claimed
+        and are delivered again once their claim expires.
+        """
+        for (i, (event_id, conn_id, topic, payload)) in enumerate(events):
+            try:
+                await self.handler(topic, payload)
+            except Exception:
+                LOGGER.exception(f"Error handling {topic} for {conn_id}:")
+                for event in events[i:]:
+                    self.in_hand.discard(event[0])
+                return
+            self.in_hand.discard(event_id)
+            completed.append(event_id)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await self._run_batch()
+            except Exception:
+                LOGGER.exception(f"Error in worker {self.worker_id}:")
+                await asyncio.sleep(self.poll_interval)
+
+    async def _run_batch(self):
+        """Claim a batch of events and handle it."""
+        now = time.time()
+        events = self.store.claim_events(
+            sorted(self.partitions),
+            self.worker_id,
+            now - self.lease_ttl,
+            now,
+            self.batch_size,
+        )
+        if not events:
+            await asyncio.sleep(self.poll_interval)
+            return
+        self.in_hand.update(event[0] for event in events)
+        # connections run concurrently, each connection's events in order
+        by_connection = {}
+        for event in events:
+            by_connection.setdefault(event[1], []).append(event)
+        completed = []
+        try:
+            await asyncio.gather(
+                *(
+                    self._handle_in_order(e, completed)
+                    for e in by_connection.values()
+                )
+            )
+        finally:
+            self.store.complete_events(completed)
+            self.handled += len(completed)
+
+
+def _simulated_worker(path, worker_id, work_ms, lease_ttl, batch_size):
+    store = SqliteWorkflowStore(path)
+
+    async def handler(topic, payload):
+        # stands in for an admin API round trip (e.g. verify-presentation)
+        await asyncio.sleep(work_ms / 1000)
+
+    async def run():
+        group = WorkerGroup(
+            store,
+            handler,
+            worker_id=worker_id,
+            lease_ttl=lease_ttl,
+            batch_size=batch_size,
+        )
+        await group.start()
+        while True:
+            await asyncio.sleep(3600)
+
+    asyncio.new_event_loop().run_until_complete(run())
+
+
+def simulate(
+    workers: int, events: int, work_ms: float, batch_size: int, kill_one: bool
+) -> dict:
+    path = f"/tmp/workers-{os.getpid()}-{workers}.db"
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    lease_ttl = 1.0
+    store = SqliteWorkflowStore(path)
+    processes = [
+        multiprocessing.Process(
+            target=_simulated_worker,
+            args=(path, f"w{i}", work_ms, lease_ttl, batch_size),
+        )
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    # let the group form before events arrive
+    while len(store.live_workers(time.time() - lease_ttl)) < workers:
+        time.sleep(0.05)
+
+    start = time.perf_counter()
+    store.db.execute("BEGIN")
+    for i in range(events):
+        conn_id = f"conn-{i % (events // 4 or 1)}"
+        store.put_event(partition_of(conn_id), conn_id, "t", {"i": i}, None, None)
+    store.db.execute("COMMIT")
+    killed = False
+    while store.pending_events():
+        if kill_one and not killed and store.pending_events() < events // 2:
+            processes[0].kill()
+            killed = True
+        time.sleep(0.02)
+    elapsed = time.perf_counter() - start
+    for process in processes:
+        process.kill()
+    store.close()
+    return {
+        "workers": workers,
+        "events": events,
+        "killed_one": killed,
+        "seconds": round(elapsed, 3),
+        "events_per_second": round(events / elapsed),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measures event throughput for a group of simulated workers."
+    )
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--events", type=int, default=20_000)
+    parser.add_argument("--work-ms", type=float, default=5.0)
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=16,
+        help="Events a worker handles at once (its agent's capacity)",
+    )
+    parser.add_argument("--kill-one", action="store_true")
+    args = parser.parse_args()
+
+    for n in args.workers:
+        result = simulate(n, args.events, args.work_ms, args.batch_size, args.kill_one)
+        print(json.dumps(result))
+        sys.stdout.flush()